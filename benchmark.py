@@ -0,0 +1,325 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # 不打印pygame欢迎信息
+
+import argparse
+import contextlib
+import json
+import math
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import pymunk
+from simulation import BattleSimulation
+from game_objects import ChessPiece, ChessPieceType
+from shot_evaluator import create_battle, simulate_shot
+
+# 参考堡垒：每项为(棋子类型, 相对堡垒中心的水平偏移, 棋子中心离地面的高度)，按玩家1的朝向。
+# 中心离地面不足100像素的棋子按规则算作散落（BattleSimulation.destruction_ground_y），
+# 所以每个堡垒都有超过30%的棋子摆在高处
+REFERENCE_FORTRESSES = {
+    "wall": [
+        (ChessPieceType.MILITARY_CHESS, -26, 15), (ChessPieceType.MILITARY_CHESS, 26, 15),
+        (ChessPieceType.MILITARY_CHESS, -26, 45), (ChessPieceType.MILITARY_CHESS, 26, 45),
+        (ChessPieceType.MILITARY_CHESS, -26, 75), (ChessPieceType.MILITARY_CHESS, 26, 75),
+        (ChessPieceType.MILITARY_CHESS, -26, 105), (ChessPieceType.MILITARY_CHESS, 26, 105),
+        (ChessPieceType.CHINESE_CHESS, 0, 140),
+    ],
+    "tower": [
+        (ChessPieceType.MILITARY_CHESS, 0, 15), (ChessPieceType.MILITARY_CHESS, 0, 45),
+        (ChessPieceType.MILITARY_CHESS, 0, 75), (ChessPieceType.MILITARY_CHESS, 0, 105),
+        (ChessPieceType.MILITARY_CHESS, 0, 135), (ChessPieceType.CHINESE_CHESS, 0, 170),
+    ],
+    "bastion": [
+        (ChessPieceType.MILITARY_CHESS, -26, 15), (ChessPieceType.MILITARY_CHESS, 26, 15),
+        (ChessPieceType.MILITARY_CHESS, -26, 45), (ChessPieceType.MILITARY_CHESS, 26, 45),
+        (ChessPieceType.MILITARY_CHESS, 0, 75), (ChessPieceType.MILITARY_CHESS, 0, 105),
+        (ChessPieceType.CHINESE_CHESS, 0, 140), (ChessPieceType.GO_CHESS, 0, 180),
+    ],
+}
+
+# 参考对局：(玩家1的堡垒, 玩家2的堡垒)
+REFERENCE_BATTLES = [("wall", "tower"), ("tower", "bastion"), ("bastion", "wall")]
+
+# 固定的射击列表：(发射点(x, y), 方向向量(dx, dy), 力度)，按玩家1向右射击，玩家2射击时左右镜像
+REFERENCE_SHOTS = [
+    ((380, 500), (1, 0), 1500),
+    ((350, 420), (1, 0.3), 2000),
+    ((300, 300), (1, 0.6), 2000),
+    ((400, 520), (1, -0.1), 1800),
+]
+
+FORTRESS_OFFSET_X = 200  # 堡垒中心到场地边缘的距离
+
+def build_arena(piece_count, large_fortress=False, seed=0):
+    """创建一个摆满棋子的场地，用于性能测试
+
+    双方各占一半棋子，在各自半场从地面开始逐层摆放，每方第一个棋子是象棋，
+    其余随机为军棋或围棋。场地大小随棋子数量增大，保证所有棋子都能放下
+
+    Args:
+        piece_count: 双方棋子总数
+        large_fortress: 是否启用大型堡垒模式
+        seed: 随机种子，相同的种子得到相同的场地
+
+    Returns:
+        BattleSimulation: 摆好棋子的模拟器
+    """
+    spacing_x = ChessPiece.RADIUS * 2.5 + 4
+    spacing_y = ChessPiece.RADIUS * 2 + 4
+    per_side = math.ceil(piece_count / 2)
+    columns = max(4, math.ceil(math.sqrt(per_side * 2)))  # 每层的棋子数
+    rows = math.ceil(per_side / columns)
+    half_width = columns * spacing_x + 100
+    width = max(800, int(2 * half_width))
+    height = max(600, int(rows * spacing_y + 200))
+
+    rng = random.Random(seed)
+    # 创建模型和添加棋子时ChessModel会打印调试信息，这里丢弃，结果输出到标准输出时仍是合法的JSON
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        simulation = BattleSimulation(width, height, verbose=False,
+                                      large_fortress=large_fortress, expected_pieces=piece_count)
+        sides = ((simulation.player1_model, 60, per_side),
+                 (simulation.player2_model, width / 2 + 60, piece_count - per_side))
+        for model, x0, count in sides:
+            for i in range(count):
+                row, column = divmod(i, columns)
+                x = x0 + column * spacing_x + spacing_x / 2
+                y = simulation.ground_y - spacing_y / 2 - row * spacing_y
+                if i == 0:
+                    chess_type = ChessPieceType.CHINESE_CHESS
+                else:
+                    chess_type = rng.choice((ChessPieceType.MILITARY_CHESS,
+                                             ChessPieceType.GO_CHESS))
+                model.add_piece(ChessPiece(x, y, simulation.space, chess_type,
+                                           player_id=model.player_id))
+    return simulation
+
+def measure_steps(simulation, steps):
+    """执行指定的物理步数（包括每步的规则检查），返回每秒步数"""
+    start = time.perf_counter()
+    simulation.step(steps)
+    elapsed = time.perf_counter() - start
+    return steps / elapsed if elapsed > 0 else float("inf")
+
+def run_scaling(counts, steps, modes, seed=0):
+    """在不同棋子数量下测量物理模拟速度
+
+    场地刚摆好时棋子仍在下落、互相挤压，测量的是堡垒尚未休眠时的开销
+
+    Args:
+        counts: 要测试的棋子总数列表
+        steps: 每种配置执行的物理步数
+        modes: 要测试的模式列表，"default"为默认包围盒树，"large"为大型堡垒模式
+        seed: 随机种子
+
+    Returns:
+        list: 每种配置的结果字典
+    """
+    results = []
+    for count in counts:
+        for mode in modes:
+            setup_start = time.perf_counter()
+            simulation = build_arena(count, large_fortress=(mode == "large"), seed=seed)
+            setup_time = time.perf_counter() - setup_start
+            steps_per_sec = measure_steps(simulation, steps)
+            result = {
+                "pieces": count,
+                "mode": mode,
+                "steps": steps,
+                "steps_per_sec": round(steps_per_sec, 1),
+                "ms_per_step": round(1000 / steps_per_sec, 3),
+                "setup_sec": round(setup_time, 3),
+            }
+            results.append(result)
+            print(f"{count:>6} 个棋子  {mode:<8} {result['steps_per_sec']:>10.1f} 步/秒  "
+                  f"{result['ms_per_step']:>9.3f} 毫秒/步", file=sys.stderr)
+    return results
+
+def build_reference_fortresses(directory, screen_width=800, screen_height=600):
+    """用ChessModel.save把参考堡垒写成双方的模型文件
+
+    玩家2的堡垒是玩家1的左右镜像，放在场地右侧
+
+    Args:
+        directory: 模型文件所在的目录
+        screen_width, screen_height: 场地大小，与对局使用的模拟器一致
+
+    Returns:
+        dict: (堡垒名, 玩家) -> 模型文件名（不含.model后缀）
+    """
+    filenames = {}
+    # 保存时ChessModel会打印调试信息，这里丢弃
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, layout in REFERENCE_FORTRESSES.items():
+            simulation = BattleSimulation(screen_width, screen_height, verbose=False)
+            sides = ((simulation.player1_model, FORTRESS_OFFSET_X, 1),
+                     (simulation.player2_model, screen_width - FORTRESS_OFFSET_X, -1))
+            for model, center_x, mirror in sides:
+                for chess_type, dx, height in layout:
+                    model.add_piece(ChessPiece(center_x + mirror * dx, simulation.ground_y - height,
+                                               simulation.space, chess_type,
+                                               player_id=model.player_id))
+                filename = os.path.join(directory, f"{name}_player{model.player_id}")
+                if not model.save(filename):
+                    raise IOError(f"无法写入参考堡垒 {filename}.model")
+                filenames[(name, model.player_id)] = filename
+    return filenames
+
+def mirror_shot(shot, screen_width=800):
+    """把按玩家1朝向定义的射击左右镜像，给玩家2使用"""
+    (x, y), (dx, dy), strength = shot
+    return (screen_width - x, y), (-dx, dy), strength
+
+def play_battle(simulation, shots, max_shots, max_steps):
+    """双方轮流按射击列表发射，直到规则判出胜负或射击次数用完
+
+    Args:
+        simulation: 已加载双方堡垒的模拟器（见create_battle）
+        shots: 射击列表，玩家2的射击左右镜像
+        max_shots: 最多发射的次数（双方合计）
+        max_steps: 单发模拟的最大物理步数
+
+    Returns:
+        list: 每发的结果
+    """
+    results = []
+    for i in range(max_shots):
+        if simulation.game_over:
+            break
+        shooter = simulation.active_player
+        shot = shots[(i // 2) % len(shots)]
+        if shooter == 2:
+            shot = mirror_shot(shot, simulation.screen_width)
+        results.append(simulate_shot(simulation, shot, shooter, max_steps))
+    return results
+
+def measure_step_memory(files, max_shots, max_steps):
+    """在tracemalloc下重跑一局，测量对局过程中的内存
+
+    模型加载完成后才开始比较，比较对局前后仍存活的内存块，不包含模拟器和棋子本身。
+    Python不提供分配次数的计数，步内创建又释放的临时对象不计入
+
+    Args:
+        files: 双方堡垒的模型文件
+        max_shots: 最多发射的次数（双方合计）
+        max_steps: 单发模拟的最大物理步数
+
+    Returns:
+        dict: 内存峰值（含加载模型）和对局过程中每步留存的内存块数
+    """
+    # 快照本身由tracemalloc模块创建，比较时排除
+    exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    try:
+        simulation = create_battle(*files)
+        before = tracemalloc.take_snapshot().filter_traces(exclude)
+        play_battle(simulation, REFERENCE_SHOTS, max_shots, max_steps)
+        after = tracemalloc.take_snapshot().filter_traces(exclude)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return {
+        "peak_memory_kb": round(peak / 1024, 1),
+        "retained_blocks_per_step": round(retained / max(1, simulation.step_count), 3),
+    }
+
+def run_battles(fortress_dir=None, max_shots=8, max_steps=6000, measure_memory=True):
+    """按固定射击列表跑完所有参考对局，测量模拟速度和内存
+
+    每局先不开内存跟踪跑一次测量速度（不含加载模型），再在tracemalloc下重跑一次测量内存，
+    避免跟踪的开销影响计时。物理模拟是确定性的，两次的步数相同
+
+    Args:
+        fortress_dir: 参考堡垒模型文件的目录，默认使用临时目录
+        max_shots: 每局最多发射的次数（双方合计）
+        max_steps: 单发模拟的最大物理步数
+        measure_memory: 是否测量内存峰值和每步留存的内存块
+
+    Returns:
+        list: 每局的结果字典
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = fortress_dir or temp_dir
+        os.makedirs(directory, exist_ok=True)
+        filenames = build_reference_fortresses(directory)
+
+        results = []
+        for player1_name, player2_name in REFERENCE_BATTLES:
+            files = (filenames[(player1_name, 1)], filenames[(player2_name, 2)])
+            # 加载模型和规则判断时会打印调试信息，这里丢弃
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                simulation = create_battle(*files)
+                start = time.perf_counter()
+                shots = play_battle(simulation, REFERENCE_SHOTS, max_shots, max_steps)
+                wall_time = time.perf_counter() - start
+                memory = measure_step_memory(files, max_shots, max_steps) if measure_memory else {}
+
+            sim_seconds = simulation.step_count * simulation.STEP_DT
+            result = {
+                "battle": f"{player1_name}_vs_{player2_name}",
+                "shots": len(shots),
+                "winner": simulation.winner,
+                "steps": simulation.step_count,
+                "sim_seconds": round(sim_seconds, 3),
+                "wall_seconds": round(wall_time, 3),
+                "sim_seconds_per_wall_second": (round(sim_seconds / wall_time, 2)
+                                                if wall_time > 0 else None),
+                "steps_per_sec": (round(simulation.step_count / wall_time, 1)
+                                  if wall_time > 0 else None),
+            }
+            result.update(memory)
+            results.append(result)
+            print(f"{result['battle']:<20} {result['shots']:>2} 发  胜者 {result['winner']}  "
+                  f"{result['steps']:>6} 步  {result['steps_per_sec']:>9.1f} 步/秒  "
+                  f"{result['sim_seconds_per_wall_second']:>7.2f} 倍速", file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="棋子堡垒物理模拟性能测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scaling = subparsers.add_parser("scaling", help="测量不同棋子数量下的每秒物理步数")
+    scaling.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 5000],
+                         help="双方棋子总数")
+    scaling.add_argument("--steps", type=int, default=120, help="每种配置执行的物理步数")
+    scaling.add_argument("--mode", choices=("default", "large", "both"), default="both",
+                         help="default为默认设置，large为大型堡垒模式")
+    scaling.add_argument("--seed", type=int, default=0, help="随机种子")
+    scaling.add_argument("--output", default=None, help="结果JSON文件，默认输出到标准输出")
+
+    battles = subparsers.add_parser("battles", help="用参考堡垒和固定射击列表跑完整对局")
+    battles.add_argument("--shots", type=int, default=8, help="每局最多发射的次数（双方合计）")
+    battles.add_argument("--max-steps", type=int, default=6000, help="单发模拟的最大物理步数")
+    battles.add_argument("--fortress-dir", default=None, help="保存参考堡垒模型文件的目录，默认使用临时目录")
+    battles.add_argument("--no-memory", action="store_true", help="不测量内存（省去tracemalloc下的重跑）")
+    battles.add_argument("--output", default="battle_benchmark.json", help="结果JSON文件")
+    args = parser.parse_args()
+
+    if args.command == "scaling":
+        modes = ["default", "large"] if args.mode == "both" else [args.mode]
+        results = run_scaling(args.counts, args.steps, modes, args.seed)
+    elif args.command == "battles":
+        # 记录运行环境，方便比较不同版本的结果
+        results = {
+            "python": platform.python_version(),
+            "pymunk": pymunk.version,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "battles": run_battles(args.fortress_dir, args.shots, args.max_steps,
+                                   measure_memory=not args.no_memory),
+        }
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# 没有接触时返回的空集合
+_NO_NEIGHBORS = frozenset()
+
+# 棋子接触图
+class ContactGraph:
+    """棋子之间的接触图
+
+    以物理形状为节点，两个形状开始接触时加一条边，分开时删除这条边。
+    由物理空间的begin/separate碰撞回调维护，查询某个形状接触了哪些形状只需要一次字典查找，
+    不需要对物理空间做形状查询。休眠的物体保持原有的接触，移出空间的形状会触发separate
+    """
+    def __init__(self):
+        self.adjacency = {}  # shape -> 与之接触的形状集合
+        self.contact_count = 0
+
+    def add_contact(self, shape_a, shape_b):
+        """记录两个形状开始接触
+
+        Args:
+            shape_a, shape_b: 接触的两个pymunk形状
+
+        Returns:
+            None
+        """
+        neighbors = self.adjacency.setdefault(shape_a, set())
+        if shape_b in neighbors:
+            return
+        neighbors.add(shape_b)
+        self.adjacency.setdefault(shape_b, set()).add(shape_a)
+        self.contact_count += 1
+
+    def remove_contact(self, shape_a, shape_b):
+        """记录两个形状分开（没有记录过的接触忽略）
+
+        Args:
+            shape_a, shape_b: 分开的两个pymunk形状
+
+        Returns:
+            None
+        """
+        neighbors = self.adjacency.get(shape_a)
+        if neighbors is None or shape_b not in neighbors:
+            return
+        self._discard(shape_a, shape_b)
+        self._discard(shape_b, shape_a)
+        self.contact_count -= 1
+
+    def _discard(self, shape, other):
+        """从shape的邻接集合中删除other，集合为空时删除该节点"""
+        neighbors = self.adjacency[shape]
+        neighbors.discard(other)
+        if not neighbors:
+            del self.adjacency[shape]
+
+    def neighbors(self, shape):
+        """返回与形状接触的所有形状（只读集合，不要修改）"""
+        return self.adjacency.get(shape, _NO_NEIGHBORS)
+
+    def are_touching(self, shape_a, shape_b):
+        """两个形状当前是否接触"""
+        return shape_b in self.adjacency.get(shape_a, _NO_NEIGHBORS)
+
+    def copy(self):
+        """返回当前所有接触的副本，传给restore恢复"""
+        return {shape: set(neighbors) for shape, neighbors in self.adjacency.items()}
+
+    def restore(self, adjacency):
+        """用copy返回的副本替换当前的接触"""
+        self.adjacency = {shape: set(neighbors) for shape, neighbors in adjacency.items()}
+        self.contact_count = sum(len(neighbors) for neighbors in adjacency.values()) // 2
+
+    def clear(self):
+        """清除所有接触"""
+        self.adjacency.clear()
+        self.contact_count = 0
+
+    def __len__(self):
+        return self.contact_count
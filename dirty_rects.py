@@ -0,0 +1,88 @@
+import pygame
+
+# 脏矩形绘制
+class DirtyRectTracker:
+    """只把与上一帧不同的屏幕区域推送到显示器，代替每帧的pygame.display.flip()
+
+    每帧照常在屏幕表面上完整绘制，绘制时把每个元素以(区域, 内容)登记下来。与上一帧的登记
+    比较，新出现的和消失的元素所在区域就是需要更新的区域，用pygame.display.update(rects)推送。
+    内容相同的元素（例如TextCache返回的同一张文字图像、角度不变的棋子图像）不产生更新区域，
+    棋子静止、鼠标不动时一帧不推送任何像素。更新区域过多或面积过大时退回整屏更新。
+    只减少推送到显示器的像素：每帧仍然清屏并重新绘制所有元素，绘制本身的开销不变
+    """
+    MAX_RECTS = 48            # 更新区域超过该数量时合并为一个矩形
+    FULL_UPDATE_RATIO = 0.6   # 更新面积超过屏幕面积的该比例时直接整屏更新
+    MARGIN = 2                # 每个区域向外扩展的像素，覆盖抗锯齿的边缘
+
+    def __init__(self, size):
+        """
+        Args:
+            size: 屏幕大小(宽, 高)
+        """
+        self.screen_rect = pygame.Rect((0, 0), size)
+        self.items = set()           # 本帧登记的(区域, 内容)
+        self.previous_items = set()  # 上一帧登记的(区域, 内容)
+        self.full_update = True      # 下一次推送整屏（第一帧以及调用invalidate之后）
+        # 统计：整屏更新、部分更新和没有推送的帧数，以及部分更新推送的像素数
+        self.full_frames = 0
+        self.partial_frames = 0
+        self.idle_frames = 0
+        self.pushed_pixels = 0
+
+    def invalidate(self):
+        """下一帧整屏更新（例如绘制了没有登记的内容）"""
+        self.full_update = True
+
+    def add(self, rect, content):
+        """登记本帧绘制的一个元素
+
+        Args:
+            rect: 元素在屏幕上的区域，pygame绘制函数和blit的返回值
+            content: 可哈希的内容标识，区域和内容都与上一帧相同时认为没有变化
+        """
+        if rect is not None:
+            self.items.add((tuple(rect), content))
+
+    def collect(self):
+        """比较本帧和上一帧的登记，返回需要更新的区域
+
+        Returns:
+            list: pygame.Rect列表，为空时不需要推送；需要整屏更新时返回None
+        """
+        changed = self.items ^ self.previous_items
+        self.previous_items = self.items
+        self.items = set()
+        if self.full_update:
+            self.full_update = False
+            return None
+
+        margin = self.MARGIN * 2
+        rects = []
+        for rect, _ in changed:
+            rect = pygame.Rect(rect).inflate(margin, margin).clip(self.screen_rect)
+            if rect.width > 0 and rect.height > 0:
+                rects.append(rect)
+        if len(rects) > self.MAX_RECTS:
+            rects = [rects[0].unionall(rects[1:])]
+        area = sum(rect.width * rect.height for rect in rects)
+        if area > self.FULL_UPDATE_RATIO * self.screen_rect.width * self.screen_rect.height:
+            return None
+        return rects
+
+    def present(self):
+        """把本帧的变化推送到显示器，代替pygame.display.flip()
+
+        Returns:
+            list: 推送的区域，整屏更新时返回None
+        """
+        rects = self.collect()
+        if rects is None:
+            self.full_frames += 1
+            pygame.display.flip()
+        elif rects:
+            self.partial_frames += 1
+            self.pushed_pixels += sum(rect.width * rect.height for rect in rects)
+            pygame.display.update(rects)
+        else:
+            self.idle_frames += 1
+        return rects
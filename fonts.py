@@ -0,0 +1,60 @@
+import os
+import time
+import pygame
+
+# 随项目提供的中文字体，优先使用，不需要扫描系统字体
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "fonts")
+BUNDLED_FONTS = ("NotoSansSC-Regular.ttf", "NotoSansSC-Regular.otf")
+SYSTEM_FONT = "arialunicode"  # 没有可用的内置字体时使用的系统字体（需要扫描系统字体，较慢）
+TEST_TEXT = "棋"              # 检查字体文件是否有效
+
+_fonts = {}  # 字号 -> pygame字体，第一次加载后复用
+
+def _try_font(path, size):
+    """加载字体文件并试着渲染一个中文字符，文件无效（例如下载失败得到的网页）时返回None"""
+    try:
+        font = pygame.font.Font(path, size)
+        font.render(TEST_TEXT, True, (0, 0, 0))
+        return font
+    except Exception:
+        return None
+
+def _load_font(size):
+    """依次尝试内置字体、系统字体和pygame默认字体
+
+    Returns:
+        tuple: (字体, 来源说明)
+    """
+    for name in BUNDLED_FONTS:
+        path = os.path.join(FONT_DIR, name)
+        if os.path.exists(path):
+            font = _try_font(path, size)
+            if font is not None:
+                return font, path
+    # match_font找不到时返回None，不像SysFont那样直接换成默认字体
+    path = pygame.font.match_font(SYSTEM_FONT)
+    if path:
+        font = _try_font(path, size)
+        if font is not None:
+            return font, f"系统字体 {path}"
+    # 与SysFont找不到字体时相同，使用pygame默认字体，没有中文字形，中文显示为方框
+    return pygame.font.Font(None, size), "pygame默认字体（不支持中文）"
+
+def get_font(size):
+    """返回指定字号的界面字体，第一次使用时才加载
+
+    Args:
+        size: 字号
+
+    Returns:
+        pygame.font.Font: 字体
+    """
+    font = _fonts.get(size)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        start = time.perf_counter()
+        font, source = _load_font(size)
+        _fonts[size] = font
+        print(f"加载{size}号字体: {source}，耗时 {(time.perf_counter() - start) * 1000:.1f} 毫秒")
+    return font
@@ -0,0 +1,65 @@
+import time
+import pygame
+
+# 帧调度
+class FrameScheduler:
+    """决定两帧之间等待多久：画面有变化时按active_fps运行，连续空闲idle_delay秒后降到idle_fps
+
+    空闲时用pygame.event.wait等待，收到点击、按键等输入立即唤醒，不增加操作延迟，等待期间
+    收到的事件由下一次events()返回。物理模拟按GameManager.update中的固定步长推进，与绘制帧率无关
+    """
+    ACTIVE_FPS = 60    # 有变化时的帧率
+    IDLE_FPS = 5       # 空闲时的帧率
+    IDLE_DELAY = 1.0   # 连续空闲多少秒后降低帧率
+
+    def __init__(self, active_fps=ACTIVE_FPS, idle_fps=IDLE_FPS, idle_delay=IDLE_DELAY):
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.idle_delay = idle_delay
+        self.clock = pygame.time.Clock()
+        self.pending = []              # 空闲等待时收到的事件
+        self.last_tick = time.perf_counter()
+        self.last_active = self.last_tick
+        self.idle = False              # 当前是否按空闲帧率运行
+
+    def events(self):
+        """返回本帧要处理的事件，代替pygame.event.get()"""
+        events = self.pending + pygame.event.get()
+        self.pending = []
+        return events
+
+    def tick(self, idle):
+        """等待到下一帧
+
+        Args:
+            idle: 本帧画面是否没有需要连续绘制的变化（GameManager.is_idle）
+
+        Returns:
+            float: 距上一次tick经过的实际时间（秒）
+        """
+        now = time.perf_counter()
+        if not idle:
+            self.last_active = now
+        self.idle = idle and now - self.last_active >= self.idle_delay
+
+        if self.idle:
+            deadline = self.last_tick + 1.0 / self.idle_fps
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                # 收到输入时提前返回，事件留到下一帧处理
+                event = pygame.event.wait(max(1, int(remaining * 1000)))
+                if event.type == pygame.NOEVENT:
+                    break
+                self.pending.append(event)
+                # 空闲时鼠标移动不改变画面，继续等待；点击、按键等立即唤醒
+                if event.type != pygame.MOUSEMOTION:
+                    break
+        else:
+            self.clock.tick(self.active_fps)
+
+        now = time.perf_counter()
+        elapsed = now - self.last_tick
+        self.last_tick = now
+        return elapsed
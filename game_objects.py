@@ -2,9 +2,31 @@ import pygame
 import pymunk
 import pymunk.pygame_util
 from enum import Enum
-import pickle
 import os
 import math
+import model_format
+from render_cache import SpriteCache
+
+def interpolate_transform(body, previous_position, previous_angle, alpha):
+    """在上一个物理步和当前物理步之间插值物体的位置和角度
+    
+    Args:
+        body: pymunk物体，提供当前位置和角度
+        previous_position: 上一个物理步的位置，为None时直接使用当前位置
+        previous_angle: 上一个物理步的角度
+        alpha: 插值系数，0表示上一步，1表示当前步
+        
+    Returns:
+        tuple: (x, y, angle)
+    """
+    x, y = body.position
+    angle = body.angle
+    if previous_position is None or alpha >= 1.0:
+        return x, y, angle
+    px, py = previous_position
+    return (px + (x - px) * alpha,
+            py + (y - py) * alpha,
+            previous_angle + (angle - previous_angle) * alpha)
 
 # 定义棋子类型
 class ChessPieceType(Enum):
@@ -14,7 +36,19 @@ class ChessPieceType(Enum):
 
 # 棋子基类
 class ChessPiece:
-    def __init__(self, x, y, space, chess_type, radius=20, mass=20.0, player_id=1):
+    # 默认的棋子半径，军棋的长边为2.5倍半径
+    RADIUS = 20
+    # 棋子类型的填充颜色和玩家的描边颜色
+    COLORS = {
+        ChessPieceType.MILITARY_CHESS: (255, 0, 0),
+        ChessPieceType.CHINESE_CHESS: (0, 255, 0),
+        ChessPieceType.GO_CHESS: (0, 0, 255),
+    }
+    PLAYER_OUTLINE_COLORS = {1: (40, 40, 40), 2: (200, 150, 0)}
+    # 所有棋子共用的旋转图像缓存
+    sprite_cache = SpriteCache()
+    
+    def __init__(self, x, y, space, chess_type, radius=RADIUS, mass=20.0, player_id=1):
         self.chess_type = chess_type
         self.player_id = player_id  # 记录棋子属于哪个玩家
         self.position = (x, y)  # 保存初始位置
@@ -43,11 +77,7 @@ class ChessPiece:
         elif chess_type == ChessPieceType.GO_CHESS:
             # 围棋（三角形）
             # 为三角形计算惯性矩
-            triangle_vertices = [
-                (-radius*1.2, radius),  # 左下角更宽
-                (radius*1.2, radius),   # 右下角更宽
-                (0, -radius)            # 顶点不变
-            ]
+            triangle_vertices = ChessPiece.outline_vertices(chess_type, radius)
             moment = pymunk.moment_for_poly(mass, triangle_vertices, (0, 0))
             self.body = pymunk.Body(mass, moment)
             self.body.position = (x, y)
@@ -75,72 +105,93 @@ class ChessPiece:
         # 确保棋子是动态的，能够受重力影响
         self.body.body_type = pymunk.Body.DYNAMIC
         
+        # 上一个物理步的位置和角度，用于插值绘制
+        self.previous_position = None
+        self.previous_angle = 0
+        # 最近一次绘制使用的缓存图像
+        self.sprite = None
+        
         # 添加到物理空间
         space.add(self.body, self.shape)
     
+    def save_transform(self):
+        """记录当前的位置和角度，作为插值绘制的起点"""
+        self.previous_position = self.body.position
+        self.previous_angle = self.body.angle
+    
+    @staticmethod
+    def outline_vertices(chess_type, radius=RADIUS):
+        """返回未旋转时相对物体原点的多边形顶点，与物理形状一致"""
+        if chess_type == ChessPieceType.MILITARY_CHESS:
+            # 军棋（长方形）
+            half_width, half_height = radius*1.25, radius*0.75
+        elif chess_type == ChessPieceType.CHINESE_CHESS:
+            # 象棋（方形）
+            half_width = half_height = radius
+        else:
+            # 围棋（三角形）- 底部更宽
+            return [
+                (-radius*1.2, radius),  # 左下角更宽
+                (radius*1.2, radius),   # 右下角更宽
+                (0, -radius)            # 顶点不变
+            ]
+        return [(-half_width, -half_height), (half_width, -half_height),
+                (half_width, half_height), (-half_width, half_height)]
+    
+    def draw_sprite(self, screen, x, y, angle):
+        """从缓存中取出旋转后的图像，中心对准(x, y)绘制，返回绘制的区域"""
+        self.sprite = ChessPiece.sprite_cache.get(
+            (self.chess_type, self.player_id, self.radius), angle,
+            ChessPiece.outline_vertices(self.chess_type, self.radius),
+            ChessPiece.COLORS[self.chess_type],
+            ChessPiece.PLAYER_OUTLINE_COLORS.get(self.player_id))
+        return SpriteCache.blit(screen, self.sprite, x, y)
+    
     @staticmethod
     def draw_at_body_position(screen, piece, chess_type):
-        """静态方法，在指定位置绘制棋子"""
+        """静态方法，在物体当前的位置和角度绘制棋子（拖动中的棋子使用），返回绘制的区域"""
         try:
             if piece and hasattr(piece, 'body'):
                 # 检查位置是否有效（防止NaN值）
-                if (math.isnan(piece.body.position.x) or math.isnan(piece.body.position.y)):
+                x, y = piece.body.position
+                if math.isnan(x) or math.isnan(y):
                     print(f"警告：检测到无效的棋子位置: {piece.body.position}")
                     return
-                    
-                x, y = int(piece.body.position.x), int(piece.body.position.y)
-                radius = getattr(piece, 'radius', 20)
-                
-                if chess_type == ChessPieceType.MILITARY_CHESS:
-                    # 军棋（长方形）
-                    pygame.draw.rect(screen, (255, 0, 0), 
-                                   (x - radius*1.25, y - radius*0.75, radius*2.5, radius*1.5))
-                elif chess_type == ChessPieceType.CHINESE_CHESS:
-                    # 象棋（方形）
-                    pygame.draw.rect(screen, (0, 255, 0), 
-                                   (x - radius, y - radius, radius*2, radius*2))
-                elif chess_type == ChessPieceType.GO_CHESS:
-                    # 围棋（三角形）- 使用更宽的底部
-                    points = [
-                        (x, y - radius),
-                        (x - radius*1.2, y + radius),
-                        (x + radius*1.2, y + radius)
-                    ]
-                    pygame.draw.polygon(screen, (0, 0, 255), points)
+                return piece.draw_sprite(screen, x, y, piece.body.angle)
         except Exception as e:
             print(f"静态绘制棋子时出错: {e}")
+        return None
     
-    def draw(self, screen):
-        """绘制棋子到屏幕上"""
+    def draw(self, screen, draw_options=None, alpha=1.0, transform=None):
+        """绘制棋子到屏幕上
+        
+        Args:
+            screen: Pygame屏幕对象，用于绘制
+            draw_options: 保留参数，与Projectile.draw保持一致
+            alpha: 插值系数，在上一个物理步和当前物理步之间插值绘制位置
+            transform: 可选的(x, y, 角度)，指定时在该位置绘制，不使用物体当前的位置（快速回放时使用）
+            
+        Returns:
+            pygame.Rect: 绘制的区域，没有绘制时为None
+        """
         try:
             if hasattr(self, 'body') and hasattr(self.body, 'position'):
                 # 检查位置是否有效（防止NaN值）
                 if (math.isnan(self.body.position.x) or math.isnan(self.body.position.y)):
                     print(f"警告：检测到无效的棋子位置: {self.body.position}")
-                    return
+                    return None
                 
-                x, y = int(self.body.position.x), int(self.body.position.y)
+                if transform is not None:
+                    render_x, render_y, angle = transform
+                else:
+                    render_x, render_y, angle = interpolate_transform(
+                        self.body, self.previous_position, self.previous_angle, alpha)
                 
-                if self.chess_type == ChessPieceType.MILITARY_CHESS:
-                    # 军棋（长方形）
-                    pygame.draw.rect(screen, (255, 0, 0), 
-                                   (x - self.radius*1.25, y - self.radius*0.75, 
-                                    self.radius*2.5, self.radius*1.5))
-                elif self.chess_type == ChessPieceType.CHINESE_CHESS:
-                    # 象棋（方形）
-                    pygame.draw.rect(screen, (0, 255, 0), 
-                                   (x - self.radius, y - self.radius, 
-                                    self.radius*2, self.radius*2))
-                elif self.chess_type == ChessPieceType.GO_CHESS:
-                    # 围棋（三角形）- 使用更宽的底部
-                    points = [
-                        (x, y - self.radius),
-                        (x - self.radius*1.2, y + self.radius),
-                        (x + self.radius*1.2, y + self.radius)
-                    ]
-                    pygame.draw.polygon(screen, (0, 0, 255), points)
+                # 按物体的角度绘制缓存中旋转好的图像
+                return self.draw_sprite(screen, render_x, render_y, angle)
         except Exception as e:
             print(f"绘制棋子时出错: {e}")
+        return None
 
 # 弹射物（铅笔）
 class Projectile:
@@ -174,9 +225,20 @@ class Projectile:
         self.pencil_color = (255, 215, 0)  # 金黄色铅笔
         self.tip_color = (50, 50, 50)      # 深灰色笔尖
         
+        # 上一个物理步的位置和角度，用于插值绘制
+        self.previous_position = None
+        self.previous_angle = 0
+        # 最近一次绘制的位置和角度
+        self.drawn_transform = None
+        
         # 添加到物理空间
         space.add(self.body, self.shape)
     
+    def save_transform(self):
+        """记录当前的位置和角度，作为插值绘制的起点"""
+        self.previous_position = self.body.position
+        self.previous_angle = self.body.angle
+    
     def apply_impulse(self, direction, strength):
         """施加冲量以发射弹射物"""
         try:
@@ -236,18 +298,33 @@ class Projectile:
         except Exception as e:
             print(f"施加冲量时出错: {e}")
         
-    def draw(self, screen, draw_options=None):
-        """绘制铅笔形状的弹射物"""
+    def draw(self, screen, draw_options=None, alpha=1.0, transform=None):
+        """绘制铅笔形状的弹射物
+        
+        Args:
+            screen: Pygame屏幕对象，用于绘制
+            draw_options: 保留参数
+            alpha: 插值系数，在上一个物理步和当前物理步之间插值绘制位置和角度
+            transform: 可选的(x, y, 角度)，指定时在该位置绘制，不使用物体当前的位置（快速回放时使用）
+            
+        Returns:
+            pygame.Rect: 绘制的区域，没有绘制时为None
+        """
         try:
             if hasattr(self, 'body') and hasattr(self.body, 'position'):
                 # 检查位置是否有效
                 if math.isnan(self.body.position.x) or math.isnan(self.body.position.y):
                     print("警告：检测到无效的弹射物位置")
-                    return
+                    return None
                     
-                # 获取铅笔的位置和角度
-                x, y = int(self.body.position.x), int(self.body.position.y)
-                angle = self.body.angle
+                # 获取铅笔插值后的位置和角度
+                if transform is not None:
+                    render_x, render_y, angle = transform
+                else:
+                    render_x, render_y, angle = interpolate_transform(
+                        self.body, self.previous_position, self.previous_angle, alpha)
+                x, y = int(render_x), int(render_y)
+                self.drawn_transform = (x, y, angle)
                 
                 # 计算铅笔的四个角点
                 half_length = self.length / 2
@@ -271,7 +348,7 @@ class Projectile:
                     rotated_points.append((x + rx, y + ry))
                 
                 # 绘制铅笔主体
-                pygame.draw.polygon(screen, self.pencil_color, rotated_points)
+                rect = pygame.draw.polygon(screen, self.pencil_color, rotated_points)
                 
                 # 绘制笔尖（三角形）
                 tip_length = half_length * 0.3
@@ -291,15 +368,66 @@ class Projectile:
                     rotated_tip_points.append((x + rx, y + ry))
                 
                 # 绘制笔尖
-                pygame.draw.polygon(screen, self.tip_color, rotated_tip_points)
+                return rect.union(pygame.draw.polygon(screen, self.tip_color, rotated_tip_points))
         except Exception as e:
             print(f"绘制弹射物时出错: {e}")
+        return None
+
+# 形状到棋子的索引
+class PieceRegistry:
+    """以物理形状为键的棋子索引
+
+    碰撞回调中只能拿到arbiter.shapes，通过该索引可以在常数时间内找到形状所属的棋子和玩家，
+    不需要遍历双方模型的棋子列表。由ChessModel在添加、移除棋子时维护
+    """
+    def __init__(self):
+        self.entries = {}  # shape -> (piece, player_id)
+
+    def register(self, piece, player_id):
+        """登记棋子当前的形状
+
+        Args:
+            piece: 要登记的棋子，使用piece.shape作为键
+            player_id: 棋子所属的玩家
+
+        Returns:
+            None
+        """
+        if hasattr(piece, 'shape'):
+            self.entries[piece.shape] = (piece, player_id)
+
+    def unregister(self, piece):
+        """移除棋子当前形状的登记（形状未登记时忽略）"""
+        if hasattr(piece, 'shape'):
+            self.entries.pop(piece.shape, None)
+
+    def clear(self):
+        """移除所有登记"""
+        self.entries.clear()
+
+    def lookup(self, shape):
+        """查找形状所属的棋子
+
+        Args:
+            shape: pymunk形状，通常来自arbiter.shapes
+
+        Returns:
+            tuple: (棋子, 玩家ID)，形状未登记时返回(None, None)
+        """
+        return self.entries.get(shape, (None, None))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, shape):
+        return shape in self.entries
 
 # 模型/堡垒类
 class ChessModel:
-    def __init__(self, player_id):
+    def __init__(self, player_id, registry=None):
         self.pieces = []
         self.player_id = player_id
+        self.registry = registry  # 共享的形状索引（可选）
         print(f"创建玩家{player_id}模型")
         
     def add_piece(self, piece):
@@ -310,6 +438,10 @@ class ChessModel:
             # 确保棋子知道它属于哪个玩家
             piece.player_id = self.player_id
             
+            # 登记形状索引
+            if self.registry is not None:
+                self.registry.register(piece, self.player_id)
+            
             # 确保碰撞类型正确
             if hasattr(piece, 'shape') and piece.chess_type != ChessPieceType.GO_CHESS:
                 # 根据玩家ID设置对应的碰撞类型(保留围棋的特殊类型)
@@ -325,18 +457,36 @@ class ChessModel:
             print(f"棋子已添加到玩家{self.player_id}模型，当前数量: {len(self.pieces)}")
         else:
             print(f"棋子已经存在于玩家{self.player_id}模型中，当前数量: {len(self.pieces)}")
+    
+    def remove_piece(self, piece):
+        """从模型中移除一个棋子（不会从物理空间中移除）"""
+        if piece in self.pieces:
+            self.pieces.remove(piece)
+            if self.registry is not None:
+                self.registry.unregister(piece)
         
-    def is_destroyed(self):
-        """检查模型是否被完全摧毁（所有棋子都散落在地面以上一定高度）"""
+    def is_destroyed(self, ground_y=500):
+        """检查模型是否被完全摧毁（超过70%的棋子散落到地面附近）
+        
+        Args:
+            ground_y: 散落判定的基准高度（BattleSimulation.destruction_ground_y）
+        """
         if not self.pieces:  # 如果没有棋子，认为模型已摧毁
             return True
     
-        return self.get_destruction_percentage() > 0.7
+        return self.get_destruction_percentage(ground_y) > 0.7
             
-    def get_destruction_percentage(self):
-        """计算模型被摧毁的百分比"""
+    def get_destruction_percentage(self, ground_y=500):
+        """计算模型被摧毁的百分比
+        
+        Args:
+            ground_y: 散落判定的基准高度（BattleSimulation.destruction_ground_y），
+                棋子中心低于该高度50像素以内视为已散落
+            
+        Returns:
+            float: 散落棋子的比例
+        """
         # 计算初始完好的棋子数量
-        ground_y = 500  # 假设500是地面位置
         initial_total = len(self.pieces)
         fallen_count = 0
         
@@ -352,31 +502,25 @@ class ChessModel:
         # 返回散落的棋子比例
         return fallen_count / initial_total if initial_total > 0 else 1.0
     
-    def is_chinese_chess_isolated(self, space):
+    def is_chinese_chess_isolated(self, contact_graph):
         """检查象棋是否与本方其他棋子都不接触
         
         Args:
-            space: pymunk物理空间，用于检测碰撞
+            contact_graph: 由碰撞回调维护的ContactGraph，记录当前互相接触的形状
             
         Returns:
             bool: 如果象棋与其他本方棋子都不接触，返回True；否则返回False
         """
         # 首先找到象棋棋子
         chinese_chess = None
-        other_pieces = []
-        
-        # 计算初始完好的棋子数量
-        ground_y = 500  # 假设500是地面位置
-        initial_total = len(self.pieces)
-        fallen_count = 0
+        other_shapes = set()
         
         for piece in self.pieces:
-            # 检查棋子是否已掉落或靠近地面
             if hasattr(piece, 'chess_type'):
                 if piece.chess_type == ChessPieceType.CHINESE_CHESS:
                     chinese_chess = piece
-                else:
-                    other_pieces.append(piece)
+                elif hasattr(piece, 'shape'):
+                    other_shapes.add(piece.shape)
             else:
                 print(f"警告：棋子没有chess_type属性")
         
@@ -386,20 +530,14 @@ class ChessModel:
             return True
             
         # 如果没有其他棋子，象棋肯定是孤立的
-        if not other_pieces:
+        if not other_shapes:
             print(f"玩家{self.player_id}没有非象棋棋子，象棋被认为是孤立的")
             return True
             
-        # 检查象棋是否与其他本方棋子接触
-        for other in other_pieces:
-            if hasattr(other, 'shape') and hasattr(other.body, 'position'):
-                # 使用pymunk的碰撞检测功能来判断两个棋子是否接触
-                if space.shape_query(chinese_chess.shape):
-                    query_result = space.shape_query(chinese_chess.shape)
-                    for contact in query_result:
-                        if contact.shape == other.shape:
-                            print(f"玩家{self.player_id}的象棋与其他棋子接触")
-                            return False  # 有接触，不孤立
+        # 在接触图中查找与象棋接触的本方棋子
+        if not other_shapes.isdisjoint(contact_graph.neighbors(chinese_chess.shape)):
+            print(f"玩家{self.player_id}的象棋与其他棋子接触")
+            return False  # 有接触，不孤立
         
         print(f"玩家{self.player_id}的象棋孤立")
         return True  # 没有接触，孤立
@@ -441,6 +579,8 @@ class ChessModel:
                 print(f"移除无效棋子，索引: {i}")
                 try:
                     invalid_piece = self.pieces.pop(i)
+                    if self.registry is not None:
+                        self.registry.unregister(invalid_piece)
                     print(f"已从模型中移除无效棋子")
                 except Exception as e:
                     print(f"移除无效棋子时出错: {e}")
@@ -449,24 +589,14 @@ class ChessModel:
             print(f"警告：只成功绘制了{pieces_count}/{len(self.pieces)}个棋子")
     
     def save(self, filename):
-        """保存模型状态"""
-        model_data = {
-            'player_id': self.player_id,
-            'pieces': []
-        }
-        
-        # 保存每个棋子的信息，包括形状类型
-        for p in self.pieces:
-            piece_data = {
-                'position': (p.body.position.x, p.body.position.y),
-                'chess_type': p.chess_type.value,
-                'angle': p.body.angle  # 保存旋转角度
-            }
-            model_data['pieces'].append(piece_data)
+        """保存模型状态（二进制格式，见model_format.py）"""
+        # 保存每个棋子的类型、玩家、位置和旋转角度
+        pieces = [(p.chess_type.value, p.player_id,
+                   p.body.position.x, p.body.position.y, p.body.angle)
+                  for p in self.pieces]
         
         try:
-            with open(f"{filename}.model", "wb") as f:
-                pickle.dump(model_data, f)
+            model_format.write_model(f"{filename}.model", self.player_id, pieces)
             print(f"模型已保存到 {filename}.model 文件，包含 {len(self.pieces)} 个棋子")
             return True
         except Exception as e:
@@ -474,33 +604,36 @@ class ChessModel:
             return False
             
     @classmethod
-    def load(cls, filename, space):
-        """加载模型状态"""
+    def load(cls, filename, space, registry=None):
+        """加载模型状态，同时支持二进制格式和pickle保存的旧格式
+        
+        Args:
+            filename: 模型文件名（不含.model后缀）
+            space: pymunk物理空间，加载的棋子会添加到其中
+            registry: 可选的PieceRegistry，加载的棋子会登记到其中
+            
+        Returns:
+            ChessModel: 加载成功返回模型，失败返回None
+        """
         try: 
             if not os.path.exists(f"{filename}.model"):
                 print(f"无法找到模型文件: {filename}.model")
                 return None
                 
-            with open(f"{filename}.model", "rb") as f:
-                model_data = pickle.load(f)
+            with model_format.open_model(f"{filename}.model") as model_file:
+                model = ChessModel(model_file.player_id, registry)
                 
-            model = ChessModel(model_data['player_id'])
-            
-            # 打印加载的模型信息
-            print(f"从{filename}.model加载模型，玩家ID: {model.player_id}")
-            
-            if 'pieces' in model_data and len(model_data['pieces']) > 0:
-                for piece_data in model_data['pieces']:
+                # 打印加载的模型信息
+                print(f"从{filename}.model加载模型，玩家ID: {model.player_id}")
+                if model_file.legacy:
+                    print(f"{filename}.model 是旧格式，可以用 python model_format.py migrate 转换")
+                
+                if len(model_file) == 0:
+                    print(f"模型文件 {filename}.model 没有包含棋子数据")
+                    return None
+                
+                for chess_type_value, _, x, y, angle in model_file:
                     try:
-                        # 兼容旧格式
-                        if isinstance(piece_data, tuple):
-                            x, y, chess_type_value = piece_data
-                            angle = 0
-                        else:
-                            x, y = piece_data['position']
-                            chess_type_value = piece_data['chess_type']
-                            angle = piece_data.get('angle', 0)
-                         
                         chess_type = ChessPieceType(chess_type_value)
                         
                         # 明确使用模型的player_id创建棋子
@@ -520,11 +653,8 @@ class ChessModel:
                     except Exception as e:
                         print(f"加载棋子失败: {e}")
                 
-                print(f"从 {filename}.model 成功加载了 {len(model.pieces)} 个棋子")
-                return model
-            else:
-                print(f"模型文件 {filename}.model 没有包含棋子数据")
-                return None
+            print(f"从 {filename}.model 成功加载了 {len(model.pieces)} 个棋子")
+            return model
         except Exception as e:
             print(f"加载模型失败: {e}")
             return None 
\ No newline at end of file
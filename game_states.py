@@ -3,7 +3,13 @@ import pygame
 import pymunk
 import pymunk.pygame_util
 import math
-from game_objects import ChessPiece, ChessPieceType, Projectile, ChessModel
+import time
+from game_objects import ChessPiece, ChessPieceType
+from simulation import BattleSimulation
+from profiler import FrameProfiler
+from recording import InputRecorder
+from render_cache import LayerCache, SurfacePool, TextCache
+from fonts import get_font
 import sys
 
 # 游戏状态枚举
@@ -14,89 +20,124 @@ class GameState(Enum):
     GAME_OVER = 4
     RULES = 5
 
+# 模拟器属性代理
+class SimulationAttribute:
+    """把GameManager上的属性读写转发给内部的BattleSimulation
+
+    界面代码仍然可以直接使用self.space、self.projectile等属性，
+    而实际状态只保存在无界面的模拟器中
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(instance.simulation, self.name)
+
+    def __set__(self, instance, value):
+        setattr(instance.simulation, self.name, value)
+
 # 游戏管理类
 class GameManager:
-    def __init__(self, screen_width, screen_height):
+    """游戏管理类，负责界面层：事件处理、绘制和游戏状态切换
+
+    物理空间、双方模型和战斗规则由BattleSimulation负责，GameManager包装它并提供界面
+    """
+    # 以下属性由模拟器持有
+    space = SimulationAttribute()
+    player1_model = SimulationAttribute()
+    player2_model = SimulationAttribute()
+    active_player = SimulationAttribute()
+    projectile = SimulationAttribute()
+    max_strength = SimulationAttribute()
+    projectile_placed = SimulationAttribute()
+    projectile_fired = SimulationAttribute()
+    ready_to_switch_player = SimulationAttribute()
+    player1_model_saved = SimulationAttribute()
+    winner = SimulationAttribute()
+    pieces_stable = SimulationAttribute()
+    stability_timer = SimulationAttribute()
+
+    # 发射后的结算方式：实时、瞬间结算、瞬间结算后快速回放（按F键切换）
+    RESOLVE_MODES = ("realtime", "instant", "replay")
+    RESOLVE_MODE_NAMES = {"realtime": "实时", "instant": "瞬间结算", "replay": "瞬间结算+快速回放"}
+    RESOLVE_MAX_STEPS = 6000         # 瞬间结算最多执行的物理步数（50模拟秒）
+    FAST_REPLAY_STEPS_PER_FRAME = 8  # 快速回放每帧前进的物理步数（60FPS下为4倍速）
+    
+    # 有进行中的物理模拟的状态，其余状态（主菜单、规则页、游戏结束）不推进物理空间
+    LIVE_STATES = (GameState.BUILDING_PHASE, GameState.BATTLE)
+    
+    # 大型堡垒模式下每个玩家默认可以放置的棋子数量
+    LARGE_FORTRESS_CHESS_COUNTS = {
+        ChessPieceType.MILITARY_CHESS: 500,
+        ChessPieceType.CHINESE_CHESS: 1,
+        ChessPieceType.GO_CHESS: 300
+    }
+    
+    # 建造阶段可用的棋子类型：名称、类型、示例位置
+    PALETTE = [
+        ("军棋(1)", ChessPieceType.MILITARY_CHESS, (40, 40)),
+        ("象棋(2)", ChessPieceType.CHINESE_CHESS, (100, 40)),
+        ("围棋(3)", ChessPieceType.GO_CHESS, (160, 40))
+    ]
+    
+    def __init__(self, screen_width, screen_height, large_fortress=False, max_chess_counts=None):
+        """
+        Args:
+            screen_width: 窗口宽度
+            screen_height: 窗口高度
+            large_fortress: 是否启用大型堡垒模式（允许放置大量棋子，物理空间使用空间哈希）
+            max_chess_counts: 可选，覆盖每种棋子的数量上限，例如{ChessPieceType.GO_CHESS: 20}
+        """
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.current_state = GameState.MAIN_MENU
+        self.large_fortress = large_fortress
         
-        # 初始化物理空间
-        self.space = pymunk.Space()
-        self.space.gravity = (0, 400)  # 增强重力效果，使笔芯运动更加真实
-        self.space.damping = 0.85  # 进一步减小阻尼，使物体运动更流畅
-        
-        # 定义碰撞类型
-        self.ground_collision_type = 0
-        self.projectile_collision_type = 4
-        self.player1_chess_collision_type = 1  # 玩家1的棋子碰撞类型
-        self.player2_chess_collision_type = 2  # 玩家2的棋子碰撞类型
-        self.go_chess_collision_type = 3      # 围棋的碰撞类型
-        print("初始化碰撞类型: 地面=0, 弹射物=4, 玩家1棋子=1, 玩家2棋子=2, 围棋=3")
-        
-        # 创建地面
-        self.create_ground()
-        
-        # 设置碰撞处理
-        # 为围棋和地面设置特殊的碰撞处理
-        self.space.add_collision_handler(3, 0).begin = self.go_chess_ground_collision_handler
-        # 为弹射物和地面设置碰撞处理
-        self.space.add_collision_handler(self.projectile_collision_type, self.ground_collision_type).begin = self.projectile_ground_collision_handler
-        # 为弹射物和玩家1/2的棋子设置碰撞处理
-        self.space.add_collision_handler(self.projectile_collision_type, self.player1_chess_collision_type).begin = self.projectile_player1_collision_handler 
-        self.space.add_collision_handler(self.projectile_collision_type, self.go_chess_collision_type).begin = self.projectile_go_chess_collision_handler
-        self.space.add_collision_handler(self.projectile_collision_type, self.player2_chess_collision_type).begin = self.projectile_player2_collision_handler
-        
-        
-        # 玩家模型
-        self.player1_model = ChessModel(1)
-        self.player2_model = ChessModel(2)
-        
-        # 当前活动玩家
-        self.current_player = 1
-        self.active_player = 1
+        # 帧耗时分析（按P键显示），模拟器中的物理步和规则检查也会计入
+        self.profiler = FrameProfiler()
         
-        # 弹射物
-        self.projectile = None
+        # 创建无界面模拟器，使用pygame时钟作为计时来源
+        self.simulation = self.create_simulation()
         
-        # 弹射力度和方向
+        # 当前建造的玩家
+        self.current_player = 1
+        
+        # 弹射力度
         self.shoot_strength = 0
         self.charging = False
-        self.max_strength = 2000
+        
+        # 固定步长物理模拟的时间累加器
+        self.physics_accumulator = 0.0
+        self.max_steps_per_frame = 8   # 每帧最多执行的物理步数
+        self.max_idle_steps_per_frame = 30  # 空闲时每帧最多执行的物理步数，降低帧率后按实际时间补足
+        self.max_frame_time = 0.25     # 单帧最多计入的时间（秒）
+        self.render_alpha = 1.0        # 绘制插值系数
+        
+        # 发射后的结算方式，以及瞬间结算后快速回放的画面
+        self.resolve_mode = "realtime"
+        self.fast_replay_frames = None  # 每项为[(棋子或弹射物, x, y, 角度)]
+        self.fast_replay_index = 0
         
         # 拖放功能相关变量
         self.dragging = False
         self.drag_piece = None
         self.drag_offset = (0, 0)
-        
-        # 弹射物状态标记
-        self.projectile_placed = False
-        self.projectile_fired = False    # 标记弹射物已发射但尚未切换玩家
-        self.ready_to_switch_player = False  # 标记弹射物已停止运动，可以切换玩家
         self.is_dragging_existing_piece = False
         
-        # 游戏胜利者
-        self.winner = None
-        
-        # 棋子稳定性相关变量
-        self.pieces_stable = False  # 标记棋子是否处于稳定状态
-        self.stability_timer = 0    # 稳定状态计时器
-        self.stability_check_duration = 2000  # 稳定状态需要持续的时间(毫秒)
-        self.last_victory_check_time = 0  # 上次胜负检查的时间
-        
         # 游戏界面设置
         self.draw_options = pymunk.pygame_util.DrawOptions(pygame.Surface((1, 1)))
         
-        # 初始化支持中文的字体
-        try:
-            # 使用arialunicode字体，这个字体在系统中支持中文
-            self.font = pygame.font.SysFont("arialunicode", 18, bold=False)  # 减小字体并取消粗体
-            self.small_font = pygame.font.SysFont("arialunicode", 14, bold=False)  # 更小的字体用于标签等
-        except:
-            # 如果上述字体不可用，尝试使用系统默认字体
-            font_default = pygame.font.get_default_font()
-            self.font = pygame.font.Font(font_default, 18)
-            self.small_font = pygame.font.Font(font_default, 14)
+        # 支持中文的字体在第一次绘制时才加载（见font、small_font）
+        # 文字图像缓存，界面文字不变时不重新渲染
+        self.text_cache = TextCache()
+        # 主菜单、规则页和建造阶段的静态图层，更换字体或界面文字后需要清空
+        self.static_layers = LayerCache()
+        # 每帧绘制的半透明背景从池中取出，不再每帧新建
+        self.surface_pool = SurfacePool()
+        # 脏矩形模式时为DirtyRectTracker（main.py的--dirty-rects），绘制时登记每个元素
+        self.dirty_rects = None
         
         # 棋子选择
         self.selected_chess_type = ChessPieceType.MILITARY_CHESS
@@ -107,6 +148,10 @@ class GameManager:
             ChessPieceType.CHINESE_CHESS: 1,   # 象棋最大1个
             ChessPieceType.GO_CHESS: 3         # 围棋最大3个
         }
+        if large_fortress:
+            self.max_chess_counts.update(self.LARGE_FORTRESS_CHESS_COUNTS)
+        if max_chess_counts:
+            self.max_chess_counts.update(max_chess_counts)
         # 当前玩家已放置的棋子数量
         self.player1_chess_counts = {
             ChessPieceType.MILITARY_CHESS: 0,
@@ -124,389 +169,146 @@ class GameManager:
         self.tip_timer = 0
         self.tip_duration = 3000  # 提示显示时间（毫秒）
         
-        # 调试选项
-        self.debug_draw = False  # 是否启用调试绘制
+        # 建造阶段的撤销记录，每项为(模拟器快照, 放置前的棋子计数)
+        self.undo_stack = []
+        self.drag_undo_entry = None  # 当前拖动开始前的记录，放置成功后加入撤销记录
         
-    def create_ground(self):
-        """创建地面和边界"""
-        # 地面
-        ground_body = pymunk.Body(body_type=pymunk.Body.STATIC)
-        ground_shape = pymunk.Segment(ground_body, (0, self.screen_height - 50), 
-                                      (self.screen_width, self.screen_height - 50), 5)
-        ground_shape.friction = 1.0  # 最大摩擦力，防止滑动
-        ground_shape.elasticity = 0.1  # 很低的弹性，防止弹跳
-        ground_shape.collision_type = self.ground_collision_type  # 地面碰撞类型
-        self.space.add(ground_body, ground_shape)
-        
-        # 左边界
-        left_body = pymunk.Body(body_type=pymunk.Body.STATIC)
-        left_shape = pymunk.Segment(left_body, (0, 0), (0, self.screen_height), 5)
-        left_shape.friction = 1.0
-        left_shape.elasticity = 0.1
-        left_shape.collision_type = self.ground_collision_type
-        self.space.add(left_body, left_shape)
-        
-        # 右边界
-        right_body = pymunk.Body(body_type=pymunk.Body.STATIC)
-        right_shape = pymunk.Segment(right_body, (self.screen_width, 0), 
-                                    (self.screen_width, self.screen_height), 5)
-        right_shape.friction = 1.0
-        right_shape.elasticity = 0.1
-        right_shape.collision_type = self.ground_collision_type
-        self.space.add(right_body, right_shape)
-        
-    def go_chess_ground_collision_handler(self, arbiter, space, data):
-        """围棋与地面的碰撞处理函数"""
-        # 获取碰撞的围棋棋子
-        go_chess_shape = arbiter.shapes[0]
-        ground_shape = arbiter.shapes[1]
-        
-        # 确保围棋不会穿过地面
-        if hasattr(go_chess_shape, 'body'):
-            # 获取围棋的位置
-            pos = go_chess_shape.body.position
-            # 如果围棋位置低于地面，将其拉回地面上方
-            if pos.y > self.screen_height - 70:  # 地面位置上方20像素
-                go_chess_shape.body.position = pymunk.Vec2d(pos.x, self.screen_height - 70)
-                go_chess_shape.body.velocity = pymunk.Vec2d(go_chess_shape.body.velocity.x, 0)
-                print("围棋碰撞地面，已调整位置")
-        
-        # 返回True表示允许碰撞继续处理
-        return True
+        # 对局输入记录，游戏结束时自动保存，用replay.py回放
+        self.recorder = self.create_recorder()
         
-    def projectile_ground_collision_handler(self, arbiter, space, data):
-        """弹射物与地面的碰撞处理函数"""
-        # 获取碰撞的弹射物
-        projectile_shape = arbiter.shapes[0]
-        ground_shape = arbiter.shapes[1]
-        
-        # 减小弹射物的速度，使其更快停下来
-        if hasattr(projectile_shape, 'body'):
-            # 获取弹射物的速度
-            vel = projectile_shape.body.velocity
-            # 减小速度
-            projectile_shape.body.velocity = pymunk.Vec2d(vel.x * 0.8, vel.y * 0.8)
-            
-            # 如果速度很小，直接停止
-            if vel.length < 10:
-                projectile_shape.body.velocity = pymunk.Vec2d(0, 0)
-                projectile_shape.body.angular_velocity = 0
-        
-        # 返回True表示允许碰撞继续处理
-        return True
+        # 调试选项
+        self.debug_draw = False  # 是否启用调试绘制
         
-    def projectile_player1_collision_handler(self, arbiter, space, data):
-        """弹射物与玩家1棋子的碰撞处理函数"""
-        print("检测到弹射物与玩家1棋子碰撞")
-        # 获取碰撞的弹射物和棋子
-        projectile_shape = arbiter.shapes[0]
-        chess_shape = arbiter.shapes[1]
-        
-        try:
-            # 找到被碰撞的棋子
-            for piece in self.player1_model.pieces:
-                if hasattr(piece, 'shape') and piece.shape == chess_shape:
-                    # 施加额外冲量，增强碰撞效果
-                    if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
-                        # 获取弹射物的速度
-                        vel = projectile_shape.body.velocity
-                        # 如果速度足够大，对棋子施加冲量
-                        if vel.length > 10:
-                            # 计算碰撞力度，与弹射物速度成正比
-                            impact = vel.normalized() * min(vel.length * 1.5, 500)
-                            # 对棋子施加冲量
-                            piece.body.apply_impulse_at_world_point(impact, piece.body.position)
-                            print(f"弹射物撞击玩家1棋子，施加冲量: {impact}")
-                    break
-        except Exception as e:
-            print(f"处理弹射物与玩家1棋子碰撞时出错: {e}")
-        
-        # 返回True表示允许碰撞继续处理
-        return True
+    @property
+    def font(self):
+        """界面字体，优先使用随项目提供的中文字体，第一次使用时加载"""
+        return get_font(18)
+    
+    @property
+    def small_font(self):
+        """更小的字体，用于标签等"""
+        return get_font(14)
+    
+    def create_simulation(self):
+        """创建模拟器
 
-    def projectile_player2_collision_handler(self, arbiter, space, data):
-        """弹射物与玩家2棋子的碰撞处理函数"""
-        print("检测到弹射物与玩家2棋子碰撞")
-        # 获取碰撞的弹射物和棋子 
-        projectile_shape = arbiter.shapes[0]
-        chess_shape = arbiter.shapes[1]
-        
-        try:
-            print(f"正在处理弹射物与玩家2棋子碰撞，弹射物类型: {projectile_shape.collision_type}, 棋子类型: {chess_shape.collision_type}")
-            # 找到被碰撞的棋子
-            for piece in self.player2_model.pieces:
-                if hasattr(piece, 'shape') and piece.shape == chess_shape:
-                    # 施加额外冲量，增强碰撞效果
-                    if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
-                        # 获取弹射物的速度
-                        vel = projectile_shape.body.velocity
-                        # 如果速度足够大，对棋子施加冲量
-                        print(f"弹射物与玩家2棋子碰撞，速度: {vel.length}")
-                        
-                        if vel.length > 5:  # 降低阈值，确保小速度也有效果
-                            # 计算碰撞力度，与弹射物速度成正比
-                            impact = vel.normalized() * min(vel.length * 1.5, 500)
-                            piece.body.apply_impulse_at_world_point(impact, piece.body.position)
-                            print(f"弹射物撞击玩家2棋子，施加冲量: {impact}")
-                    break
-        except Exception as e:
-            print(f"处理弹射物与玩家2棋子碰撞时出错: {e}")
-        
-        # 返回True表示允许碰撞继续处理
-        return True
+        规则计时使用模拟器按物理步累计的时间而不是pygame时钟，
+        胜负判断只取决于物理步数，回放输入记录时能得到相同的结果
+        """
+        expected_pieces = 2 * sum(self.LARGE_FORTRESS_CHESS_COUNTS.values())
+        return BattleSimulation(self.screen_width, self.screen_height,
+                                large_fortress=self.large_fortress, expected_pieces=expected_pieces,
+                                profiler=self.profiler)
+        
+    def create_recorder(self):
+        """创建新的输入记录，保存回放时创建GameManager所需的设置"""
+        return InputRecorder({
+            "screen_width": self.screen_width,
+            "screen_height": self.screen_height,
+            "large_fortress": self.large_fortress,
+            "max_chess_counts": {chess_type.name: count
+                                 for chess_type, count in self.max_chess_counts.items()},
+        })
+        
+    def record_input(self, kind, **data):
+        """记录一条会改变对局的输入，附带当前的物理步序号"""
+        self.recorder.record(self.simulation.step_count, kind, **data)
+        
+    def save_recording(self, filename=None):
+        """保存本局的输入记录
 
-    def projectile_go_chess_collision_handler(self, arbiter, space, data):
-        """弹射物与围棋的碰撞处理函数"""
-        print("检测到弹射物与围棋碰撞")
-        # 获取碰撞的弹射物和棋子
-        projectile_shape = arbiter.shapes[0]
-        go_chess_shape = arbiter.shapes[1]
-        
-        try:
-            # 找到被碰撞的围棋棋子（可能在任一玩家模型中）
-            found_go_chess = False
-            
-            # 先检查玩家1模型
-            for piece in self.player1_model.pieces:
-                if hasattr(piece, 'shape') and piece.shape == go_chess_shape:
-                    # 施加额外冲量，增强碰撞效果
-                    if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
-                        # 获取弹射物的速度
-                        vel = projectile_shape.body.velocity
-                        # 如果速度足够大，对棋子施加冲量
-                        if vel.length > 10:
-                            # 计算碰撞力度，与弹射物速度成正比
-                            impact = vel.normalized() * min(vel.length * 1.5, 500)
-                            # 对围棋施加冲量（可能需要更大的力度）
-                            piece.body.apply_impulse_at_world_point(impact * 1.2, piece.body.position)
-                            print(f"弹射物撞击玩家1的围棋，施加冲量: {impact}")
-                    found_go_chess = True
-                    break
-            
-            # 如果在玩家1中未找到，检查玩家2模型
-            if not found_go_chess:
-                for piece in self.player2_model.pieces:
-                    if hasattr(piece, 'shape') and piece.shape == go_chess_shape:
-                        if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
-                            vel = projectile_shape.body.velocity
-                            if vel.length > 10:
-                                impact = vel.normalized() * min(vel.length * 1.5, 500)
-                                piece.body.apply_impulse_at_world_point(impact * 1.2, piece.body.position)
-                                print(f"弹射物撞击玩家2的围棋，施加冲量: {impact}")
-        except Exception as e:
-            print(f"处理弹射物与围棋碰撞时出错: {e}")
-        return True
+        Returns:
+            str: 写入的文件名，失败时返回None
+        """
+        return self.recorder.save(filename, end_step=self.simulation.step_count, winner=self.winner)
         
     def update(self, dt):
-        """更新游戏状态"""
-        # 使用固定的物理步长，避免物理模拟中的不稳定性
-        current_time = pygame.time.get_ticks()
-        
-        step_dt = 1/120.0  # 固定步长为120FPS
-        steps = int(dt / step_dt) + 1
-        for _ in range(steps):
-            self.space.step(step_dt)
-        
-        # 确保所有棋子都在屏幕内
-        self.keep_pieces_in_bounds()
+        """更新游戏状态
         
-        # 处理弹射物的速度
-        if self.projectile and hasattr(self.projectile, 'body') and hasattr(self.projectile.body, 'velocity'):
-            try:
-                # 检查位置是否有效
-                if (hasattr(self.projectile.body, 'position') and 
-                    (math.isnan(self.projectile.body.position.x) or 
-                     math.isnan(self.projectile.body.position.y))):
-                    print("检测到弹射物位置为NaN，尝试修复")
-                    # 尝试修复位置而不是直接重置
-                    self.projectile.body.position = (self.screen_width / 2, self.screen_height / 2)
-                # 检查速度是否有效
-                elif (math.isnan(self.projectile.body.velocity.x) or 
-                      math.isnan(self.projectile.body.velocity.y)):
-                    print("检测到弹射物速度为NaN，尝试修复")
-                    # 尝试修复速度而不是直接重置
-                    self.projectile.body.velocity = pymunk.Vec2d(0, 0)
-                # 如果弹射物速度很小，直接停止
-                else:
-                    velocity_length = self.projectile.body.velocity.length
-                    if velocity_length < 5 and self.projectile.body.body_type == pymunk.Body.DYNAMIC:
-                        self.projectile.body.velocity = pymunk.Vec2d(0, 0)
-                        self.projectile.body.angular_velocity = 0
-                        
-                        # 如果弹射物已发射并且停止移动，标记可以切换玩家
-                        if self.projectile_fired and not self.ready_to_switch_player:
-                            self.ready_to_switch_player = True
-                            print("弹射物停止运动，可以切换玩家")
-
-            except Exception as e:
-                # 如果处理弹射物速度时出错，打印错误但不重置弹射物
-                print(f"处理弹射物速度时出错: {e}")
+        使用固定步长累加器推进物理模拟：按实际帧时间累积，每满一个物理步长执行一步，
+        每帧最多执行max_steps_per_frame步，避免慢帧导致越算越慢。剩余的不足一步的时间
+        用于计算插值系数，绘制时在上一步和当前步之间插值。
+        空闲时（is_idle）物理步很便宜，帧率降低后每帧最多执行max_idle_steps_per_frame步，
+        模拟时间仍与实际时间同步；没有进行中的模拟的状态不推进物理空间
         
-        # 在战斗状态下检查胜负
-        if self.current_state == GameState.BATTLE and not self.projectile_fired:
-            # 检查所有棋子是否处于稳定状态
-            all_stable = self.is_all_pieces_stable()
-            
-            # 如果所有棋子稳定，开始计时
-            if all_stable and not self.pieces_stable:
-                self.pieces_stable = True
-                self.stability_timer = current_time
-                print("检测到所有棋子处于稳定状态，开始计时...")
-            
-            # 如果棋子又开始运动，重置稳定状态
-            elif not all_stable and self.pieces_stable:
-                self.pieces_stable = False
-                print("检测到棋子开始运动，重置稳定状态")
+        Args:
+            dt: 距上一帧实际经过的时间（秒）
             
-            # 如果棋子持续稳定一段时间，执行胜负判断
-            if self.pieces_stable and (current_time - self.stability_timer >= self.stability_check_duration):
-                # 确保不会连续多次调用胜负判断（至少间隔1秒）
-                if current_time - self.last_victory_check_time >= 1000:
-                    self.last_victory_check_time = current_time
-                    print(f"棋子已保持稳定状态 {(current_time - self.stability_timer) / 1000:.1f} 秒，执行胜负判断")
-                    
-                    # 检查双方象棋是否孤立（不与本方其他棋子接触）
-                    player1_chinese_chess_isolated = self.player1_model.is_chinese_chess_isolated(self.space)
-                    player2_chinese_chess_isolated = self.player2_model.is_chinese_chess_isolated(self.space)
-                    
-                    # 根据新规则：当象棋与本方其他棋子都不接触时，对方获胜
-                    if player1_chinese_chess_isolated:
-                        print("玩家1的象棋与其他棋子不接触，玩家2获胜")
-                        self.current_state = GameState.GAME_OVER
-                        self.winner = 2
-                    elif player2_chinese_chess_isolated:
-                        print("玩家2的象棋与其他棋子不接触，玩家1获胜")
-                        self.current_state = GameState.GAME_OVER
-                        self.winner = 1
-                    if self.player1_model.is_destroyed():
-                        print("玩家1模型被摧毁，玩家2获胜")
-                        self.current_state = GameState.GAME_OVER
-                        self.winner = 2
-                    elif self.player2_model.is_destroyed() and not player2_chinese_chess_isolated:
-                        print("玩家2模型被摧毁，玩家1获胜")
-                        self.current_state = GameState.GAME_OVER
-                        self.winner = 1
-                        
-                    # 如果有判定结果，重置稳定性检查
-                    if self.current_state == GameState.GAME_OVER:
-                        self.pieces_stable = False
-                else:
-                    # 避免频繁打印日志
-                    pass
-                    
-        # 如果弹射物已发射，则不进行胜负判断
-        elif self.current_state == GameState.BATTLE and self.projectile_fired:
-            # 重置稳定性状态，等待弹射物完成后再重新检查
-            if self.pieces_stable:
-                self.pieces_stable = False
-                print("弹射物正在移动，暂停胜负判断")
+        Returns:
+            None
+        """
+        # 快速回放期间物理空间已经是结算后的状态，不推进模拟
+        if self.fast_replay_frames:
+            self.fast_replay_index += 1
+            if self.fast_replay_index >= len(self.fast_replay_frames):
+                self.stop_fast_replay()
+            return
         
-        # 检查提示信息是否过期
+        if self.current_state in self.LIVE_STATES:
+            self.advance_physics(dt)
+        else:
+            self.physics_accumulator = 0.0
+            self.render_alpha = 1.0
+        
+        # 模拟器判定胜负后切换到游戏结束界面
+        if self.current_state == GameState.BATTLE and self.simulation.game_over:
+            self.current_state = GameState.GAME_OVER
+            self.save_recording()
                 
         # 检查提示信息是否过期
         if self.tip_message and pygame.time.get_ticks() - self.tip_timer >= self.tip_duration:
             self.tip_message = ""
         
-    def is_all_pieces_stable(self):
-        """检查所有棋子是否处于静止状态
-        
-        通过检查所有棋子的速度和角速度，判断是否所有棋子都已停止运动
-        
-        Returns:
-            bool: 如果所有棋子都处于静止状态，返回True；否则返回False
+    def advance_physics(self, dt):
+        """按实际经过的时间推进固定步长的物理模拟"""
+        step_dt = self.simulation.STEP_DT
+        # 限制单帧时间，窗口拖动或卡顿后不会一次补算过多物理步
+        self.physics_accumulator += min(max(dt, 0.0), self.max_frame_time)
+        
+        max_steps = self.max_idle_steps_per_frame if self.is_idle() else self.max_steps_per_frame
+        steps = min(int(self.physics_accumulator / step_dt), max_steps)
+        for i in range(steps):
+            # 在本帧最后一步之前记录位置，作为插值绘制的起点
+            if i == steps - 1:
+                self.save_render_transforms()
+            # 每个物理步之后执行边界约束、弹射物状态和胜负判断，结果与帧率无关
+            self.simulation.step(1)
+        self.physics_accumulator -= steps * step_dt
+        
+        # 达到每帧步数上限时丢弃积压的时间，防止"死亡螺旋"
+        if self.physics_accumulator >= step_dt:
+            self.physics_accumulator = 0.0
+        self.render_alpha = self.physics_accumulator / step_dt
+        
+    def is_idle(self):
+        """画面是否没有需要连续绘制的变化
+        
+        没有拖动、充能、快速回放和提示信息，并且没有进行中的模拟或者所有棋子都已休眠、
+        弹射物不在飞行中时为空闲，帧调度器据此降低帧率
         """
-        # 速度阈值，低于此值认为是静止的
-        velocity_threshold = 2.0
-        angular_velocity_threshold = 0.05
-        
-        # 检查玩家1的棋子
-        for piece in self.player1_model.pieces:
-            if hasattr(piece, 'body') and hasattr(piece.body, 'velocity'):
-                if piece.body.velocity.length > velocity_threshold or abs(piece.body.angular_velocity) > angular_velocity_threshold:
-                    return False
-        
-        # 检查玩家2的棋子
-        for piece in self.player2_model.pieces:
-            if hasattr(piece, 'body') and hasattr(piece.body, 'velocity'):
-                if piece.body.velocity.length > velocity_threshold or abs(piece.body.angular_velocity) > angular_velocity_threshold:
-                    return False
-        
-        # 所有棋子都静止
-        return True
-        
-    def keep_pieces_in_bounds(self):
-        """确保所有棋子都在屏幕边界内"""
-        # 定义边界
-        margin = 20
-        left_bound = margin
-        right_bound = self.screen_width - margin
-        top_bound = margin
-        bottom_bound = self.screen_height - margin
-        
-        # 检查所有棋子
-        for model in [self.player1_model, self.player2_model]:
+        if self.fast_replay_frames or self.dragging or self.charging or self.tip_message:
+            return False
+        if self.current_state not in self.LIVE_STATES:
+            return True
+        if self.projectile_fired and not self.ready_to_switch_player:
+            return False
+        return self.simulation.is_all_pieces_stable()
+        
+    def save_render_transforms(self):
+        """记录所有棋子和弹射物当前的位置和角度，作为插值绘制的起点"""
+        for model in (self.player1_model, self.player2_model):
             for piece in model.pieces:
-                if hasattr(piece, 'body') and hasattr(piece.body, 'position'):
-                    x, y = piece.body.position
-                    
-                    # 检查是否超出边界
-                    if x < left_bound:
-                        piece.body.position = (left_bound, y)
-                        piece.body.velocity = (0, piece.body.velocity.y)
-                    elif x > right_bound:
-                        piece.body.position = (right_bound, y)
-                        piece.body.velocity = (0, piece.body.velocity.y)
-                        
-                    if y < top_bound:
-                        piece.body.position = (x, top_bound)
-                        piece.body.velocity = (piece.body.velocity.x, 0)
-                    elif y > bottom_bound:
-                        piece.body.position = (x, bottom_bound)
-                        piece.body.velocity = (piece.body.velocity.x, 0)
-                        
-                    # 特殊处理围棋棋子，防止穿过地面
-                    if hasattr(piece, 'chess_type') and piece.chess_type == ChessPieceType.GO_CHESS:
-                        # 地面位置
-                        ground_y = self.screen_height - 50
-                        # 如果围棋位置低于地面，将其拉回地面上方
-                        if y > ground_y - 20:  # 地面位置上方20像素
-                            piece.body.position = (x, ground_y - 20)
-                            piece.body.velocity = (piece.body.velocity.x, min(0, piece.body.velocity.y))
-                            # 增加一个向上的小力，帮助棋子弹起
-                            if piece.body.velocity.y > 0:
-                                piece.body.velocity = (piece.body.velocity.x, -50)
-                    
-                    # 如果速度太小，直接停止移动
-                    velocity_length = piece.body.velocity.length
-                    if velocity_length < 5:
-                        piece.body.velocity = (0, 0)
-                        piece.body.angular_velocity = 0
-        
-        # 检查弹射物是否超出边界
-        if self.projectile and hasattr(self.projectile, 'body') and hasattr(self.projectile.body, 'position'):
-            try:
-                x, y = self.projectile.body.position
-                
-                # 如果弹射物超出边界，将其拉回边界内
-                if x < left_bound:
-                    self.projectile.body.position = (left_bound, y)
-                    self.projectile.body.velocity = (0, self.projectile.body.velocity.y)
-                elif x > right_bound:
-                    self.projectile.body.position = (right_bound, y)
-                    self.projectile.body.velocity = (0, self.projectile.body.velocity.y)
-                    
-                if y < top_bound:
-                    self.projectile.body.position = (x, top_bound)
-                    self.projectile.body.velocity = (self.projectile.body.velocity.x, 0)
-                elif y > bottom_bound:
-                    self.projectile.body.position = (x, bottom_bound)
-                    self.projectile.body.velocity = (self.projectile.body.velocity.x, 0)
-            except Exception as e:
-                # 如果处理弹射物边界时出错，打印错误但不重置弹射物
-                print(f"处理弹射物边界时出错: {e}")
+                piece.save_transform()
+        if self.projectile:
+            self.projectile.save_transform()
         
     def handle_event(self, event):
         """处理游戏事件"""
+        # 快速回放时点击或按键跳过回放
+        if self.fast_replay_frames and event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
+            self.stop_fast_replay()
+            return
+        
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1:  # 左键
                 mouse_pos = pygame.mouse.get_pos()
@@ -529,11 +331,7 @@ class GameManager:
                             self.tip_timer = pygame.time.get_ticks()
                             return
                             
-                        # 设置战斗状态
-                        self.current_state = GameState.BATTLE
-                        self.active_player = 1
-                        self.prepare_battle_phase()
-                        print("进入战斗阶段")
+                        self.start_battle()
                     else:
                         # 创建并开始拖动一个新棋子
                         x, y = mouse_pos
@@ -543,7 +341,7 @@ class GameManager:
                             # 如果已经在拖动，确保先停止当前拖动
                             if self.dragging:
                                 print("警告：开始新拖动前先结束之前的拖动")
-                                self.stop_dragging()
+                                self.stop_dragging(mouse_pos)
                                 
                             self.start_dragging(x, y)
                             print(f"开始拖动{self.selected_chess_type.name}棋子")
@@ -551,18 +349,8 @@ class GameManager:
                 elif self.current_state == GameState.BATTLE:
                     # 检查是否已经有弹射物
                     if not self.projectile:
-                         # 获取鼠标位置
-                         mouse_pos = pygame.mouse.get_pos()
-                        
-                         # 确保鼠标位置在屏幕范围内
-                         x = max(30, min(mouse_pos[0], self.screen_width - 30))
-                         y = max(30, min(mouse_pos[1], self.screen_height - 100))
-                         
-                         # 创建铅笔弹射物在鼠标点击位置
-                         self.projectile = Projectile(x, y, self.space)
-                         # 设置为已放置但未开始充能
-                         self.projectile_placed = True
-                         print(f"玩家{self.active_player}添加了铅笔弹射物")
+                        # 创建铅笔弹射物在鼠标点击位置
+                        self.place_projectile(*mouse_pos)
                     else:
                         # 如果已经放置了弹射物但尚未开始充能
                         if self.projectile_placed and not self.charging:
@@ -576,23 +364,10 @@ class GameManager:
                                 self.charging = True
                                 self.shoot_strength = 0
                                 print(f"玩家{self.active_player}开始充能")
-                            else:
+                            elif not self.projectile_fired:
                                 # 如果弹射物无效，重置并创建新的
                                 print("检测到无效弹射物，重新创建")
-                                self.projectile = None
-                                self.projectile_placed = False
-                                
-                                # 获取鼠标位置
-                                mouse_pos = pygame.mouse.get_pos()
-                                
-                                # 确保鼠标位置在屏幕范围内
-                                x = max(30, min(mouse_pos[0], self.screen_width - 30))
-                                y = max(30, min(mouse_pos[1], self.screen_height - 100))
-                                
-                                # 创建新的铅笔弹射物
-                                self.projectile = Projectile(x, y, self.space)
-                                self.projectile_placed = True
-                                print(f"玩家{self.active_player}添加了新的铅笔弹射物")
+                                self.place_projectile(*mouse_pos)
                         else:
                             # 如果点击时弹射物已经在充能状态，不做任何处理
                             pass
@@ -601,25 +376,7 @@ class GameManager:
                     if (self.projectile_fired and self.ready_to_switch_player and
                         self.screen_width // 2 - 80 <= mouse_pos[0] <= self.screen_width // 2 + 80 and
                         100 <= mouse_pos[1] <= 140):
-                        # 切换玩家
-                        self.active_player = 2 if self.active_player == 1 else 1
-                        
-                        # 移除当前弹射物
-                        if self.projectile and hasattr(self.projectile, 'shape') and self.projectile.shape in self.space.shapes:
-                            self.space.remove(self.projectile.shape)
-                        if self.projectile and hasattr(self.projectile, 'body') and self.projectile.body in self.space.bodies:
-                            self.space.remove(self.projectile.body)
-                        
-                        # 重置弹射物相关状态
-                        self.projectile = None
-                        self.projectile_placed = False
-                        self.projectile_fired = False
-                        self.ready_to_switch_player = False
-                        # 切换玩家后重置稳定性检查
-                        self.pieces_stable = False
-                        self.stability_timer = 0
-                        self.charging = False
-                        self.shoot_strength = 0
+                        self.switch_player()
                     
                 # 如果是游戏结束状态，检查是否点击了返回主菜单
                 elif self.current_state == GameState.GAME_OVER:
@@ -632,77 +389,41 @@ class GameManager:
             if event.button == 1:
                 if self.dragging and self.current_state == GameState.BUILDING_PHASE:
                     # 放置拖动中的棋子
-                    self.stop_dragging()
+                    self.stop_dragging(pygame.mouse.get_pos())
                 
                 elif self.charging and self.current_state == GameState.BATTLE:
                     # 结束充能，发射弹射物
                     self.charging = False
                     mouse_pos = pygame.mouse.get_pos()
                     
-                    # 重置弹射物放置状态
                     # 计算发射方向
                     if self.projectile and hasattr(self.projectile, 'body') and hasattr(self.projectile.body, 'position'):
                         try:
                             dx = mouse_pos[0] - self.projectile.body.position.x
                             dy = mouse_pos[1] - self.projectile.body.position.y
                             
-                            # 确保方向向量不为零
-                            if abs(dx) < 0.001 and abs(dy) < 0.001:
-                                dx = 1.0  # 默认向右发射
-                                dy = 0.0
-                                
-                            angle = math.atan2(dy, dx)
-                            
-                            # 应用冲量发射弹射物
-                            strength = min(self.shoot_strength, self.max_strength)
-                            if strength <= 0:
-                                strength = 500  # 确保有最小强度
-                                
                             # 直接使用dx和dy作为方向向量，保持准确的射击方向
-                            direction_vector = pymunk.Vec2d(dx, dy)
-                            
-                            # 设置铅笔的角度与运动方向一致
-                            self.projectile.body.angle = angle
-                                
-                            self.projectile.apply_impulse(direction_vector, strength)
-                            # 使用direction_vector而不是已删除的dir_x和dir_y
-                            print(f"发射弹射物，方向: (dx={dx:.2f}, dy={dy:.2f})，强度: {strength}")
-                            
-                            # 标记弹射物已发射
-                            self.projectile_fired = True
-                            print(f"玩家{self.active_player}已发射弹射物，等待结束")
+                            self.fire(dx, dy, self.shoot_strength)
                         except Exception as e:
                             print(f"发射弹射物时出错: {e}")
                             # 不重置弹射物，只打印错误
                     elif self.projectile and not self.projectile_fired:  # 仅当弹射物存在但未发射且有问题时执行
                         # 如果弹射物无效（但未发射），重置状态并创建新的
                         print("弹射物无效，创建新的弹射物")
-                        # 获取鼠标位置
-                        x = max(30, min(mouse_pos[0], self.screen_width - 30))
-                        y = max(30, min(mouse_pos[1], self.screen_height - 100))
-                        
-                        # 创建新的铅笔弹射物
-                        self.projectile = Projectile(x, y, self.space)
-                        self.projectile_placed = True
+                        self.place_projectile(*mouse_pos)
         
         elif event.type == pygame.MOUSEMOTION:
             # 如果正在拖动棋子，更新棋子位置
             if self.dragging and self.drag_piece:
-                mouse_pos = pygame.mouse.get_pos()
-                # 考虑拖动偏移
-                self.drag_piece.body.position = (mouse_pos[0] - self.drag_offset[0], 
-                                               mouse_pos[1] - self.drag_offset[1])
+                self.move_drag(*pygame.mouse.get_pos())
         
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_1:
-                self.selected_chess_type = ChessPieceType.MILITARY_CHESS
-                print("选择军棋")
+                self.select_chess_type(ChessPieceType.MILITARY_CHESS)
             elif event.key == pygame.K_2:
-                self.selected_chess_type = ChessPieceType.CHINESE_CHESS
-                print("选择中国象棋")
+                self.select_chess_type(ChessPieceType.CHINESE_CHESS)
             elif event.key == pygame.K_3:
-                self.selected_chess_type = ChessPieceType.GO_CHESS
-                print("选择围棋")
+                self.select_chess_type(ChessPieceType.GO_CHESS)
             elif event.key == pygame.K_s and self.current_state == GameState.BUILDING_PHASE:
                 # 获取当前玩家的棋子计数
                 current_chess_counts = self.player1_chess_counts if self.current_player == 1 else self.player2_chess_counts
@@ -717,43 +438,10 @@ class GameManager:
                 
                 # 保存当前模型并切换玩家
                 if self.current_player == 1:
-                    print("玩家1完成建造，切换到玩家2")
-                    self.current_player = 2
-                    
-                    # 保存玩家1的模型状态
-                    self.player1_model_saved = True
-                    
-                    # 保存玩家1棋子的位置
-                    self.player1_positions_saved = []
-                    print(f"开始保存玩家1的棋子位置，总数: {len(self.player1_model.pieces)}")
-                    for i, piece in enumerate(self.player1_model.pieces):
-                        if hasattr(piece, 'body') and hasattr(piece.body, 'position'):
-                            # 保存当前位置
-                            pos = (piece.body.position.x, piece.body.position.y)
-                            self.player1_positions_saved.append(pos)
-                            print(f"保存玩家1棋子 {i}，类型: {piece.chess_type.name}，位置: {pos}")
-                        else:
-                            # 如果没有body或position，使用初始位置
-                            self.player1_positions_saved.append(piece.position)
-                            print(f"使用初始位置: {piece.position}")
-                    
-                    print(f"已保存玩家1的所有棋子位置，数量: {len(self.player1_positions_saved)}")
-                    
-                    # 临时移除玩家1的所有棋子，使其不影响玩家2的建造
-                    for piece in self.player1_model.pieces:
-                        if hasattr(piece, 'shape') and piece.shape in self.space.shapes:
-                            self.space.remove(piece.shape)
-                        if hasattr(piece, 'body') and piece.body in self.space.bodies:
-                            self.space.remove(piece.body)
-                    
-                    print(f"已临时移除玩家1的所有棋子，数量: {len(self.player1_model.pieces)}")
+                    self.finish_player1_building()
                 else:
                     print("玩家2完成建造，准备进入战斗阶段")
-                    self.current_state = GameState.BATTLE
-                    # 初始化战斗阶段
-                    self.active_player = 1  # 确保玩家1先攻击
-                    self.prepare_battle_phase()
-                    print("进入战斗阶段")
+                    self.start_battle()
             # 添加键盘快捷键进入战斗模式（用于调试）
             elif event.key == pygame.K_b and self.current_state != GameState.BATTLE:
                 # 检查两个玩家是否都放置了象棋
@@ -765,57 +453,244 @@ class GameManager:
                     return
                     
                 print("使用快捷键强制进入战斗阶段")
-                self.current_state = GameState.BATTLE
-                self.active_player = 1
-                self.prepare_battle_phase()
+                self.start_battle()
             # 添加调试绘制切换
             elif event.key == pygame.K_d:
                 self.debug_draw = not self.debug_draw
                 print(f"{'启用' if self.debug_draw else '禁用'}调试绘制")
+            # P键显示/隐藏帧耗时分析，O键把统计数据写入文件
+            elif event.key == pygame.K_p:
+                self.profiler.toggle()
+            elif event.key == pygame.K_o:
+                self.profiler.dump()
+            # F键切换发射后的结算方式
+            elif event.key == pygame.K_f:
+                self.cycle_resolve_mode()
+            # W键保存本局到目前为止的输入记录（游戏结束时会自动保存）
+            elif event.key == pygame.K_w:
+                self.save_recording()
+            # Z键撤销上一次放置
+            elif (event.key == pygame.K_z and self.current_state == GameState.BUILDING_PHASE
+                  and not self.dragging):
+                self.undo_last_placement()
+            # R键重试上一发：恢复到发射前的状态
+            elif (event.key == pygame.K_r
+                  and self.current_state in (GameState.BATTLE, GameState.GAME_OVER)):
+                self.retry_shot()
             # 添加旋转控制 - 方向键旋转当前拖动的棋子
             elif self.dragging and self.drag_piece:
                 rotation_step = 15  # 每次旋转15度
                 if event.key == pygame.K_LEFT:
-                    self.drag_piece.body.angle += math.radians(rotation_step)
-                    print(f"棋子逆时针旋转 {rotation_step} 度")
+                    self.rotate_drag(rotation_step)
                 elif event.key == pygame.K_RIGHT:
-                    self.drag_piece.body.angle -= math.radians(rotation_step)
-                    print(f"棋子顺时针旋转 {rotation_step} 度")
+                    self.rotate_drag(-rotation_step)
                 
+    def select_chess_type(self, chess_type):
+        """选择建造时新放置的棋子类型"""
+        self.record_input("select", chess_type=chess_type.name)
+        self.selected_chess_type = chess_type
+        chess_type_names = {
+            ChessPieceType.MILITARY_CHESS: "军棋",
+            ChessPieceType.CHINESE_CHESS: "中国象棋",
+            ChessPieceType.GO_CHESS: "围棋"
+        }
+        print(f"选择{chess_type_names[chess_type]}")
+        
+    def move_drag(self, x, y):
+        """把拖动中的棋子移到鼠标位置（考虑拖动偏移）"""
+        if not self.dragging or not self.drag_piece:
+            return
+        self.record_input("drag_move", x=x, y=y)
+        self.drag_piece.body.position = (x - self.drag_offset[0], y - self.drag_offset[1])
+        
+    def rotate_drag(self, degrees):
+        """旋转拖动中的棋子，正数为逆时针"""
+        if not self.dragging or not self.drag_piece:
+            return
+        self.record_input("rotate", degrees=degrees)
+        self.drag_piece.body.angle += math.radians(degrees)
+        print(f"棋子{'逆' if degrees > 0 else '顺'}时针旋转 {abs(degrees)} 度")
+        
+    def finish_player1_building(self):
+        """玩家1完成建造，切换到玩家2"""
+        self.record_input("finish_player1")
+        print("玩家1完成建造，切换到玩家2")
+        self.current_player = 2
+        
+        # 保存玩家1的棋子状态，并临时移出物理空间，使其不影响玩家2的建造
+        self.simulation.stash_player1_pieces()
+        # 玩家2不能撤销玩家1的操作
+        self.undo_stack = []
+        
+    def start_battle(self):
+        """进入战斗阶段，玩家1先攻击"""
+        self.record_input("start_battle")
+        self.current_state = GameState.BATTLE
+        self.active_player = 1
+        self.prepare_battle_phase()
+        print("进入战斗阶段")
+        
+    def place_projectile(self, x, y):
+        """在指定位置放置弹射物"""
+        self.record_input("place_projectile", x=x, y=y)
+        self.simulation.place_projectile(x, y)
+        
+    def fire(self, dx, dy, strength):
+        """按松开鼠标时的方向和充能力度发射弹射物"""
+        self.record_input("fire", dx=dx, dy=dy, strength=strength)
+        if self.simulation.fire(pymunk.Vec2d(dx, dy), strength) and self.resolve_mode != "realtime":
+            self.resolve_shot()
+        
+    def switch_player(self):
+        """切换玩家，移除当前弹射物并重置相关状态"""
+        self.record_input("switch_player")
+        self.simulation.switch_player()
+        self.charging = False
+        self.shoot_strength = 0
+        # 瞬间结算时也跳过切换玩家后的稳定等待，直接得到胜负判断的结果
+        if self.resolve_mode != "realtime":
+            steps = self.simulation.run_until_victory_check(self.RESOLVE_MAX_STEPS)
+            self.finish_resolve()
+            print(f"瞬间完成稳定检查，执行了 {steps} 个物理步")
+        
+    def cycle_resolve_mode(self):
+        """切换发射后的结算方式：实时 -> 瞬间结算 -> 瞬间结算+快速回放"""
+        index = self.RESOLVE_MODES.index(self.resolve_mode)
+        self.resolve_mode = self.RESOLVE_MODES[(index + 1) % len(self.RESOLVE_MODES)]
+        self.tip_message = f"结算方式: {self.RESOLVE_MODE_NAMES[self.resolve_mode]}"
+        self.tip_timer = pygame.time.get_ticks()
+        print(self.tip_message)
+        
+    def resolve_shot(self):
+        """瞬间结算已发射的一发：不绘制，全速推进模拟直到弹射物停止且所有棋子静止
+
+        快速回放模式下每隔FAST_REPLAY_STEPS_PER_FRAME步记录一次所有物体的位置，
+        结算完成后逐帧播放，之后显示结算后的状态
+        """
+        simulation = self.simulation
+        capture = self.resolve_mode == "replay"
+        chunk = self.FAST_REPLAY_STEPS_PER_FRAME if capture else self.RESOLVE_MAX_STEPS
+        frames = []
+        steps = 0
+        start = time.perf_counter()
+        while steps < self.RESOLVE_MAX_STEPS:
+            if capture:
+                frames.append(self.capture_transforms())
+            done = simulation.run_until_settled(min(chunk, self.RESOLVE_MAX_STEPS - steps))
+            steps += done
+            if done < chunk:
+                break
+        if capture:
+            frames.append(self.capture_transforms())
+            self.fast_replay_frames = frames
+            self.fast_replay_index = 0
+        self.finish_resolve()
+        print(f"瞬间结算完成，执行了 {steps} 个物理步，用时 {(time.perf_counter() - start) * 1000:.0f} 毫秒")
+        
+    def finish_resolve(self):
+        """瞬间结算之后从结算后的状态继续实时模拟，不在结算前后的位置之间插值"""
+        self.physics_accumulator = 0.0
+        self.render_alpha = 1.0
+        self.save_render_transforms()
+        
+    def capture_transforms(self):
+        """记录双方棋子和弹射物当前的位置和角度，用于快速回放"""
+        frame = []
+        for model in (self.player1_model, self.player2_model):
+            for piece in model.pieces:
+                x, y = piece.body.position
+                frame.append((piece, x, y, piece.body.angle))
+        if self.projectile:
+            x, y = self.projectile.body.position
+            frame.append((self.projectile, x, y, self.projectile.body.angle))
+        return frame
+        
+    def stop_fast_replay(self):
+        """结束快速回放，显示结算后的状态"""
+        self.fast_replay_frames = None
+        self.fast_replay_index = 0
+        self.physics_accumulator = 0.0
+        
+    def retry_shot(self):
+        """重试上一发：恢复到发射前的状态
+
+        Returns:
+            bool: 有可以重试的一发时返回True
+        """
+        self.record_input("retry")
+        if not self.simulation.retry_shot():
+            return False
+        self.current_state = GameState.BATTLE
+        self.charging = False
+        self.shoot_strength = 0
+        self.save_render_transforms()
+        print(f"重试玩家{self.active_player}的上一发")
+        return True
+        
+    def undo_last_placement(self):
+        """撤销当前玩家上一次放置或移动棋子，恢复到拖动开始前的状态"""
+        self.record_input("undo")
+        if not self.undo_stack:
+            self.tip_message = "没有可以撤销的操作"
+            self.tip_timer = pygame.time.get_ticks()
+            return
+        
+        snapshot, chess_counts = self.undo_stack.pop()
+        self.simulation.restore_snapshot(snapshot)
+        if self.current_player == 1:
+            self.player1_chess_counts = chess_counts
+        else:
+            self.player2_chess_counts = chess_counts
+        self.save_render_transforms()
+        print(f"撤销玩家{self.current_player}的上一次放置，剩余可撤销次数: {len(self.undo_stack)}")
+        
     def load_models(self):
         """加载已保存的模型"""
-        self.player1_model = ChessModel.load("player1_model", self.space) or ChessModel(1)
-        self.player2_model = ChessModel.load("player2_model", self.space) or ChessModel(2)
+        self.simulation.load_models("player1_model", "player2_model")
         
     def draw(self, screen):
         """绘制游戏场景"""
-        # 清除屏幕
-        screen.fill((200, 200, 200))
+        # 清除屏幕，主菜单、规则页和建造阶段的静态图层自带背景，不需要清除
+        if self.current_state not in (GameState.MAIN_MENU, GameState.RULES,
+                                      GameState.BUILDING_PHASE):
+            self.track(screen.fill((200, 200, 200)), "background")
         
         # 根据游戏状态绘制不同内容
         if self.current_state == GameState.MAIN_MENU:
-            self.draw_main_menu(screen)
+            with self.profiler.section("draw_main_menu"):
+                self.draw_main_menu(screen)
         elif self.current_state == GameState.BUILDING_PHASE:
             player_name = "玩家1" if self.current_player == 1 else "玩家2"
-            self.draw_building_phase(screen, player_name)
+            with self.profiler.section("draw_building_phase"):
+                self.draw_building_phase(screen, player_name)
         elif self.current_state == GameState.BATTLE:
-            self.draw_battle_phase(screen)
+            with self.profiler.section("draw_battle_phase"):
+                self.draw_battle_phase(screen)
         elif self.current_state == GameState.GAME_OVER:
-            self.draw_game_over(screen)
+            with self.profiler.section("draw_game_over"):
+                self.draw_game_over(screen)
         elif self.current_state == GameState.RULES:
-            self.draw_rules(screen)
+            with self.profiler.section("draw_rules"):
+                self.draw_rules(screen)
             
         # 在任何状态下都显示调试信息和快捷键提示
-        debug_info = self.small_font.render(f"当前状态: {self.current_state.name}", True, (100, 100, 100))
-        screen.blit(debug_info, (10, self.screen_height - 20))
+        debug_info = self.text_cache.render(self.small_font, f"当前状态: {self.current_state.name}",
+                                            True, (100, 100, 100))
+        self.blit(screen, debug_info, (10, self.screen_height - 20))
         
         # 调试绘制模式提示
-        debug_text = self.small_font.render("按D键切换调试绘制" if not self.debug_draw else "调试模式开启 (按D关闭)", True, (255, 0, 0) if self.debug_draw else (100, 100, 100))
-        screen.blit(debug_text, (self.screen_width - debug_text.get_width() - 10, self.screen_height - 20))
+        debug_text = self.text_cache.render(
+            self.small_font,
+            "按D键切换调试绘制" if not self.debug_draw else "调试模式开启 (按D关闭)",
+            True, (255, 0, 0) if self.debug_draw else (100, 100, 100))
+        self.blit(screen, debug_text,
+                  (self.screen_width - debug_text.get_width() - 10, self.screen_height - 20))
         
         if self.current_state != GameState.BATTLE:
-            debug_hint = self.small_font.render("按B键直接进入战斗模式", True, (100, 100, 100))
-            screen.blit(debug_hint, (self.screen_width - debug_hint.get_width() - 10, self.screen_height - 40))
+            debug_hint = self.text_cache.render(self.small_font, "按B键直接进入战斗模式", True,
+                                                (100, 100, 100))
+            self.blit(screen, debug_hint,
+                      (self.screen_width - debug_hint.get_width() - 10, self.screen_height - 40))
             
         # 如果启用了调试绘制，绘制所有物理对象
         if self.debug_draw:
@@ -824,33 +699,86 @@ class GameManager:
                 draw_options = pymunk.pygame_util.DrawOptions(screen)
                 # 设置绘制选项
                 draw_options.flags = pymunk.pygame_util.DrawOptions.DRAW_SHAPES | pymunk.pygame_util.DrawOptions.DRAW_COLLISION_POINTS
-                # 绘制整个物理空间
+                # 绘制整个物理空间，没有逐个登记，脏矩形模式下整屏更新
                 self.space.debug_draw(draw_options)
+                if self.dirty_rects is not None:
+                    self.dirty_rects.invalidate()
             except Exception as e:
                 print(f"调试绘制出错: {e}")
+        
+        # 帧耗时分析
+        if self.profiler.enabled:
+            self.track(self.profiler.draw_overlay(screen, self.small_font),
+                       self.profiler.stats_time)
             
-    def draw_main_menu(self, screen):
-        """绘制游戏主菜单"""
-        screen.fill((50, 50, 50))  # 深灰色背景
+    def blit(self, screen, surface, position, content=None):
+        """把图像绘制到屏幕上；脏矩形模式下登记绘制的区域
+        
+        Args:
+            screen: 屏幕
+            surface: 要绘制的图像
+            position: 左上角位置
+            content: 内容标识，为None时以图像本身作为标识
+            
+        Returns:
+            pygame.Rect: 绘制的区域
+        """
+        rect = screen.blit(surface, position)
+        if self.dirty_rects is not None:
+            self.dirty_rects.add(rect, surface if content is None else content)
+        return rect
+        
+    def track(self, rect, content):
+        """脏矩形模式下登记pygame绘制函数画出的区域，rect为绘制函数的返回值"""
+        if self.dirty_rects is not None:
+            self.dirty_rects.add(rect, content)
+        return rect
+        
+    def track_body(self, rect, item):
+        """脏矩形模式下登记棋子或弹射物的区域
+        
+        棋子以最近一次绘制的缓存图像作为内容，弹射物以绘制的位置和角度作为内容，
+        静止时不需要更新
+        """
+        if self.dirty_rects is None:
+            return
+        if isinstance(item, ChessPiece):
+            self.dirty_rects.add(rect, item.sprite)
+        else:
+            self.dirty_rects.add(rect, item.drawn_transform)
+            
+    def draw_static_layer(self, screen, name, build):
+        """绘制缓存的静态图层，没有缓存时先调用build(layer)绘制"""
+        layer = self.static_layers.get(name, (self.screen_width, self.screen_height), build)
+        return self.blit(screen, layer, (0, 0))
+        
+    def build_main_menu_layer(self, layer):
+        """绘制主菜单的背景、标题和按钮"""
+        layer.fill((50, 50, 50))  # 深灰色背景
         
         # 游戏标题
         title = self.font.render("棋子堡垒", True, (255, 255, 255))
-        screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 50))
+        layer.blit(title, (self.screen_width // 2 - title.get_width() // 2, 50))
         
         # 创建开始游戏按钮
-        pygame.draw.rect(screen, (100, 100, 255), (self.screen_width // 2 - 80, 150, 160, 40))
+        pygame.draw.rect(layer, (100, 100, 255), (self.screen_width // 2 - 80, 150, 160, 40))
         start_text = self.small_font.render("开始游戏", True, (255, 255, 255))
-        screen.blit(start_text, (self.screen_width // 2 - start_text.get_width() // 2, 158))
+        layer.blit(start_text, (self.screen_width // 2 - start_text.get_width() // 2, 158))
         
         # 创建游戏规则按钮
-        pygame.draw.rect(screen, (100, 100, 255), (self.screen_width // 2 - 80, 210, 160, 40))
+        pygame.draw.rect(layer, (100, 100, 255), (self.screen_width // 2 - 80, 210, 160, 40))
         rules_text = self.small_font.render("游戏规则", True, (255, 255, 255))
-        screen.blit(rules_text, (self.screen_width // 2 - rules_text.get_width() // 2, 218))
+        layer.blit(rules_text, (self.screen_width // 2 - rules_text.get_width() // 2, 218))
         
         # 创建退出游戏按钮
-        pygame.draw.rect(screen, (100, 100, 255), (self.screen_width // 2 - 80, 270, 160, 40))
+        pygame.draw.rect(layer, (100, 100, 255), (self.screen_width // 2 - 80, 270, 160, 40))
         exit_text = self.small_font.render("退出游戏", True, (255, 255, 255))
-        screen.blit(exit_text, (self.screen_width // 2 - exit_text.get_width() // 2, 278))
+        layer.blit(exit_text, (self.screen_width // 2 - exit_text.get_width() // 2, 278))
+        
+    def draw_main_menu(self, screen):
+        """绘制游戏主菜单"""
+        # 背景、标题和按钮都不变，使用缓存的静态图层
+        self.draw_static_layer(screen, "main_menu", self.build_main_menu_layer)
         
         # 检测鼠标点击
         if pygame.mouse.get_pressed()[0]:
@@ -872,44 +800,45 @@ class GameManager:
                 pygame.quit()
                 sys.exit()
         
-    def draw_building_phase(self, screen, player_name):
-        """绘制建造阶段界面"""
+    def build_building_layer(self, layer, player_name, show_player1_area):
+        """绘制建造阶段不变的部分：背景、标题、棋子示例、操作提示、按钮和地面
+        
+        Args:
+            layer: 要绘制的图层
+            player_name: 当前建造的玩家名称
+            show_player1_area: 是否用半透明背景标出玩家1的模型区域
+        """
+        layer.fill((200, 200, 200))
+        
         # 绘制玩家标题
         title = self.font.render(f"{player_name}建造阶段", True, (0, 0, 0))
-        screen.blit(title, (self.screen_width // 2 - 80, 10))
-        
-        # 获取当前玩家的棋子计数
-        current_chess_counts = self.player1_chess_counts if self.current_player == 1 else self.player2_chess_counts
+        layer.blit(title, (self.screen_width // 2 - 80, 10))
         
         # 如果是玩家2建造阶段，绘制玩家1的模型区域
-        if self.current_player == 2 and hasattr(self, 'player1_model_saved') and self.player1_model_saved:
+        if show_player1_area:
             # 绘制半透明背景，表示这是玩家1的模型区域
             overlay = pygame.Surface((self.screen_width // 2, self.screen_height), pygame.SRCALPHA)
             overlay.fill((200, 200, 200, 100))  # 半透明灰色背景
-            screen.blit(overlay, (0, 0))
+            layer.blit(overlay, (0, 0))
             
             # 添加提示文字
             hint = self.font.render("玩家1的模型（已保存）", True, (0, 0, 0))
-            screen.blit(hint, (self.screen_width // 4 - hint.get_width() // 2, self.screen_height // 2 - 20))
+            layer.blit(hint, (self.screen_width // 4 - hint.get_width() // 2,
+                              self.screen_height // 2 - 20))
             
             hint2 = self.small_font.render("请在右侧区域建造玩家2的模型", True, (0, 0, 0))
-            screen.blit(hint2, (self.screen_width // 4 - hint2.get_width() // 2, self.screen_height // 2 + 20))
+            layer.blit(hint2, (self.screen_width // 4 - hint2.get_width() // 2,
+                               self.screen_height // 2 + 20))
         
         # 绘制玩家可用的棋子类型
-        chess_types = [
-            ("军棋(1)", ChessPieceType.MILITARY_CHESS, (40, 40)),
-            ("象棋(2)", ChessPieceType.CHINESE_CHESS, (100, 40)),
-            ("围棋(3)", ChessPieceType.GO_CHESS, (160, 40))
-        ]
-        
-        for i, (name, chess_type, pos) in enumerate(chess_types):
+        for name, chess_type, pos in self.PALETTE:
             # 绘制棋子示例
             if chess_type == ChessPieceType.MILITARY_CHESS:
                 # 军棋是长方形
-                pygame.draw.rect(screen, (255, 0, 0), (pos[0]-18, pos[1]-11, 36, 22))
+                pygame.draw.rect(layer, (255, 0, 0), (pos[0]-18, pos[1]-11, 36, 22))
             elif chess_type == ChessPieceType.CHINESE_CHESS:
                 # 象棋是方形
-                pygame.draw.rect(screen, (0, 255, 0), (pos[0]-15, pos[1]-15, 30, 30))
+                pygame.draw.rect(layer, (0, 255, 0), (pos[0]-15, pos[1]-15, 30, 30))
             else:
                 # 围棋是三角形
                 points = [
@@ -917,132 +846,183 @@ class GameManager:
                     (pos[0]-15, pos[1]+15),
                     (pos[0]+15, pos[1]+15)
                 ]
-                pygame.draw.polygon(screen, (0, 0, 255), points)
+                pygame.draw.polygon(layer, (0, 0, 255), points)
                 
-            # 绘制名称和剩余数量
+            # 绘制名称
             text = self.small_font.render(name, True, (0, 0, 0))
-            screen.blit(text, (pos[0]-20, pos[1]+20))
-            
-            # 显示剩余数量
-            remaining = self.max_chess_counts[chess_type] - current_chess_counts[chess_type]
-            count_text = self.small_font.render(f"剩余: {remaining}/{self.max_chess_counts[chess_type]}", True, 
-                                              (0, 0, 0) if remaining > 0 else (255, 0, 0))
-            screen.blit(count_text, (pos[0]-20, pos[1]+35))
-            
-        # 显示当前选择的棋子类型
-        selected_text = self.small_font.render(f"当前选择: {self.selected_chess_type.name}", True, (0, 0, 0))
-        screen.blit(selected_text, (20, 80))
+            layer.blit(text, (pos[0]-20, pos[1]+20))
         
         # 绘制提示文本
         hint1 = self.small_font.render("拖放棋子到画面中以建造堡垒", True, (0, 0, 0))
-        screen.blit(hint1, (20, 100))
+        layer.blit(hint1, (20, 100))
         
         hint2 = self.small_font.render("按S键结束当前玩家建造并切换", True, (0, 0, 0))
-        screen.blit(hint2, (20, 120))
+        layer.blit(hint2, (20, 120))
+        
+        hint3 = self.small_font.render("按Z键撤销上一次放置", True, (0, 0, 0))
+        layer.blit(hint3, (20, 140))
         
         # 如果是玩家2，显示进入战斗的按钮
         if self.current_player == 2:
-            pygame.draw.rect(screen, (255, 100, 100), 
-                           (self.screen_width - 120, 70, 100, 30))
+            pygame.draw.rect(layer, (255, 100, 100), (self.screen_width - 120, 70, 100, 30))
             battle_text = self.small_font.render("进入战斗", True, (0, 0, 0))
-            screen.blit(battle_text, (self.screen_width - 100, 78))
+            layer.blit(battle_text, (self.screen_width - 100, 78))
         
         # 绘制地面
-        pygame.draw.line(screen, (0, 0, 0), 
-                        (0, self.screen_height - 50), 
-                        (self.screen_width, self.screen_height - 50), 5)
+        pygame.draw.line(layer, (0, 0, 0), 
+                         (0, self.screen_height - 50), 
+                         (self.screen_width, self.screen_height - 50), 5)
+        
+    def draw_building_phase(self, screen, player_name):
+        """绘制建造阶段界面"""
+        # 不变的部分使用缓存的静态图层，按当前玩家和是否显示玩家1的模型区域分别缓存
+        show_player1_area = (self.current_player == 2
+                             and bool(getattr(self, 'player1_model_saved', False)))
+        self.draw_static_layer(
+            screen, ("building_phase", self.current_player, show_player1_area),
+            lambda layer: self.build_building_layer(layer, player_name, show_player1_area))
+        
+        # 获取当前玩家的棋子计数
+        current_chess_counts = (self.player1_chess_counts if self.current_player == 1
+                                else self.player2_chess_counts)
+        
+        for name, chess_type, pos in self.PALETTE:
+            # 显示剩余数量
+            remaining = self.max_chess_counts[chess_type] - current_chess_counts[chess_type]
+            count_text = self.text_cache.render(
+                self.small_font, f"剩余: {remaining}/{self.max_chess_counts[chess_type]}", True,
+                (0, 0, 0) if remaining > 0 else (255, 0, 0))
+            self.blit(screen, count_text, (pos[0]-20, pos[1]+35))
+            
+        # 显示当前选择的棋子类型
+        selected_text = self.text_cache.render(
+            self.small_font, f"当前选择: {self.selected_chess_type.name}", True, (0, 0, 0))
+        self.blit(screen, selected_text, (20, 80))
         
         # 如果处于战斗阶段，显示棋子稳定状态
         if self.current_state == GameState.BATTLE and self.pieces_stable:
-            current_time = pygame.time.get_ticks()
-            stability_percent = min(100, int((current_time - self.stability_timer) / self.stability_check_duration * 100))
+            stability_percent = int(self.simulation.settle_detector.progress * 100)
             
-            stability_text = self.small_font.render(f"棋子稳定度: {stability_percent}%", True, (0, 0, 255))
-            screen.blit(stability_text, (self.screen_width // 2 - stability_text.get_width() // 2, 80))
+            stability_text = self.text_cache.render(
+                self.small_font, f"棋子稳定度: {stability_percent}%", True, (0, 0, 255))
+            self.blit(screen, stability_text,
+                      (self.screen_width // 2 - stability_text.get_width() // 2, 80))
                         
         # 绘制玩家棋子
         current_model = self.player1_model if self.current_player == 1 else self.player2_model
         for piece in current_model.pieces:
-            piece.draw(screen)
+            self.track_body(piece.draw(screen, alpha=self.render_alpha), piece)
             
         # 如果正在拖动棋子，绘制它
         if self.dragging and self.drag_piece:
-            ChessPiece.draw_at_body_position(screen, self.drag_piece, self.drag_piece.chess_type)
+            self.track_body(ChessPiece.draw_at_body_position(screen, self.drag_piece,
+                                                             self.drag_piece.chess_type),
+                            self.drag_piece)
             
         # 显示棋子数量
         pieces_count = len(current_model.pieces)
-        count_text = self.small_font.render(f"当前棋子数量: {pieces_count}", True, (0, 0, 0))
-        screen.blit(count_text, (20, self.screen_height - 30))
+        count_text = self.text_cache.render(self.small_font, f"当前棋子数量: {pieces_count}", True,
+                                            (0, 0, 0))
+        self.blit(screen, count_text, (20, self.screen_height - 30))
         
         # 显示提示信息
         if self.tip_message and pygame.time.get_ticks() - self.tip_timer < self.tip_duration:
-            # 创建半透明背景
-            tip_surface = pygame.Surface((self.screen_width, 40), pygame.SRCALPHA)
-            tip_surface.fill((0, 0, 0, 180))  # 黑色半透明背景
-            screen.blit(tip_surface, (0, self.screen_height // 2 - 20))
+            # 半透明背景
+            tip_surface = self.surface_pool.get((self.screen_width, 40), pygame.SRCALPHA,
+                                                (0, 0, 0, 180))  # 黑色半透明背景
+            self.blit(screen, tip_surface, (0, self.screen_height // 2 - 20))
             
             # 显示提示文本
-            tip_text = self.font.render(self.tip_message, True, (255, 255, 255))
-            screen.blit(tip_text, (self.screen_width // 2 - tip_text.get_width() // 2, 
+            tip_text = self.text_cache.render(self.font, self.tip_message, True, (255, 255, 255))
+            self.blit(screen, tip_text, (self.screen_width // 2 - tip_text.get_width() // 2, 
                                   self.screen_height // 2 - tip_text.get_height() // 2))
         
     def draw_battle_phase(self, screen):
         """绘制战斗阶段界面"""
         # 绘制战斗阶段标题
-        title = self.font.render(f"战斗阶段 - 玩家{self.active_player}回合", True, (0, 0, 0))
-        screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 10))
+        title = self.text_cache.render(self.font, f"战斗阶段 - 玩家{self.active_player}回合", True,
+                                       (0, 0, 0))
+        self.blit(screen, title, (self.screen_width // 2 - title.get_width() // 2, 10))
         
         # 添加提示文字
         if not self.projectile:
-            hint = self.font.render("点击屏幕添加铅笔弹射物", True, (255, 0, 0))
-            screen.blit(hint, (self.screen_width // 2 - hint.get_width() // 2, 40))
+            hint = self.text_cache.render(self.font, "点击屏幕添加铅笔弹射物", True, (255, 0, 0))
+            self.blit(screen, hint, (self.screen_width // 2 - hint.get_width() // 2, 40))
         elif self.projectile_placed and not self.charging:
-            hint = self.font.render("再次点击铅笔开始充能", True, (255, 0, 0))
-            screen.blit(hint, (self.screen_width // 2 - hint.get_width() // 2, 40))
+            hint = self.text_cache.render(self.font, "再次点击铅笔开始充能", True, (255, 0, 0))
+            self.blit(screen, hint, (self.screen_width // 2 - hint.get_width() // 2, 40))
         elif not self.charging:
             if self.projectile_fired and self.ready_to_switch_player:
                 pass  # 跳过提示，因为下面会显示"切换玩家"按钮
-            hint = self.font.render("放置铅笔后，点击铅笔开始充能", True, (255, 0, 0))
-            screen.blit(hint, (self.screen_width // 2 - hint.get_width() // 2, 40))
+            hint = self.text_cache.render(self.font, "放置铅笔后，点击铅笔开始充能", True, (255, 0, 0))
+            self.blit(screen, hint, (self.screen_width // 2 - hint.get_width() // 2, 40))
         else:
-            guide_text1 = self.font.render("松开鼠标发射铅笔", True, (0, 0, 255))
-            screen.blit(guide_text1, (self.screen_width // 2 - guide_text1.get_width() // 2, 40))
+            guide_text1 = self.text_cache.render(self.font, "松开鼠标发射铅笔", True, (0, 0, 255))
+            self.blit(screen, guide_text1,
+                      (self.screen_width // 2 - guide_text1.get_width() // 2, 40))
             
-            guide_text2 = self.font.render("玩家轮流攻击，直到一方模型散架", True, (0, 0, 255))
-            screen.blit(guide_text2, (self.screen_width // 2 - guide_text2.get_width() // 2, 60))
+            guide_text2 = self.text_cache.render(self.font, "玩家轮流攻击，直到一方模型散架", True, (0, 0, 255))
+            self.blit(screen, guide_text2,
+                      (self.screen_width // 2 - guide_text2.get_width() // 2, 60))
+        
+        # 当前的结算方式
+        mode_text = self.text_cache.render(self.small_font, 
+            f"按F键切换结算方式（当前: {self.RESOLVE_MODE_NAMES[self.resolve_mode]}）", True, (100, 100, 100))
+        self.blit(screen, mode_text, (10, self.screen_height - 40))
         
         # 如果弹射物已发射且已停止，显示"切换玩家"按钮
         if self.projectile_fired and self.ready_to_switch_player:
             # 绘制"切换玩家"按钮
-            pygame.draw.rect(screen, (100, 200, 100), (self.screen_width // 2 - 80, 100, 160, 40))
-            switch_text = self.font.render("切换玩家", True, (0, 0, 0))
-            screen.blit(switch_text, (self.screen_width // 2 - switch_text.get_width() // 2, 110))
+            self.track(pygame.draw.rect(screen, (100, 200, 100),
+                                        (self.screen_width // 2 - 80, 100, 160, 40)),
+                       "switch_button")
+            switch_text = self.text_cache.render(self.font, "切换玩家", True, (0, 0, 0))
+            self.blit(screen, switch_text,
+                      (self.screen_width // 2 - switch_text.get_width() // 2, 110))
             
             # 添加提示文本
-            info_text = self.small_font.render(f"点击按钮切换到玩家{2 if self.active_player == 1 else 1}", True, (0, 0, 0))
-            screen.blit(info_text, (self.screen_width // 2 - info_text.get_width() // 2, 150))
+            next_player = 2 if self.active_player == 1 else 1
+            info_text = self.text_cache.render(self.small_font, f"点击按钮切换到玩家{next_player}",
+                                               True, (0, 0, 0))
+            self.blit(screen, info_text, (self.screen_width // 2 - info_text.get_width() // 2, 150))
+            
+            retry_text = self.text_cache.render(self.small_font, "按R键重试这一发", True, (0, 0, 0))
+            self.blit(screen, retry_text,
+                      (self.screen_width // 2 - retry_text.get_width() // 2, 170))
+        
+        # 快速回放时按记录的位置绘制
+        if self.fast_replay_frames:
+            for item, x, y, angle in self.fast_replay_frames[self.fast_replay_index]:
+                self.track_body(item.draw(screen, transform=(x, y, angle)), item)
+            replay_text = self.text_cache.render(self.small_font, "快速回放中（点击或按任意键跳过）",
+                                                 True, (0, 0, 255))
+            self.blit(screen, replay_text,
+                      (self.screen_width // 2 - replay_text.get_width() // 2, 190))
+            return
         
         # 绘制两个玩家的模型
         for piece in self.player1_model.pieces:
-            piece.draw(screen)
+            self.track_body(piece.draw(screen, alpha=self.render_alpha), piece)
             
         for piece in self.player2_model.pieces:
-            piece.draw(screen)
+            self.track_body(piece.draw(screen, alpha=self.render_alpha), piece)
             
         # 绘制弹射物
         if self.projectile:
-            self.projectile.draw(screen)
+            self.track_body(self.projectile.draw(screen, alpha=self.render_alpha), self.projectile)
             
         # 如果正在充能，绘制充能条
         if self.charging:
             self.shoot_strength = min(self.shoot_strength + 50, self.max_strength)
             charge_percent = self.shoot_strength / self.max_strength
             
-            pygame.draw.rect(screen, (200, 200, 200), (30, 40, 150, 15))
-            pygame.draw.rect(screen, (255, 0, 0), (30, 40, int(150 * charge_percent), 15))
+            self.track(pygame.draw.rect(screen, (200, 200, 200), (30, 40, 150, 15)), "charge_bar")
+            self.track(pygame.draw.rect(screen, (255, 0, 0),
+                                        (30, 40, int(150 * charge_percent), 15)), "charge")
             
-            charge_text = self.font.render(f"力度: {int(charge_percent * 100)}%", True, (0, 0, 0))
-            screen.blit(charge_text, (190, 38))
+            charge_text = self.text_cache.render(self.font, f"力度: {int(charge_percent * 100)}%",
+                                                 True, (0, 0, 0))
+            self.blit(screen, charge_text, (190, 38))
 
             # 绘制方向指示线
             if self.projectile and hasattr(self.projectile, 'body') and hasattr(self.projectile.body, 'position'):
@@ -1053,9 +1033,10 @@ class GameManager:
                         print("警告：绘制方向指示线时检测到无效的弹射物位置")
                     else:
                         mouse_pos = pygame.mouse.get_pos()
-                        pygame.draw.line(screen, (255, 0, 0), 
-                                      (int(self.projectile.body.position.x), int(self.projectile.body.position.y)),
-                                      mouse_pos, 2)
+                        self.track(pygame.draw.line(screen, (255, 0, 0), 
+                                                    (int(self.projectile.body.position.x),
+                                                     int(self.projectile.body.position.y)),
+                                                    mouse_pos, 2), "aim_line")
                 except Exception as e:
                     print(f"绘制方向指示线时出错: {e}")
                     # 不重置弹射物，只打印错误
@@ -1063,13 +1044,15 @@ class GameManager:
     def draw_game_over(self, screen):
         """绘制游戏结束界面"""
         # 绘制半透明背景
-        overlay = pygame.Surface((self.screen_width, self.screen_height), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))  # 半透明黑色背景
-        screen.blit(overlay, (0, 0))
+        overlay = self.surface_pool.get((self.screen_width, self.screen_height), pygame.SRCALPHA,
+                                        (0, 0, 0, 128))  # 半透明黑色背景
+        self.blit(screen, overlay, (0, 0))
         
         # 绘制胜利标题
-        title = self.font.render(f"游戏结束! 玩家{self.winner}获胜!", True, (255, 255, 255))
-        screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, self.screen_height // 2 - 60))
+        title = self.text_cache.render(self.font, f"游戏结束! 玩家{self.winner}获胜!", True,
+                                       (255, 255, 255))
+        self.blit(screen, title,
+                  (self.screen_width // 2 - title.get_width() // 2, self.screen_height // 2 - 60))
         
         # 绘制游戏结果描述
         if self.winner == 1:
@@ -1077,15 +1060,18 @@ class GameManager:
         else:
             result_text = "玩家2的棋子堡垒坚固稳定，成功击溃了对手的防线!"
             
-        result = self.font.render(result_text, True, (255, 255, 255))
-        screen.blit(result, (self.screen_width // 2 - result.get_width() // 2, 
+        result = self.text_cache.render(self.font, result_text, True, (255, 255, 255))
+        self.blit(screen, result, (self.screen_width // 2 - result.get_width() // 2, 
                              self.screen_height // 2 - 20))
         
         
         # 绘制返回主菜单按钮
-        pygame.draw.rect(screen, (100, 100, 255), (self.screen_width // 2 - 80, self.screen_height // 2 + 30, 160, 40))
-        menu_text = self.font.render("返回主菜单", True, (255, 255, 255))
-        screen.blit(menu_text, (self.screen_width // 2 - menu_text.get_width() // 2, 
+        self.track(pygame.draw.rect(screen, (100, 100, 255),
+                                    (self.screen_width // 2 - 80, self.screen_height // 2 + 30,
+                                     160, 40)),
+                   "button")
+        menu_text = self.text_cache.render(self.font, "返回主菜单", True, (255, 255, 255))
+        self.blit(screen, menu_text, (self.screen_width // 2 - menu_text.get_width() // 2, 
                               self.screen_height // 2 + 30 + (40 - menu_text.get_height()) // 2))
         
         # 检查点击返回主菜单
@@ -1097,45 +1083,28 @@ class GameManager:
                 
     def reset_game(self):
         """重置游戏到初始状态"""
-        # 清除所有物理对象
-        self.space = pymunk.Space()
-        self.space.gravity = (0, 400)  # 增强重力效果，使笔芯运动更加真实
-        self.space.damping = 0.85  # 进一步减小阻尼，使物体运动更流畅
-        
-        # 重新设置碰撞处理器
-        self.space.add_collision_handler(3, 0).begin = self.go_chess_ground_collision_handler
-        self.space.add_collision_handler(self.projectile_collision_type, self.ground_collision_type).begin = self.projectile_ground_collision_handler
-        # 重新添加弹射物与各类棋子的碰撞处理器
-        self.space.add_collision_handler(self.projectile_collision_type, self.player1_chess_collision_type).begin = self.projectile_player1_collision_handler
-        self.space.add_collision_handler(self.projectile_collision_type, self.player2_chess_collision_type).begin = self.projectile_player2_collision_handler
-        self.space.add_collision_handler(self.projectile_collision_type, self.go_chess_collision_type).begin = self.projectile_go_chess_collision_handler
-        
-        # 重新创建地面
-        self.create_ground()
-        
-        # 重置玩家模型
-        self.player1_model = ChessModel(1)
-        self.player2_model = ChessModel(2)
+        # 创建新的模拟器，清除所有物理对象并重置模型和战斗状态
+        self.simulation = self.create_simulation()
+        self.recorder = self.create_recorder()
         
         # 重置游戏状态
         self.current_state = GameState.MAIN_MENU
-        self.active_player = 1
-        self.projectile = None
+        self.current_player = 1
         
         # 重置拖放状态
         self.dragging = False
         self.drag_piece = None
         self.drag_offset = (0, 0)
         
-        # 重置弹射物状态
-        self.projectile_fired = False
-        self.ready_to_switch_player = False
-        
-        # 重置稳定性检查
-        self.pieces_stable = False
-        self.stability_timer = 0
-        self.projectile_placed = False
+        # 重置充能状态
+        self.charging = False
+        self.shoot_strength = 0
         self.is_dragging_existing_piece = False
+        self.stop_fast_replay()
+        
+        # 清空撤销记录
+        self.undo_stack = []
+        self.drag_undo_entry = None
         
         # 重置棋子计数
         self.player1_chess_counts = {
@@ -1157,6 +1126,10 @@ class GameManager:
         self.dragging = False
         self.drag_piece = None
         
+        # 战斗阶段不再撤销建造操作
+        self.undo_stack = []
+        self.drag_undo_entry = None
+        
         # 初始化棋子计数
         self.player1_chess_counts = {
             ChessPieceType.MILITARY_CHESS: 0,
@@ -1169,153 +1142,14 @@ class GameManager:
             ChessPieceType.GO_CHESS: 0
         }
         
-        # 重新添加玩家1的棋子到物理空间（如果之前被移除）
-        if self.player1_model_saved:
-            # 使用保存的位置重新创建棋子
-            print(f"使用保存的位置重新创建玩家1的棋子，数量: {len(self.player1_positions_saved)}")
-            
-            # 显示当前玩家1模型信息，方便调试
-            for i, piece in enumerate(self.player1_model.pieces):
-                if hasattr(piece, 'chess_type'):
-                    print(f"[重建前] 玩家1棋子 {i}，类型: {piece.chess_type.name}，ID: {piece.player_id}")
-            
-            # 确保玩家1的棋子数量与保存的位置数量一致
-            if len(self.player1_model.pieces) != len(self.player1_positions_saved):
-                print(f"警告：玩家1棋子数量({len(self.player1_model.pieces)})与保存的位置数量({len(self.player1_positions_saved)})不一致")
-            
-            # 清除所有现有的物理对象
-            print("[调试] 开始清除玩家1的物理对象")
-            for piece in self.player1_model.pieces:
-                if hasattr(piece, 'shape') and piece.shape in self.space.shapes:
-                    self.space.remove(piece.shape)
-                if hasattr(piece, 'body') and piece.body in self.space.bodies:
-                    self.space.remove(piece.body)
-            print("[调试] 完成清除玩家1的物理对象")
-            
-            # 使用保存的位置重新创建物理对象
-            for i, piece in enumerate(self.player1_model.pieces):
-                if i < len(self.player1_positions_saved):
-                    saved_pos = self.player1_positions_saved[i]
-                    print(f"重建玩家1棋子 {i}，类型: {piece.chess_type.name}，位置: {saved_pos}")
-                    
-                    # 创建新的物理体和形状
-                    if piece.chess_type == ChessPieceType.MILITARY_CHESS:
-                        # 军棋（长方形）
-                        width, height = piece.radius*2.5, piece.radius*1.5
-                        moment = pymunk.moment_for_box(20.0, (width, height))
-                        piece.body = pymunk.Body(20.0, moment)
-                        piece.body.position = saved_pos
-                        piece.shape = pymunk.Poly.create_box(piece.body, (width, height))
-                    elif piece.chess_type == ChessPieceType.CHINESE_CHESS:
-                        # 象棋（方形）
-                        size = piece.radius*2
-                        moment = pymunk.moment_for_box(20.0, (size, size))
-                        piece.body = pymunk.Body(20.0, moment)
-                        piece.body.position = saved_pos
-                        piece.shape = pymunk.Poly.create_box(piece.body, (size, size))
-                    elif piece.chess_type == ChessPieceType.GO_CHESS:
-                        # 围棋（三角形）
-                        triangle_vertices = [
-                            (-piece.radius*1.2, piece.radius),
-                            (piece.radius*1.2, piece.radius),
-                            (0, -piece.radius)
-                        ]
-                        moment = pymunk.moment_for_poly(20.0, triangle_vertices, (0, 0))
-                        piece.body = pymunk.Body(20.0, moment)
-                        piece.body.position = saved_pos
-                        piece.shape = pymunk.Poly(piece.body, triangle_vertices)
-                        piece.shape.collision_type = 3  # 围棋特殊碰撞类型
-                    else:
-                        # 对于非围棋棋子，设置玩家1的碰撞类型
-                        piece.shape.collision_type = 1  # 玩家1的碰撞类型
-                    
-                    # 明确设置玩家ID，确保ChessModel.add_piece能正确处理
-                    piece.player_id = 1
-                    
-                    # 设置物理属性
-                    piece.shape.friction = 0.7
-                    piece.shape.elasticity = 0.3
-                    
-                    # 设置碰撞过滤器，使所有棋子都能相互碰撞
-                    piece.shape.filter = pymunk.ShapeFilter(
-                        categories=0x1,  # 玩家1类别
-                        mask=0x4 | 0x1 | 0x2 | 0x3 | 0x8  # 地面、玩家1、玩家2、围棋类别和弹射物
-                    )
-                    # 明确打印碰撞类型
-                    print(f"玩家1棋子 {i} ({piece.chess_type.name}) 碰撞类型设为: {piece.shape.collision_type}, 类别掩码: {piece.shape.filter.mask}")
-                    
-                    # 添加到物理空间
-                    self.space.add(piece.body, piece.shape)
-                else:
-                    print(f"警告：玩家1棋子索引{i}没有对应的保存位置")
-            
-            self.player1_model_saved = False
-        else:
-            print("警告：没有找到玩家1的保存模型，无法正确重建")
-            # 重新启用玩家1棋子的碰撞和动态特性
-            for piece in self.player1_model.pieces:
-                if hasattr(piece, 'shape'):
-                    # 恢复碰撞过滤器，使所有棋子都能相互碰撞
-                    piece.shape.filter = pymunk.ShapeFilter(
-                        categories=0x1,  # 玩家1类别
-                        mask=0x4 | 0x1 | 0x2 | 0x3 | 0x8  # 地面、玩家1、玩家2、围棋类别和弹射物
-                    )
-                    # 将玩家1的棋子恢复为动态
-                    piece.body.body_type = pymunk.Body.DYNAMIC
-        
-        # 确保玩家2的棋子正确设置碰撞类型和物理属性
-        print(f"玩家2棋子处理开始，总数: {len(self.player2_model.pieces)}")
-        for i, piece in enumerate(self.player2_model.pieces):
-            if hasattr(piece, 'shape'):
-                try:
-                    # 首先确保玩家ID正确设置
-                    piece.player_id = 2
-                    
-                    # 确保为围棋类型的棋子设置特殊碰撞类型
-                    if piece.chess_type == ChessPieceType.GO_CHESS:
-                        piece.shape.collision_type = 3  # 围棋特殊碰撞类型
-                        print(f"玩家2围棋碰撞类型设为: {piece.shape.collision_type}")
-                    else:
-                        # 对于非围棋棋子，明确设置为玩家2的碰撞类型
-                        piece.shape.collision_type = 2  # 玩家2的碰撞类型
-                        print(f"玩家2棋子碰撞类型设为: {piece.shape.collision_type}")
-                    
-                    # 重新设置碰撞过滤器，确保能够与弹射物和其他棋子正确碰撞
-                    piece.shape.filter = pymunk.ShapeFilter(
-                        categories=0x2,  # 玩家2类别
-                        mask=0x4 | 0x1 | 0x2 | 0x3 | 0x8  # 地面、玩家1、玩家2、围棋类别和弹射物
-                    )
-                    
-                    # 统一设置与玩家1相同的物理属性
-                    piece.shape.friction = 0.7  # 与玩家1相同的摩擦力
-                    piece.shape.elasticity = 0.2  # 与玩家1相同的弹性
-                    
-                    # 确保玩家2的棋子是动态的
-                    piece.body.body_type = pymunk.Body.DYNAMIC
-                        
-                    # 调试信息，打印每个棋子的详细信息
-                    print(f"[调试] 玩家2棋子 {i}, 类型: {piece.chess_type.name}, 碰撞类型: {piece.shape.collision_type}, 玩家ID: {piece.player_id}")
-                except Exception as e:
-                    print(f"处理玩家2棋子 {i} 时出错: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    
-        # 清除任何现有的弹射物
-        self.projectile = None
+        # 恢复玩家1的棋子，设置双方棋子的碰撞属性并重置弹射物状态
+        self.simulation.prepare_battle()
         self.charging = False
-        # 重置弹射物状态
-        self.projectile_fired = False
-        self.ready_to_switch_player = False
-        
-        # 重置稳定性检查
-        self.pieces_stable = False 
-        self.stability_timer = 0
-        self.projectile_placed = False
         self.shoot_strength = 0
-        print("战斗阶段准备完毕，等待棋子稳定后开始胜负判定")
 
     def start_dragging(self, x, y):
         """开始拖动一个棋子，如果点击在已有棋子上则移动该棋子，否则创建新棋子"""
+        self.record_input("drag_start", x=x, y=y)
         # 获取当前玩家模型
         current_model = self.player1_model if self.current_player == 1 else self.player2_model
         current_chess_counts = self.player1_chess_counts if self.current_player == 1 else self.player2_chess_counts
@@ -1346,12 +1180,15 @@ class GameManager:
                         clicked_piece = piece
                         break
         
+        # 记录拖动开始前的状态，放置成功后可以撤销
+        undo_entry = (self.simulation.take_snapshot(), dict(current_chess_counts))
+        
         if clicked_piece:
             # 如果点击在已有棋子上，设置为拖动该棋子
             print(f"开始拖动已有棋子，位置: ({x}, {y}), 类型: {clicked_piece.chess_type.name}")
             
-            # 从模型中移除该棋子（暂时）
-            current_model.pieces.remove(clicked_piece)
+            # 从模型中移除该棋子（暂时），同时移除形状索引
+            current_model.remove_piece(clicked_piece)
             
             # 从计数中减去该棋子（暂时）
             current_chess_counts[clicked_piece.chess_type] -= 1
@@ -1365,6 +1202,7 @@ class GameManager:
             # 设置拖动状态
             self.dragging = True
             self.is_dragging_existing_piece = True
+            self.drag_undo_entry = undo_entry
         else:
             # 如果点击在空白处，检查是否达到该类型棋子的数量限制
             if current_chess_counts[self.selected_chess_type] >= self.max_chess_counts[self.selected_chess_type]:
@@ -1394,11 +1232,20 @@ class GameManager:
             # 设置拖动状态
             self.dragging = True
             self.is_dragging_existing_piece = False
+            self.drag_undo_entry = undo_entry
             
             print(f"开始拖动新棋子，初始位置: ({x}, {y}), 类型: {self.selected_chess_type.name}")
 
-    def stop_dragging(self):
-        """结束棋子拖动操作，放置当前拖动中的棋子"""
+    def stop_dragging(self, mouse_pos=None):
+        """结束棋子拖动操作，放置当前拖动中的棋子
+        
+        Args:
+            mouse_pos: 放下棋子的位置，默认为当前鼠标位置
+        """
+        if mouse_pos is None:
+            mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = tuple(mouse_pos)
+        self.record_input("drop", x=mouse_pos[0], y=mouse_pos[1])
         print("尝试放置棋子...")
         
         if not self.dragging or not self.drag_piece:
@@ -1407,9 +1254,6 @@ class GameManager:
             self.drag_piece = None
             return
             
-        # 获取拖放位置
-        mouse_pos = pygame.mouse.get_pos()
-        
         # 检查是否位于游戏区域内
         if mouse_pos[1] >= self.screen_height - 50:
             # 如果拖到了底部区域，放弃放置该棋子
@@ -1430,6 +1274,7 @@ class GameManager:
             
             self.dragging = False
             self.drag_piece = None
+            self.drag_undo_entry = None
             return
         
         print(f"拖放完成，位置: {mouse_pos}")
@@ -1515,6 +1360,11 @@ class GameManager:
             except Exception as e:
                 print(f"创建新棋子时出错: {e}")
         
+        # 放置成功，记录撤销点
+        if self.drag_undo_entry is not None:
+            self.undo_stack.append(self.drag_undo_entry)
+            self.drag_undo_entry = None
+        
         # 重置拖动状态
         self.dragging = False
         self.drag_piece = None
@@ -1524,13 +1374,13 @@ class GameManager:
         current_model = self.player1_model if self.current_player == 1 else self.player2_model
         print(f"拖放完成后当前模型棋子数: {len(current_model.pieces)}")
 
-    def draw_rules(self, screen):
-        """绘制游戏规则页面"""
-        screen.fill((50, 50, 50))  # 深灰色背景
+    def build_rules_layer(self, layer):
+        """绘制规则页面的背景、标题、规则内容和返回按钮"""
+        layer.fill((50, 50, 50))  # 深灰色背景
         
         # 标题
         title = self.font.render("游戏规则", True, (255, 255, 255))
-        screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 30))
+        layer.blit(title, (self.screen_width // 2 - title.get_width() // 2, 30))
         
         # 规则内容
         rules = [
@@ -1547,13 +1397,18 @@ class GameManager:
         y_pos = 80
         for rule in rules:
             rule_text = self.small_font.render(rule, True, (255, 255, 255))
-            screen.blit(rule_text, (self.screen_width // 2 - 150, y_pos))
+            layer.blit(rule_text, (self.screen_width // 2 - 150, y_pos))
             y_pos += 30
         
         # 返回按钮
-        pygame.draw.rect(screen, (100, 100, 255), (self.screen_width // 2 - 60, 350, 120, 40))
+        pygame.draw.rect(layer, (100, 100, 255), (self.screen_width // 2 - 60, 350, 120, 40))
         back_text = self.small_font.render("返回", True, (255, 255, 255))
-        screen.blit(back_text, (self.screen_width // 2 - back_text.get_width() // 2, 358))
+        layer.blit(back_text, (self.screen_width // 2 - back_text.get_width() // 2, 358))
+        
+    def draw_rules(self, screen):
+        """绘制游戏规则页面"""
+        # 页面内容都不变，使用缓存的静态图层
+        self.draw_static_layer(screen, "rules", self.build_rules_layer)
         
         # 检测鼠标点击
         if pygame.mouse.get_pressed()[0]:
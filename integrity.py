@@ -0,0 +1,115 @@
+# 并查集
+class UnionFind:
+    """带路径压缩和按大小合并的并查集，元素在第一次使用时自动加入"""
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item):
+        """返回元素所在集合的代表元素"""
+        parent = self.parent
+        if item not in parent:
+            parent[item] = item
+            self.size[item] = 1
+            return item
+        root = item
+        while parent[root] is not root:
+            # 路径减半
+            parent[root] = parent[parent[root]]
+            root = parent[root]
+        return root
+
+    def union(self, item_a, item_b):
+        """合并两个元素所在的集合
+
+        Returns:
+            int: 合并后集合的大小
+        """
+        root_a = self.find(item_a)
+        root_b = self.find(item_b)
+        if root_a is root_b:
+            return self.size[root_a]
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return self.size[root_a]
+
+    def clear(self):
+        self.parent.clear()
+        self.size.clear()
+
+# 堡垒结构完整度
+class StructuralIntegrity:
+    """用并查集统计每个玩家的棋子连成了几块
+
+    只有同一玩家的两个棋子接触时才合并，完整度为最大连通块的棋子数占该玩家棋子总数的比例。
+    棋子开始接触时直接合并；并查集不支持拆分，所以棋子分开时只做标记，
+    下次查询时再根据接触图重建。静止的堡垒没有分开事件，每步查询只是读取缓存的结果
+    """
+    def __init__(self, registry, contact_graph):
+        """
+        Args:
+            registry: PieceRegistry，用于找到形状所属的玩家
+            contact_graph: ContactGraph，重建时使用的接触关系
+        """
+        self.registry = registry
+        self.contact_graph = contact_graph
+        self.components = UnionFind()
+        self.largest = {}  # player_id -> 最大连通块的棋子数
+        self.dirty = True
+
+    def on_contact_begin(self, shape_a, shape_b):
+        """两个形状开始接触：同一玩家的棋子合并为一块"""
+        if self.dirty:
+            return
+        _, player_a = self.registry.lookup(shape_a)
+        if player_a is None:
+            return
+        _, player_b = self.registry.lookup(shape_b)
+        if player_a != player_b:
+            return
+        size = self.components.union(shape_a, shape_b)
+        if size > self.largest.get(player_a, 1):
+            self.largest[player_a] = size
+
+    def on_contact_separate(self, shape_a, shape_b):
+        """两个形状分开：同一玩家的棋子分开时需要重建"""
+        if self.dirty:
+            return
+        _, player_a = self.registry.lookup(shape_a)
+        if player_a is not None and player_a == self.registry.lookup(shape_b)[1]:
+            self.dirty = True
+
+    def mark_dirty(self):
+        """棋子列表或登记发生变化后调用，下次查询时重建"""
+        self.dirty = True
+
+    def rebuild(self):
+        """根据接触图重新计算所有连通块"""
+        self.components.clear()
+        self.largest = {}
+        for shape, (piece, player_id) in self.registry.entries.items():
+            self.components.find(shape)
+            for other in self.contact_graph.neighbors(shape):
+                if self.registry.lookup(other)[1] == player_id:
+                    size = self.components.union(shape, other)
+                    if size > self.largest.get(player_id, 1):
+                        self.largest[player_id] = size
+        self.dirty = False
+
+    def get_integrity(self, model):
+        """返回模型的结构完整度
+
+        Args:
+            model: ChessModel
+
+        Returns:
+            float: 最大连通块的棋子数 / 棋子总数，没有棋子时返回0.0
+        """
+        total = len(model.pieces)
+        if total == 0:
+            return 0.0
+        if self.dirty:
+            self.rebuild()
+        return min(self.largest.get(model.player_id, 1), total) / total
@@ -1,22 +1,51 @@
+import time
+STARTUP_TIME = time.perf_counter()  # 启动耗时分析的起点，在导入其他模块之前记录
+
+import argparse
 import pygame
 import sys
-from game_states import GameManager, GameState
+from game_states import GameManager
+from dirty_rects import DirtyRectTracker
+from frame_scheduler import FrameScheduler
+from profiler import StartupProfiler
 
 def main():
-    # 初始化pygame
-    pygame.init()
+    parser = argparse.ArgumentParser(description="棋子堡垒对战游戏")
+    parser.add_argument("--large-fortress", action="store_true",
+                        help="大型堡垒模式：每个玩家可以放置数百个棋子")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="只把变化的区域推送到显示器，适合软件渲染的虚拟机和低功耗显示设备")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="打印从启动到第一次显示画面之间各阶段的耗时")
+    args = parser.parse_args()
+    startup = StartupProfiler(STARTUP_TIME) if args.startup_profile else None
+    if startup:
+        startup.mark("导入模块")
+    
+    # 只初始化用到的显示和字体模块，不初始化音频、手柄等
+    pygame.display.init()
+    pygame.font.init()
+    if startup:
+        startup.mark("pygame初始化")
     
     # 设置游戏窗口
     screen_width = 800
     screen_height = 600
     screen = pygame.display.set_mode((screen_width, screen_height))
     pygame.display.set_caption("棋子堡垒对战游戏")
+    if startup:
+        startup.mark("创建窗口")
     
     # 创建游戏管理器
-    game_manager = GameManager(screen_width, screen_height)
+    game_manager = GameManager(screen_width, screen_height, large_fortress=args.large_fortress)
+    if args.dirty_rects:
+        game_manager.dirty_rects = DirtyRectTracker((screen_width, screen_height))
+    if startup:
+        startup.mark("创建GameManager")
     
-    # 设置游戏时钟
-    clock = pygame.time.Clock()
+    # 帧调度：有变化时60 FPS，空闲时降低帧率
+    scheduler = FrameScheduler()
+    frame_time = 1 / 60.0  # 第一帧按60 FPS计算
     
     # 记录前一个游戏状态以检测状态变化
     previous_state = game_manager.current_state
@@ -24,29 +53,44 @@ def main():
     
     # 游戏主循环
     while True:
+        game_manager.profiler.begin_frame()
+        
         # 检测状态变化
         if game_manager.current_state != previous_state:
             print(f"游戏状态从 {previous_state} 变为 {game_manager.current_state}")
             previous_state = game_manager.current_state
             
         # 处理事件
-        for event in pygame.event.get():
+        for event in scheduler.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             game_manager.handle_event(event)
             
-        # 更新游戏状态
-        game_manager.update(1/60.0)  # 60 FPS
+        # 更新游戏状态，使用上一帧实际经过的时间
+        game_manager.update(frame_time)
+        if startup:
+            startup.mark("首帧更新")
         
-        # 绘制游戏
+        # 绘制游戏（第一帧加载字体并合成静态图层）
         game_manager.draw(screen)
+        if startup:
+            startup.mark("首帧绘制")
         
         # 更新屏幕
-        pygame.display.flip()
+        with game_manager.profiler.section("flip"):
+            if game_manager.dirty_rects is not None:
+                game_manager.dirty_rects.present()
+            else:
+                pygame.display.flip()
+        game_manager.profiler.end_frame()
+        if startup:
+            startup.mark("首次显示")
+            startup.report()
+            startup = None
         
-        # 控制帧率
-        clock.tick(60)
+        # 控制帧率，并记录本帧实际耗时（秒）
+        frame_time = scheduler.tick(game_manager.is_idle())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
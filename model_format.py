@@ -0,0 +1,287 @@
+import argparse
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import weakref
+
+# 文件格式（小端）：
+#   文件头 HEADER：魔数、版本、玩家、保留、棋子数量
+#   棋子   PIECE：棋子类型的值、玩家、x、y、角度（32位浮点数），紧接文件头连续存放，共"棋子数量"条
+# 旧版本用pickle保存字典{'player_id', 'pieces': [{'position', 'chess_type', 'angle'}]}，
+# 更早的版本中棋子为(x, y, 类型)元组；旧文件仍可读取，用migrate命令转换为新格式
+HEADER = struct.Struct("<4sHBBI")
+PIECE = struct.Struct("<BBfff")
+
+MAGIC = b"CFMD"
+VERSION = 1
+
+def pack_model(player_id, pieces):
+    """把模型编码为二进制格式
+
+    Args:
+        player_id: 模型所属玩家
+        pieces: (棋子类型的值, 玩家, x, y, 角度)的序列
+
+    Returns:
+        bytes: 文件内容
+    """
+    pieces = list(pieces)
+    data = bytearray(HEADER.size + PIECE.size * len(pieces))
+    HEADER.pack_into(data, 0, MAGIC, VERSION, player_id, 0, len(pieces))
+    offset = HEADER.size
+    for piece in pieces:
+        PIECE.pack_into(data, offset, *piece)
+        offset += PIECE.size
+    return bytes(data)
+
+def write_model(path, player_id, pieces):
+    """把模型写入文件，先写临时文件再替换，写入失败时不会留下不完整的文件
+
+    Args:
+        path: 文件路径（含.model后缀）
+        player_id: 模型所属玩家
+        pieces: (棋子类型的值, 玩家, x, y, 角度)的序列
+    """
+    data = pack_model(player_id, pieces)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def is_binary_model(path):
+    """文件是否为二进制格式（以魔数开头）"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+# 二进制模型读取
+class ModelReader:
+    """读取二进制模型文件
+
+    文件以只读方式映射到内存，棋子记录用PIECE.iter_unpack直接从映射中解码，不复制文件内容，
+    也不需要反序列化任意对象。也可以传入bytes、bytearray或memoryview
+    """
+    legacy = False
+
+    def __init__(self, source):
+        """
+        Args:
+            source: 文件路径，或文件内容
+        """
+        self.file = None
+        self.map = None
+        self.records = None
+        self.iterators = weakref.WeakSet()  # 尚未结束的记录迭代器，关闭前先结束它们
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.data = memoryview(source)
+        else:
+            self.file = open(source, "rb")
+            try:
+                # 空文件不能映射
+                if os.fstat(self.file.fileno()).st_size < HEADER.size:
+                    raise ValueError("文件过短，不是模型文件")
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception:
+                self.file.close()
+                raise
+            self.data = memoryview(self.map)
+
+        try:
+            if len(self.data) < HEADER.size:
+                raise ValueError("文件过短，不是模型文件")
+            magic, self.version, self.player_id, _, self.count = HEADER.unpack_from(self.data, 0)
+            if magic != MAGIC:
+                raise ValueError("不是二进制模型文件")
+            if self.version > VERSION:
+                raise ValueError(f"不支持的模型文件版本: {self.version}")
+            end = HEADER.size + self.count * PIECE.size
+            if len(self.data) < end:
+                raise ValueError(f"模型文件不完整: 应有{self.count}个棋子")
+            self.records = self.data[HEADER.size:end]
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """依次返回(棋子类型的值, 玩家, x, y, 角度)"""
+        iterator = self._iterate()
+        self.iterators.add(iterator)
+        return iterator
+
+    def _iterate(self):
+        yield from PIECE.iter_unpack(self.records)
+
+    def close(self):
+        """关闭文件，尚未读完的迭代器随之结束
+
+        映射仍被外部引用（例如调用者保留了records的切片）时无法立即关闭，
+        在引用释放后由垃圾回收关闭；文件句柄总是关闭
+        """
+        try:
+            # 结束迭代器，释放它们对映射的引用，否则映射无法关闭
+            for iterator in list(self.iterators):
+                try:
+                    iterator.close()
+                except ValueError:
+                    pass  # 在迭代过程中调用close，迭代器正在执行
+            for view in (self.records, self.data):
+                if view is not None:
+                    view.release()
+            if self.map is not None:
+                self.map.close()
+        except BufferError:
+            pass
+        finally:
+            self.map = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# 只允许基本类型的反序列化
+class _PlainUnpickler(pickle.Unpickler):
+    """旧模型文件只包含字典、列表、元组、字符串和数字，不需要导入任何类；
+    拒绝所有类和函数，读取来历不明的旧文件时不会执行其中的代码"""
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"模型文件中包含不允许的对象: {module}.{name}")
+
+# 旧格式模型读取
+class LegacyModel:
+    """读取pickle保存的旧模型文件，接口与ModelReader相同"""
+    legacy = True
+    version = 0
+
+    def __init__(self, source):
+        """
+        Args:
+            source: 文件路径，或文件内容
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            model_data = _PlainUnpickler(io.BytesIO(source)).load()
+        else:
+            with open(source, "rb") as f:
+                model_data = _PlainUnpickler(f).load()
+
+        self.player_id = model_data['player_id']
+        self.pieces = []
+        for piece_data in model_data.get('pieces', []):
+            try:
+                # 兼容更早的(x, y, 类型)元组
+                if isinstance(piece_data, tuple):
+                    x, y, chess_type_value = piece_data
+                    angle = 0
+                else:
+                    x, y = piece_data['position']
+                    chess_type_value = piece_data['chess_type']
+                    angle = piece_data.get('angle', 0)
+                self.pieces.append((chess_type_value, self.player_id, x, y, angle))
+            except Exception as e:
+                print(f"跳过无法解析的棋子: {e}")
+        self.count = len(self.pieces)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """依次返回(棋子类型的值, 玩家, x, y, 角度)"""
+        return iter(self.pieces)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_model(path):
+    """按文件开头的魔数选择ModelReader或LegacyModel打开模型文件"""
+    if is_binary_model(path):
+        return ModelReader(path)
+    return LegacyModel(path)
+
+def migrate(path, backup=False):
+    """把旧格式的模型文件就地转换为二进制格式
+
+    Args:
+        path: 文件路径（含.model后缀）
+        backup: 是否把原文件保留为path.bak
+
+    Returns:
+        bool: 是否进行了转换（已经是二进制格式时返回False）
+    """
+    with open_model(path) as model:
+        if not model.legacy:
+            return False
+        player_id, pieces = model.player_id, list(model)
+    if backup:
+        with open(path, "rb") as src, open(f"{path}.bak", "wb") as dst:
+            dst.write(src.read())
+    write_model(path, player_id, pieces)
+    return True
+
+def find_models(paths):
+    """展开参数中的目录，返回其中所有.model文件"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(".model"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def main():
+    parser = argparse.ArgumentParser(description="查看或转换模型文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="输出模型文件的格式、玩家和棋子")
+    info_parser.add_argument("model", help="模型文件（含.model后缀）")
+    migrate_parser = subparsers.add_parser("migrate", help="把pickle保存的旧模型文件转换为二进制格式")
+    migrate_parser.add_argument("paths", nargs="+", help="模型文件或包含模型文件的目录")
+    migrate_parser.add_argument("--backup", action="store_true", help="把原文件保留为.model.bak")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        try:
+            model = open_model(args.model)
+        except Exception as e:
+            print(f"读取模型文件失败: {e}")
+            return 1
+        with model:
+            result = {
+                "format": "pickle" if model.legacy else "binary",
+                "version": model.version,
+                "player_id": model.player_id,
+                "pieces": [{"chess_type": chess_type, "player": player,
+                            "x": round(x, 2), "y": round(y, 2), "angle": round(angle, 4)}
+                           for chess_type, player, x, y, angle in model],
+            }
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+
+    failed = 0
+    for path in find_models(args.paths):
+        try:
+            if migrate(path, args.backup):
+                print(f"已转换 {path}")
+            else:
+                print(f"已是二进制格式，跳过 {path}")
+        except Exception as e:
+            failed += 1
+            print(f"转换 {path} 失败: {e}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import json
+import math
+import time
+from collections import deque
+
+# 计时区段
+class _Section:
+    """with语句中计时，退出时把耗时累加到分析器的当前帧"""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+# 分析器关闭时使用的空区段
+class _NullSection:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SECTION = _NullSection()
+
+def percentile(sorted_values, p):
+    """返回已排序数据的p百分位数（最近秩法），没有数据时返回0.0"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+def summarize(values):
+    """计算一组耗时（毫秒）的p50/p95/p99和最大值"""
+    ordered = sorted(values)
+    return {
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+# 帧耗时分析器
+class FrameProfiler:
+    """按子系统统计每帧的耗时
+
+    不依赖pygame（只有绘制界面时才导入），模拟器也可以使用。
+    代码中用 `with profiler.section("名称"):` 包住要计时的部分，同一帧内同名区段的耗时累加
+    （例如一帧内的多个物理步）。每帧结束时记录帧耗时和各区段耗时，保留最近HISTORY_FRAMES帧，
+    用于计算p50/p95/p99。关闭时section返回空区段，几乎没有开销
+    """
+    HISTORY_FRAMES = 600   # 保留的帧数（60FPS下约10秒）
+    STATS_INTERVAL = 0.5   # 界面上统计数据的刷新间隔（秒）
+
+    def __init__(self, history=HISTORY_FRAMES):
+        self.enabled = False
+        self.history = history
+        self.frame_times = deque(maxlen=history)   # 每帧耗时（毫秒）
+        self.section_times = {}                    # 区段名 -> 每帧耗时（毫秒）
+        self.current = {}                          # 当前帧各区段累计的耗时（秒）
+        self.frame_start = None
+
+        # 界面显示用的统计数据，定时刷新
+        self.stats = {}
+        self.stats_time = 0.0
+        self.background = None
+
+    def toggle(self):
+        """开启或关闭统计"""
+        self.enabled = not self.enabled
+        self.current.clear()
+        self.frame_start = None
+        print(f"{'启用' if self.enabled else '禁用'}帧耗时分析")
+
+    def section(self, name):
+        """返回计时区段，在with语句中使用"""
+        if self.enabled:
+            return _Section(self, name)
+        return _NULL_SECTION
+
+    def add(self, name, seconds):
+        """把一段耗时累加到当前帧"""
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def begin_frame(self):
+        """一帧开始"""
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """一帧结束，记录帧耗时和各区段耗时"""
+        if not self.enabled or self.frame_start is None:
+            return
+        self.frame_times.append((time.perf_counter() - self.frame_start) * 1000)
+        for name in self.current:
+            if name not in self.section_times:
+                self.section_times[name] = deque(maxlen=self.history)
+        # 本帧没有执行的区段记为0
+        for name, times in self.section_times.items():
+            times.append(self.current.get(name, 0.0) * 1000)
+        self.current.clear()
+        self.frame_start = None
+
+    def get_stats(self):
+        """计算帧耗时和各区段耗时的统计数据
+
+        Returns:
+            dict: {"frame": {...}, "sections": {区段名: {...}}}，每项包含p50/p95/p99/max（毫秒）
+        """
+        return {
+            "frame": summarize(self.frame_times),
+            "sections": {name: summarize(times) for name, times in self.section_times.items()},
+        }
+
+    def dump(self, filename=None):
+        """把统计数据和最近的每帧耗时写入JSON文件
+
+        Args:
+            filename: 输出文件名，默认为profile_<时间>.json
+
+        Returns:
+            str: 写入的文件名，失败时返回None
+        """
+        if filename is None:
+            filename = time.strftime("profile_%Y%m%d_%H%M%S.json")
+        data = {
+            "frames": len(self.frame_times),
+            "stats": self.get_stats(),
+            "frame_times_ms": list(self.frame_times),
+            "section_times_ms": {name: list(times) for name, times in self.section_times.items()},
+        }
+        try:
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            print(f"帧耗时数据已写入 {filename}")
+            return filename
+        except Exception as e:
+            print(f"写入帧耗时数据失败: {e}")
+            return None
+
+    def draw_overlay(self, screen, font):
+        """在屏幕右下角绘制各部分耗时的p50/p95/p99（毫秒），返回绘制的区域"""
+        # 只有界面会调用，无界面模拟不需要导入pygame
+        import pygame
+        now = time.perf_counter()
+        if now - self.stats_time >= self.STATS_INTERVAL:
+            self.stats = self.get_stats()
+            self.stats_time = now
+        if not self.stats:
+            return None
+
+        rows = [("frame", self.stats["frame"])]
+        rows += sorted(self.stats["sections"].items(), key=lambda item: -item[1]["p95"])
+        line_height = font.get_linesize()
+        column_x = (0, 150, 205, 260)
+        width = 320
+        height = (len(rows) + 1) * line_height + 10
+        left = screen.get_width() - width - 10
+        top = screen.get_height() - height - 60
+
+        # 半透明背景，大小不变时复用
+        if self.background is None or self.background.get_size() != (width, height):
+            self.background = pygame.Surface((width, height), pygame.SRCALPHA)
+            self.background.fill((0, 0, 0, 170))
+        screen.blit(self.background, (left, top))
+
+        header = ("ms", "p50", "p95", "p99")
+        for x, text in zip(column_x, header):
+            screen.blit(font.render(text, True, (255, 255, 0)), (left + 5 + x, top + 5))
+        for i, (name, summary) in enumerate(rows):
+            y = top + 5 + (i + 1) * line_height
+            values = (name, f"{summary['p50']:.2f}", f"{summary['p95']:.2f}",
+                      f"{summary['p99']:.2f}")
+            for x, text in zip(column_x, values):
+                screen.blit(font.render(text, True, (255, 255, 255)), (left + 5 + x, y))
+        return pygame.Rect(left, top, width, height)
+
+# 启动耗时分析
+class StartupProfiler:
+    """记录从进程启动到第一次显示画面之间各阶段的耗时（main.py的--startup-profile）"""
+    def __init__(self, start=None):
+        """
+        Args:
+            start: 起点的time.perf_counter()，默认为创建时
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []  # [(阶段名称, 秒)]
+
+    def mark(self, name):
+        """结束一个阶段，记录距上一个阶段结束经过的时间"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        """打印各阶段耗时和占比"""
+        total = self.last - self.start
+        print(f"启动耗时 {total * 1000:.1f} 毫秒:")
+        for name, seconds in self.phases:
+            share = seconds / total * 100 if total > 0 else 0.0
+            print(f"  {name:<16} {seconds * 1000:8.1f} 毫秒 {share:5.1f}%")
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+
+# 对局输入记录
+class InputRecorder:
+    """按物理步序号记录一局中所有会改变对局的输入
+
+    每条记录为{"step": 物理步序号, "type": 输入类型, ...参数}，物理步序号是输入发生时
+    模拟器已经执行的步数。回放时先推进到该步数再执行输入，物理模拟和规则判断都只依赖步数，
+    所以能得到与原对局相同的结果（见replay.py）
+    """
+    VERSION = 1
+    REPLAY_DIR = "replays"  # 自动保存的记录所在目录
+
+    def __init__(self, settings=None):
+        """
+        Args:
+            settings: 创建GameManager所需的设置（场地大小、大型堡垒模式、棋子数量上限），回放时使用
+        """
+        self.settings = dict(settings or {})
+        self.events = []
+
+    def record(self, step, kind, **data):
+        """记录一条输入
+
+        Args:
+            step: 输入发生时模拟器已经执行的物理步数
+            kind: 输入类型，例如"drop"、"fire"
+            data: 输入的参数，必须可以写入JSON
+        """
+        event = {"step": step, "type": kind}
+        event.update(data)
+        # 拖动中的鼠标移动每步只保留最后一次，棋子的位置只在物理步之间起作用
+        if kind == "drag_move" and self.events:
+            last = self.events[-1]
+            if last["type"] == "drag_move" and last["step"] == step:
+                self.events[-1] = event
+                return
+        self.events.append(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    def to_dict(self, end_step=None, winner=None):
+        """转换为可以写入JSON的字典
+
+        Args:
+            end_step: 保存时模拟器已经执行的物理步数，回放推进到这一步为止
+            winner: 保存时的胜者，回放结束后用于核对
+        """
+        return {
+            "version": self.VERSION,
+            "settings": self.settings,
+            "end_step": end_step,
+            "winner": winner,
+            "events": self.events,
+        }
+
+    def save(self, filename=None, end_step=None, winner=None):
+        """把记录写入JSON文件
+
+        Args:
+            filename: 输出文件名，默认为replays/match_<时间>.json
+            end_step: 保存时模拟器已经执行的物理步数
+            winner: 保存时的胜者
+
+        Returns:
+            str: 写入的文件名，失败时返回None
+        """
+        if filename is None:
+            filename = os.path.join(self.REPLAY_DIR, time.strftime("match_%Y%m%d_%H%M%S.json"))
+        try:
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(end_step, winner), f, ensure_ascii=False, indent=1)
+            print(f"对局输入记录已写入 {filename}，共 {len(self.events)} 条")
+            return filename
+        except Exception as e:
+            print(f"写入对局输入记录失败: {e}")
+            return None
+
+    @staticmethod
+    def load(filename):
+        """读取save写出的记录
+
+        Returns:
+            dict: 记录内容，失败时返回None
+        """
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取对局输入记录失败: {e}")
+            return None
+        if data.get("version") != InputRecorder.VERSION:
+            print(f"不支持的记录版本: {data.get('version')}")
+            return None
+        return data
@@ -0,0 +1,224 @@
+import math
+from collections import OrderedDict
+import pygame
+
+# 旋转后的棋子图像缓存
+class SpriteCache:
+    """按(棋子类型, 玩家, 尺寸)和量化后的角度缓存预先绘制好的抗锯齿图像，最近最少使用的先淘汰
+
+    未命中时先按SUPERSAMPLE倍大小绘制旋转后的多边形，再用smoothscale缩小，得到抗锯齿的边缘；
+    命中时绘制一个棋子只需要一次blit。角度量化为angle_steps份，默认每份2度
+    """
+    ANGLE_STEPS = 180    # 一圈量化的份数
+    SUPERSAMPLE = 4      # 绘制时放大的倍数
+    MAX_SPRITES = 1024   # 最多缓存的图像数量（3种棋子×2个玩家×180个角度约1000张）
+    OUTLINE_WIDTH = 1    # 描边宽度（像素）
+
+    def __init__(self, max_sprites=MAX_SPRITES, angle_steps=ANGLE_STEPS):
+        self.max_sprites = max_sprites
+        self.angle_steps = angle_steps
+        self.sprites = OrderedDict()  # (key, 角度序号) -> Surface
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def clear(self):
+        """清空缓存（例如显示模式改变后）"""
+        self.sprites.clear()
+
+    def quantize(self, angle):
+        """把弧度转换为0到angle_steps-1之间的角度序号"""
+        return round(angle / (2 * math.pi) * self.angle_steps) % self.angle_steps
+
+    def get(self, key, angle, vertices, color, outline_color=None):
+        """返回旋转后的图像，缓存中没有时绘制
+
+        Args:
+            key: 区分图像的键，同一个键对应的顶点和颜色必须相同
+            angle: 物体的角度（弧度）
+            vertices: 未旋转时相对物体原点的多边形顶点
+            color: 填充颜色
+            outline_color: 描边颜色，为None时不描边
+
+        Returns:
+            pygame.Surface: 图像中心对应物体原点
+        """
+        index = self.quantize(angle)
+        cache_key = (key, index)
+        sprite = self.sprites.get(cache_key)
+        if sprite is not None:
+            self.sprites.move_to_end(cache_key)
+            self.hits += 1
+            return sprite
+
+        self.misses += 1
+        sprite = self.render(vertices, index * 2 * math.pi / self.angle_steps, color, outline_color)
+        self.sprites[cache_key] = sprite
+        if len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def render(self, vertices, angle, color, outline_color=None):
+        """绘制旋转后的多边形，返回带透明通道的图像"""
+        scale = self.SUPERSAMPLE
+        # 以顶点到原点的最大距离为半边长，任意角度都不会超出图像
+        half = math.ceil(max(math.hypot(x, y) for x, y in vertices)) + 1
+        size = half * 2
+        cos_a, sin_a = math.cos(angle), math.sin(angle)
+        points = [((x * cos_a - y * sin_a + half) * scale, (x * sin_a + y * cos_a + half) * scale)
+                  for x, y in vertices]
+
+        large = pygame.Surface((size * scale, size * scale), pygame.SRCALPHA)
+        pygame.draw.polygon(large, color, points)
+        if outline_color is not None:
+            pygame.draw.polygon(large, outline_color, points, self.OUTLINE_WIDTH * scale)
+        sprite = pygame.transform.smoothscale(large, (size, size))
+        # 已经创建窗口时转换为与屏幕相同的像素格式，blit更快
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert_alpha()
+        return sprite
+
+    @staticmethod
+    def blit(screen, sprite, x, y):
+        """把图像中心对准(x, y)绘制，返回绘制的区域"""
+        return screen.blit(sprite, (round(x - sprite.get_width() / 2),
+                                    round(y - sprite.get_height() / 2)))
+
+# 文字图像缓存
+class TextCache:
+    """按(字体, 文字, 抗锯齿, 颜色, 背景色)缓存font.render的结果，最近最少使用的先淘汰
+
+    界面上的标题、提示和按钮文字几乎不变，中文字形的光栅化开销较大，缓存后没有变化的帧
+    不再渲染文字。文字改变时键随之改变，旧的图像不再使用，最终被淘汰。
+    返回的图像由所有调用者共用，不能修改
+    """
+    MAX_ENTRIES = 256  # 最多缓存的文字图像数量
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()  # (字体, 文字, 抗锯齿, 颜色, 背景色) -> Surface
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def clear(self):
+        """清空缓存（例如更换字体后）"""
+        self.surfaces.clear()
+
+    def render(self, font, text, antialias, color, background=None):
+        """与font.render(text, antialias, color, background)相同，缓存中有时直接返回
+
+        Args:
+            font: pygame字体
+            text: 文字
+            antialias: 是否抗锯齿
+            color: 文字颜色
+            background: 背景色，为None时背景透明
+
+        Returns:
+            pygame.Surface: 文字图像
+        """
+        key = (font, text, antialias, tuple(color),
+               None if background is None else tuple(background))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color, background)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+# 静态图层缓存
+class LayerCache:
+    """按名称缓存预先合成好的不透明静态图层（背景、按钮、固定文字等），每帧只需一次blit
+
+    图层大小改变（例如窗口大小改变）时自动重建；更换字体或界面文字后调用clear
+    """
+    def __init__(self):
+        self.layers = {}  # 名称 -> Surface
+        self.builds = 0   # 绘制图层的次数
+
+    def __len__(self):
+        return len(self.layers)
+
+    def clear(self):
+        """丢弃所有图层，下次使用时重新绘制"""
+        self.layers.clear()
+
+    def get(self, name, size, build):
+        """返回名称对应的图层，没有缓存或大小不同时重新绘制
+
+        Args:
+            name: 图层名称，可哈希，内容不同的图层使用不同的名称
+            size: 图层大小(宽, 高)
+            build: 绘制函数，参数为新建的图层
+
+        Returns:
+            pygame.Surface: 图层
+        """
+        layer = self.layers.get(name)
+        if layer is not None and layer.get_size() == tuple(size):
+            return layer
+        layer = pygame.Surface(size)
+        build(layer)
+        if pygame.display.get_surface() is not None:
+            layer = layer.convert()
+        self.layers[name] = layer
+        self.builds += 1
+        return layer
+
+# 纯色图像池
+class SurfacePool:
+    """按(大小, 标志, 填充颜色)复用填充好的图像，例如每帧绘制的半透明背景
+
+    同样的背景每帧都新建一张带透明通道的图像会造成内存分配和回收的尖峰，
+    从池中取出的图像创建后不再分配。返回的图像由所有调用者共用，不能修改
+    """
+    MAX_SURFACES = 32  # 最多保留的图像数量
+
+    def __init__(self, max_surfaces=MAX_SURFACES):
+        self.max_surfaces = max_surfaces
+        self.surfaces = OrderedDict()  # (大小, 标志, 填充颜色) -> Surface
+        self.allocations = 0           # 新建图像的次数
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def clear(self):
+        """释放所有图像"""
+        self.surfaces.clear()
+
+    def get(self, size, flags=0, fill=None):
+        """返回指定大小、标志并用fill填充的图像，池中没有时新建
+
+        Args:
+            size: 图像大小(宽, 高)
+            flags: pygame.Surface的标志，例如pygame.SRCALPHA
+            fill: 填充颜色，带透明通道时可以是(r, g, b, a)，为None时不填充
+
+        Returns:
+            pygame.Surface: 图像
+        """
+        key = (tuple(size), flags, None if fill is None else tuple(fill))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = pygame.Surface(size, flags)
+        if fill is not None:
+            surface.fill(fill)
+        self.allocations += 1
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surface
@@ -0,0 +1,145 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # 不打印pygame欢迎信息
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+import pygame
+from game_objects import ChessPieceType
+from game_states import GameManager, GameState
+from recording import InputRecorder
+from trajectory import TrajectoryWriter
+
+# 无界面回放
+class ReplayRunner:
+    """把输入记录按原来的物理步序号送回GameManager，不绘制、不限帧率地推进模拟
+
+    输入通过与界面相同的GameManager方法执行（start_dragging、stop_dragging、fire等），
+    物理步直接调用模拟器的step，不经过按实际帧时间累加的update
+    """
+    def __init__(self, recording):
+        """
+        Args:
+            recording: InputRecorder.load读出的记录
+        """
+        self.recording = recording
+        settings = recording.get("settings", {})
+        max_chess_counts = {ChessPieceType[name]: count
+                            for name, count in settings.get("max_chess_counts", {}).items()}
+        # 不需要窗口，字体等模块初始化后即可创建GameManager
+        pygame.init()
+        self.game_manager = GameManager(settings.get("screen_width", 800),
+                                        settings.get("screen_height", 600),
+                                        large_fortress=settings.get("large_fortress", False),
+                                        max_chess_counts=max_chess_counts)
+        self.game_manager.current_state = GameState.BUILDING_PHASE
+
+    def apply(self, event):
+        """执行一条输入"""
+        game_manager = self.game_manager
+        kind = event["type"]
+        if kind == "select":
+            game_manager.select_chess_type(ChessPieceType[event["chess_type"]])
+        elif kind == "drag_start":
+            game_manager.start_dragging(event["x"], event["y"])
+        elif kind == "drag_move":
+            game_manager.move_drag(event["x"], event["y"])
+        elif kind == "rotate":
+            game_manager.rotate_drag(event["degrees"])
+        elif kind == "drop":
+            game_manager.stop_dragging((event["x"], event["y"]))
+        elif kind == "undo":
+            game_manager.undo_last_placement()
+        elif kind == "finish_player1":
+            game_manager.finish_player1_building()
+        elif kind == "start_battle":
+            game_manager.start_battle()
+        elif kind == "place_projectile":
+            game_manager.place_projectile(event["x"], event["y"])
+        elif kind == "fire":
+            game_manager.fire(event["dx"], event["dy"], event["strength"])
+        elif kind == "switch_player":
+            game_manager.switch_player()
+        elif kind == "retry":
+            game_manager.retry_shot()
+        else:
+            print(f"忽略未知的输入类型: {kind}")
+
+    def advance_to(self, step):
+        """推进物理模拟直到模拟器执行了step步"""
+        simulation = self.game_manager.simulation
+        remaining = step - simulation.step_count
+        if remaining > 0:
+            simulation.step(remaining)
+
+    def run(self, extra_steps=0):
+        """回放全部输入，推进到记录保存时的步数
+
+        Args:
+            extra_steps: 记录结束后继续模拟的最大物理步数，用于查看记录保存之后的结果，
+                分出胜负时提前停止
+
+        Returns:
+            dict: 回放结果，包括步数、胜者、耗时以及与记录中的胜者是否一致
+        """
+        events = self.recording.get("events", [])
+        start = time.perf_counter()
+        for event in events:
+            self.advance_to(event["step"])
+            self.apply(event)
+        end_step = self.recording.get("end_step")
+        if end_step is not None:
+            self.advance_to(end_step)
+
+        simulation = self.game_manager.simulation
+        for _ in range(extra_steps):
+            if simulation.game_over:
+                break
+            simulation.step(1)
+        elapsed = time.perf_counter() - start
+
+        recorded_winner = self.recording.get("winner")
+        return {
+            "events": len(events),
+            "steps": simulation.step_count,
+            "sim_seconds": round(simulation.sim_time_ms / 1000, 3),
+            "wall_seconds": round(elapsed, 3),
+            "steps_per_sec": round(simulation.step_count / elapsed, 1) if elapsed > 0 else None,
+            "game_over": simulation.game_over,
+            "winner": simulation.winner,
+            "recorded_winner": recorded_winner,
+            "winner_matches": simulation.winner == recorded_winner,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面全速回放对局输入记录")
+    parser.add_argument("recording", help="输入记录文件（游戏结束时保存在replays目录，或游戏中按W键保存）")
+    parser.add_argument("--extra-steps", type=int, default=0,
+                        help="记录结束后继续模拟的最大物理步数，分出胜负时提前停止")
+    parser.add_argument("--trajectory", default=None,
+                        help="把回放中每一步所有棋子和弹射物的位置写入轨迹文件（见trajectory.py）")
+    parser.add_argument("--verbose", action="store_true", help="显示对局中的调试输出")
+    args = parser.parse_args()
+
+    recording = InputRecorder.load(args.recording)
+    if recording is None:
+        return 1
+
+    # 回放时默认丢弃GameManager和模拟器的调试输出
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        runner = ReplayRunner(recording)
+        if args.trajectory:
+            runner.game_manager.simulation.trajectory = stack.enter_context(
+                TrajectoryWriter(args.trajectory, runner.game_manager.simulation.STEP_DT))
+        result = runner.run(args.extra_steps)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result["winner_matches"] else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
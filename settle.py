@@ -0,0 +1,79 @@
+# 基于动能的静止判定
+class SettleDetector:
+    """按物理步统计动态物体的平动动能和转动动能之和，判断场地是否已经静止
+
+    带滞回：所有物体的动能之和连续settle_steps步低于进入阈值才判定为静止，尚未静止时
+    任何一步不低于进入阈值都会清零计数；判定为静止后，只有超过更高的离开阈值才重新判定为运动，
+    两个阈值之间的小幅抖动不改变判定。阈值是动能之和的绝对值，不按物体数量平均，
+    大量休眠的棋子不会掩盖少数仍在运动的棋子。
+    休眠的物体速度为零，直接跳过；累加的动能超过离开阈值后不再继续遍历。
+    物体的质量和转动惯量不变，第一次遇到时缓存，每步只读取速度和角速度
+    """
+    ENTER_ENERGY = 10.0  # 动能之和低于该值视为安静（一个质量20的棋子约1像素/秒）
+    EXIT_ENERGY = 40.0   # 动能之和高于该值视为重新运动（一个质量20的棋子约2像素/秒）
+    SETTLE_STEPS = 60    # 需要连续安静的物理步数（0.5模拟秒）
+
+    def __init__(self, enter_energy=ENTER_ENERGY, exit_energy=EXIT_ENERGY,
+                 settle_steps=SETTLE_STEPS):
+        self.enter_energy = enter_energy
+        self.exit_energy = exit_energy
+        self.settle_steps = settle_steps
+        self.energy = 0.0      # 最近一步的动能之和（超过离开阈值时只是下限）
+        self.quiet_steps = 0   # 连续安静的物理步数
+        self.settled = False
+        self.inertia = {}      # body -> (质量, 转动惯量)
+
+    def reset(self):
+        """物体被整体替换（例如恢复快照）后调用，重新开始计数，并丢弃已移出空间的物体的缓存"""
+        self.energy = 0.0
+        self.quiet_steps = 0
+        self.settled = False
+        if self.inertia:
+            self.inertia = {body: masses for body, masses in self.inertia.items()
+                            if body.space is not None}
+
+    def measure(self, bodies, limit=float("inf")):
+        """计算物体的平动动能和转动动能之和，超过limit时提前返回"""
+        inertia = self.inertia
+        energy = 0.0
+        for body in bodies:
+            if body.is_sleeping:
+                continue
+            masses = inertia.get(body)
+            if masses is None:
+                masses = inertia[body] = (body.mass, body.moment)
+            vx, vy = body.velocity
+            angular_velocity = body.angular_velocity
+            energy += 0.5 * (masses[0] * (vx * vx + vy * vy)
+                             + masses[1] * angular_velocity * angular_velocity)
+            if energy > limit:
+                break
+        return energy
+
+    def update(self, bodies):
+        """每个物理步之后调用一次
+
+        Args:
+            bodies: 要统计的动态物体
+
+        Returns:
+            bool: 是否已经静止
+        """
+        self.energy = self.measure(bodies, self.exit_energy)
+        if self.energy > self.exit_energy:
+            self.quiet_steps = 0
+            self.settled = False
+        elif self.energy < self.enter_energy:
+            self.quiet_steps += 1
+            if self.quiet_steps >= self.settle_steps:
+                self.settled = True
+        elif not self.settled:
+            self.quiet_steps = 0
+        return self.settled
+
+    @property
+    def progress(self):
+        """静止判定的进度，0.0到1.0"""
+        if self.settled:
+            return 1.0
+        return min(1.0, self.quiet_steps / self.settle_steps)
@@ -0,0 +1,194 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # 工作进程中不打印pygame欢迎信息
+
+import argparse
+import contextlib
+import json
+import math
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from simulation import BattleSimulation
+
+# 工作进程中棋子落稳后、发射第一发之前的对局（pickle序列化后的数据）
+_worker_battle = None
+# 工作进程评估时是否丢弃规则判断的调试输出
+_worker_quiet = True
+
+def _init_worker(battle, quiet=True):
+    """工作进程初始化：记录落稳后的对局，以及是否丢弃调试输出"""
+    global _worker_battle, _worker_quiet
+    _worker_battle = battle
+    _worker_quiet = quiet
+
+def create_battle(player1_filename, player2_filename, settle_steps=2400):
+    """加载一对堡垒模型，创建独立的物理空间并让棋子落稳，准备好发射第一发
+
+    Args:
+        player1_filename: 玩家1的模型文件名（不含.model后缀）
+        player2_filename: 玩家2的模型文件名（不含.model后缀）
+        settle_steps: 发射前等待棋子静止的最大物理步数
+
+    Returns:
+        BattleSimulation: 已进入战斗阶段的模拟器
+    """
+    simulation = BattleSimulation(verbose=False)
+    simulation.load_models(player1_filename, player2_filename)
+    simulation.prepare_battle()
+    simulation.run_until_settled(settle_steps)
+    return simulation
+
+def simulate_shot(simulation, shot, shooter=1, max_steps=6000):
+    """在模拟器中发射一发弹射物，直到弹射物和棋子都静止，再执行胜负判断
+
+    Args:
+        simulation: 已进入战斗阶段的BattleSimulation
+        shot: (发射点(x, y), 方向向量(dx, dy), 力度)
+        shooter: 发射的玩家
+        max_steps: 单发模拟的最大物理步数
+
+    Returns:
+        dict: 本发的结果，包括双方摧毁比例、结构完整度、象棋是否孤立和胜者
+    """
+    (x, y), direction, strength = shot
+    start_step = simulation.step_count
+    simulation.active_player = shooter
+
+    simulation.place_projectile(x, y)
+    simulation.fire(direction, strength)
+    simulation.run_until_settled(max_steps)
+
+    ground_y = simulation.destruction_ground_y
+    contact_graph = simulation.contact_graph
+    result = {
+        "player1_destruction": simulation.player1_model.get_destruction_percentage(ground_y),
+        "player2_destruction": simulation.player2_model.get_destruction_percentage(ground_y),
+        "player1_integrity": simulation.integrity.get_integrity(simulation.player1_model),
+        "player2_integrity": simulation.integrity.get_integrity(simulation.player2_model),
+        "player1_isolated": simulation.player1_model.is_chinese_chess_isolated(contact_graph),
+        "player2_isolated": simulation.player2_model.is_chinese_chess_isolated(contact_graph),
+    }
+
+    # 结束本回合，等待规则中的稳定计时完成一次胜负判断
+    simulation.switch_player()
+    simulation.run_until_victory_check(max_steps - (simulation.step_count - start_step))
+
+    result["winner"] = simulation.winner
+    result["steps"] = simulation.step_count - start_step
+    return result
+
+def _evaluate_shot(task):
+    """工作进程中评估一发：每发都从落稳后的对局反序列化出一份新的模拟器，
+    不受同一进程之前评估的射击影响
+    """
+    index, shot, shooter, max_steps = task
+    with contextlib.ExitStack() as stack:
+        if _worker_quiet:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        simulation = pickle.loads(_worker_battle)
+        result = simulate_shot(simulation, shot, shooter, max_steps)
+    result["shot"] = index
+    return result
+
+def evaluate_shots(player1_filename, player2_filename, shots, shooter=1, workers=None,
+                   max_steps=6000, quiet=True):
+    """在进程池中并行评估一组射击
+
+    在主进程中加载模型并等待棋子落稳一次，把对局序列化后交给工作进程，
+    每一发都从一份新的副本开始模拟到静止，结果与工作进程数和射击顺序无关
+
+    Args:
+        player1_filename: 玩家1的模型文件名（ChessModel.save写出的.model文件，不含后缀）
+        player2_filename: 玩家2的模型文件名
+        shots: 射击列表，每项为(发射点(x, y), 方向向量(dx, dy), 力度)
+        shooter: 发射的玩家
+        workers: 工作进程数，默认使用CPU核心数
+        max_steps: 单发模拟的最大物理步数
+        quiet: 是否关闭工作进程中的调试输出
+
+    Returns:
+        list: 按输入顺序排列的结果字典
+    """
+    shots = list(shots)
+    if not shots:
+        return []
+    workers = workers or os.cpu_count() or 1
+    tasks = [(i, shot, shooter, max_steps) for i, shot in enumerate(shots)]
+    # 每个进程分批领取任务，减少进程间通信次数
+    chunksize = max(1, math.ceil(len(tasks) / (workers * 4)))
+
+    if quiet:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            battle = pickle.dumps(create_battle(player1_filename, player2_filename))
+    else:
+        battle = pickle.dumps(create_battle(player1_filename, player2_filename))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(battle, quiet)) as executor:
+        return list(executor.map(_evaluate_shot, tasks, chunksize=chunksize))
+
+def check_consistency(player1_filename, player2_filename, shots, results, shooter=1,
+                      max_steps=6000):
+    """用单个工作进程按相反顺序重新评估一遍，检查结果与工作进程数和射击顺序无关
+
+    Args:
+        player1_filename, player2_filename: 与evaluate_shots相同
+        shots: 射击列表
+        results: evaluate_shots对这组射击返回的结果
+        shooter: 发射的玩家
+        max_steps: 单发模拟的最大物理步数
+
+    Returns:
+        list: 结果不一致的射击序号，全部一致时为空列表
+    """
+    shots = list(shots)
+    reversed_results = evaluate_shots(player1_filename, player2_filename, shots[::-1],
+                                      shooter=shooter, workers=1, max_steps=max_steps)
+    mismatched = []
+    for result, other in zip(results, reversed(reversed_results)):
+        if dict(other, shot=result["shot"]) != result:
+            mismatched.append(result["shot"])
+    return mismatched
+
+def main():
+    parser = argparse.ArgumentParser(description="并行评估一对堡垒模型在一组射击下的结果")
+    parser.add_argument("player1_model", help="玩家1的模型文件名（不含.model后缀）")
+    parser.add_argument("player2_model", help="玩家2的模型文件名（不含.model后缀）")
+    parser.add_argument("shots", help="射击列表JSON文件，每项为[[x, y], [dx, dy], strength]")
+    parser.add_argument("--shooter", type=int, default=1, choices=(1, 2), help="发射的玩家")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数")
+    parser.add_argument("--max-steps", type=int, default=6000, help="单发模拟的最大物理步数")
+    parser.add_argument("--output", default=None, help="结果JSON文件，默认输出到标准输出")
+    parser.add_argument("--verify", action="store_true",
+                        help="再用单个工作进程按相反顺序评估一遍，结果不一致时退出码为2")
+    args = parser.parse_args()
+
+    try:
+        with open(args.shots, "r", encoding="utf-8") as f:
+            shots = json.load(f)
+    except Exception as e:
+        print(f"读取射击列表失败: {e}")
+        return 1
+
+    results = evaluate_shots(args.player1_model, args.player2_model, shots,
+                             shooter=args.shooter, workers=args.workers, max_steps=args.max_steps)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"已评估 {len(results)} 发射击，结果写入 {args.output}")
+    else:
+        print(text)
+
+    if args.verify:
+        mismatched = check_consistency(args.player1_model, args.player2_model, shots, results,
+                                       shooter=args.shooter, max_steps=args.max_steps)
+        if mismatched:
+            print(f"结果与射击顺序或工作进程数有关，不一致的射击: {mismatched}", file=sys.stderr)
+            return 2
+        print("按相反顺序单进程重新评估，结果一致", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
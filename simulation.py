@@ -0,0 +1,1028 @@
+import math
+import pymunk
+from game_objects import ChessPiece, ChessPieceType, Projectile, ChessModel, PieceRegistry
+from space_snapshot import SpaceSnapshot
+from contact_graph import ContactGraph
+from integrity import StructuralIntegrity
+from profiler import FrameProfiler
+from settle import SettleDetector
+
+# 无界面对战模拟器
+class BattleSimulation:
+    """无界面的对战模拟器
+
+    只持有pymunk物理空间、双方的ChessModel以及战斗规则，不依赖显示窗口、
+    字体或pygame时钟，可以在没有图形界面的服务器上批量运行对战。
+    界面相关的内容（绘制、事件处理、提示信息）由GameManager包装实现。
+    """
+
+    # 物理步长，固定为120FPS
+    STEP_DT = 1 / 120.0
+
+    # 大型堡垒模式的参数
+    LARGE_FORTRESS_ITERATIONS = 5           # 求解器迭代次数（pymunk默认为10）
+    LARGE_FORTRESS_HASH_CELLS_PER_PIECE = 10  # 空间哈希表大小与棋子数量之比
+
+    # 自适应子步：弹射物一步内移动的距离超过最小棋子尺寸（军棋短边）的一半时，把这一步细分，
+    # 保证每个子步移动不超过半个棋子，不会直接穿过棋子；其余时间仍然每步只计算一次
+    MIN_PIECE_DIMENSION = ChessPiece.RADIUS * 1.5
+    SUBSTEP_MAX_TRAVEL = MIN_PIECE_DIMENSION / 2
+    MAX_SUBSTEPS = 8
+
+    # 场地边界（地面、墙壁、天花板）的厚度，以及物体嵌入边界多深时视为逃出场地
+    WALL_THICKNESS = 50
+    ESCAPE_DEPTH = MIN_PIECE_DIMENSION / 2
+    # 场地边界的碰撞类别，棋子和弹射物的碰撞掩码都包含0x4
+    ARENA_FILTER = pymunk.ShapeFilter(categories=0x4)
+
+    # 快照中记录的规则状态
+    SNAPSHOT_STATE = (
+        "active_player", "projectile", "projectile_placed", "projectile_fired",
+        "ready_to_switch_player", "player1_model_saved", "battle_active", "game_over", "winner",
+        "integrity_baseline",
+    )
+
+    def __init__(self, screen_width=800, screen_height=600, clock=None, verbose=True,
+                 large_fortress=False, expected_pieces=1000, profiler=None):
+        """创建模拟器
+
+        Args:
+            screen_width: 场地宽度（像素）
+            screen_height: 场地高度（像素）
+            clock: 可选的时钟函数，无参数，返回当前时间（毫秒）；
+                为None时使用按物理步数累计的模拟时间
+            verbose: 是否打印调试信息，批量模拟时可以关闭
+            large_fortress: 是否启用大型堡垒模式（双方共有成百上千个棋子时使用）
+            expected_pieces: 大型堡垒模式下预计的棋子总数，用于确定空间哈希表的大小
+            profiler: 可选的FrameProfiler，统计物理步和规则检查的耗时
+        """
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.ground_y = screen_height - 50  # 地面所在的高度
+        # 散落判定的基准高度：原规则按800x600场地假设地面在500，棋子中心低于450即视为散落；
+        # 随场地高度平移，800x600时仍为500，不改变70%散落规则
+        self.destruction_ground_y = screen_height - 100
+        self.verbose = verbose
+
+        # 模拟时间，按已执行的物理步数累计
+        self.step_count = 0
+        self.extra_substeps = 0  # 因弹射物速度过快额外执行的子步数
+        self.sim_time_ms = 0.0
+        self.clock = clock if clock is not None else self.get_sim_time
+        # 耗时统计，默认使用一个关闭的分析器
+        self.profiler = profiler if profiler is not None else FrameProfiler()
+        # 可选的TrajectoryWriter，每个物理步之后记录所有棋子和弹射物的位置
+        self.trajectory = None
+
+        # 定义碰撞类型
+        self.ground_collision_type = 0
+        self.projectile_collision_type = 4
+        self.player1_chess_collision_type = 1  # 玩家1的棋子碰撞类型
+        self.player2_chess_collision_type = 2  # 玩家2的棋子碰撞类型
+        self.go_chess_collision_type = 3      # 围棋的碰撞类型
+        self.escape_sensor_collision_type = 5  # 场地外感应区的碰撞类型
+        self.log("初始化碰撞类型: 地面=0, 弹射物=4, 玩家1棋子=1, 玩家2棋子=2, 围棋=3, 场地外感应区=5")
+
+        # 初始化物理空间，创建地面并设置碰撞处理
+        self.large_fortress = False
+        self.spatial_hash = None  # 大型堡垒模式下空间哈希的(格子边长, 表大小)
+        self.create_space()
+
+        # 大型堡垒模式
+        if large_fortress:
+            self.use_large_fortress_mode(expected_pieces)
+
+        # 穿透场地边界、需要放回场地的物体
+        self.escaped_bodies = set()
+
+        # 棋子之间的接触图，由碰撞回调维护
+        self.contact_graph = ContactGraph()
+
+        # 形状到棋子的索引，供碰撞回调在常数时间内找到被撞的棋子
+        self.piece_registry = PieceRegistry()
+
+        # 玩家模型
+        self.player1_model = ChessModel(1, self.piece_registry)
+        self.player2_model = ChessModel(2, self.piece_registry)
+
+        # 双方堡垒的结构完整度，由接触回调增量维护
+        self.integrity = StructuralIntegrity(self.piece_registry, self.contact_graph)
+        self.integrity_threshold = 0.5  # 完整度低于第一发之前的该比例时判负
+        self.integrity_baseline = None  # 第一发之前双方的完整度 {player_id: 完整度}
+
+        # 当前攻击的玩家
+        self.active_player = 1
+
+        # 弹射物
+        self.projectile = None
+        self.max_strength = 2000
+
+        # 弹射物状态标记
+        self.projectile_placed = False
+        self.projectile_fired = False    # 标记弹射物已发射但尚未切换玩家
+        self.ready_to_switch_player = False  # 标记弹射物已停止运动，可以切换玩家
+
+        # 玩家1建造完成后暂存的棋子状态
+        self.player1_model_saved = False
+        self.player1_snapshot = None
+
+        # 最近一次发射前的快照，用于重试这一发
+        self.shot_snapshot = None
+
+        # 战斗状态
+        self.battle_active = False  # 是否处于战斗阶段（只在战斗阶段判断胜负）
+        self.game_over = False
+        self.winner = None
+
+        # 棋子稳定性相关变量
+        self.settle_detector = SettleDetector()  # 按动能判断棋子是否静止，每个物理步更新
+        self.pieces_stable = False  # 标记棋子是否处于稳定状态
+        self.stability_timer = 0    # 开始稳定的时间
+        self.last_victory_check_time = 0  # 上次胜负检查的时间
+        self.victory_checks = 0  # 已执行的胜负判断次数
+        self.awake_witness = None  # 上次检查时发现的仍未休眠的物体
+
+    def use_large_fortress_mode(self, expected_pieces=1000):
+        """切换到大型堡垒模式
+
+        棋子大小基本相同，使用格子边长与最大棋子相当的空间哈希作为碰撞粗检测，
+        比默认的包围盒树更快；同时减少求解器迭代次数，以少量堆叠精度换取速度
+
+        Args:
+            expected_pieces: 预计的棋子总数
+
+        Returns:
+            None
+        """
+        dim = ChessPiece.RADIUS * 2.5  # 最大的棋子（军棋）的长边
+        count = max(1000, expected_pieces * self.LARGE_FORTRESS_HASH_CELLS_PER_PIECE)
+        self.spatial_hash = (dim, count)
+        self.space.use_spatial_hash(dim, count)
+        self.space.iterations = self.LARGE_FORTRESS_ITERATIONS
+        self.large_fortress = True
+        self.log(f"启用大型堡垒模式: 空间哈希格子边长={dim}, 表大小={count}, "
+                 f"迭代次数={self.space.iterations}")
+
+    def create_space(self):
+        """创建物理空间，添加场地边界并注册碰撞处理
+
+        恢复快照时也用它重建物理空间：pymunk内部的散列表只增不减，表的大小会影响碰撞检测的顺序，
+        继续使用原来的空间时，同样的状态也会模拟出不同的结果
+
+        Returns:
+            None
+        """
+        self.space = pymunk.Space()
+        self.space.gravity = (0, 400)  # 增强重力效果，使笔芯运动更加真实
+        self.space.damping = 0.85  # 进一步减小阻尼，使物体运动更流畅
+        # 启用休眠：速度低于idle_speed_threshold（像素/秒）并持续sleep_time_threshold秒的
+        # 物体组会进入休眠，休眠的物体不再参与积分，棋子堡垒倒塌静止后物理计算量大幅下降
+        self.space.idle_speed_threshold = 5.0
+        self.space.sleep_time_threshold = 0.5
+        if self.large_fortress:
+            self.space.use_spatial_hash(*self.spatial_hash)
+            self.space.iterations = self.LARGE_FORTRESS_ITERATIONS
+        self.create_ground()
+        self.setup_collision_handlers()
+
+    def log(self, message):
+        """打印调试信息（verbose关闭时不输出）"""
+        if self.verbose:
+            print(message)
+
+    def get_sim_time(self):
+        """返回按物理步数累计的模拟时间（毫秒），作为默认时钟"""
+        return self.sim_time_ms
+
+    def create_ground(self):
+        """创建地面、左右墙壁和天花板，以及场地外侧的逃逸感应区
+
+        场地边界都是有一定厚度的静态方块，快速运动的物体也不容易穿出去；
+        边界内表面的位置与原来半径为5的线段相同（地面表面在ground_y - 5）。
+        边界外侧的感应区不产生碰撞，只用于标记穿透边界的物体
+        """
+        width = self.screen_width
+        thickness = self.WALL_THICKNESS
+        surface_top = 5                      # 天花板的下表面
+        surface_left = 5                     # 左墙的内表面
+        surface_right = width - 5            # 右墙的内表面
+        surface_ground = self.ground_y - 5   # 地面的上表面
+
+        arena_body = self.space.static_body
+        # 地面、左边界、右边界、天花板
+        for left, top, right, bottom in (
+            (-thickness, surface_ground, width + thickness, self.ground_y + thickness),
+            (-thickness, -thickness, surface_left, self.ground_y + thickness),
+            (surface_right, -thickness, width + thickness, self.ground_y + thickness),
+            (-thickness, -thickness, width + thickness, surface_top),
+        ):
+            corners = [(left, top), (right, top), (right, bottom), (left, bottom)]
+            shape = pymunk.Poly(arena_body, corners)
+            shape.friction = 1.0  # 最大摩擦力，防止滑动
+            shape.elasticity = 0.1  # 很低的弹性，防止弹跳
+            shape.collision_type = self.ground_collision_type  # 地面碰撞类型
+            shape.filter = self.ARENA_FILTER
+            self.space.add(shape)
+
+        # 逃逸感应区：从边界内表面向外ESCAPE_DEPTH处开始，覆盖边界和边界外侧
+        depth = self.ESCAPE_DEPTH
+        far = 3 * thickness
+        for left, top, right, bottom in (
+            (-far, surface_ground + depth, width + far, self.ground_y + far),
+            (-far, -far, surface_left - depth, self.ground_y + far),
+            (surface_right + depth, -far, width + far, self.ground_y + far),
+            (-far, -far, width + far, surface_top - depth),
+        ):
+            corners = [(left, top), (right, top), (right, bottom), (left, bottom)]
+            sensor = pymunk.Poly(arena_body, corners)
+            sensor.sensor = True
+            sensor.collision_type = self.escape_sensor_collision_type
+            sensor.filter = self.ARENA_FILTER
+            self.space.add(sensor)
+
+    def setup_collision_handlers(self):
+        """为物理空间注册碰撞处理函数"""
+        # 为弹射物和地面设置碰撞处理
+        self.space.add_collision_handler(
+            self.projectile_collision_type, self.ground_collision_type
+        ).begin = self.projectile_ground_collision_handler
+        # 为弹射物和玩家1/2的棋子以及围棋设置碰撞处理
+        self.space.add_collision_handler(
+            self.projectile_collision_type, self.player1_chess_collision_type
+        ).begin = self.projectile_player1_collision_handler
+        self.space.add_collision_handler(
+            self.projectile_collision_type, self.go_chess_collision_type
+        ).begin = self.projectile_go_chess_collision_handler
+        self.space.add_collision_handler(
+            self.projectile_collision_type, self.player2_chess_collision_type
+        ).begin = self.projectile_player2_collision_handler
+        piece_collision_types = (self.player1_chess_collision_type,
+                                 self.player2_chess_collision_type,
+                                 self.go_chess_collision_type, self.projectile_collision_type)
+        # 棋子和弹射物进入场地外的感应区时标记为逃逸
+        for collision_type in piece_collision_types:
+            self.space.add_collision_handler(
+                self.escape_sensor_collision_type, collision_type
+            ).begin = self.escape_sensor_begin_handler
+        # 棋子之间（双方棋子和围棋的任意组合）开始接触和分开时更新接触图
+        piece_types = (self.player1_chess_collision_type, self.player2_chess_collision_type,
+                       self.go_chess_collision_type)
+        for i, type_a in enumerate(piece_types):
+            for type_b in piece_types[i:]:
+                handler = self.space.add_collision_handler(type_a, type_b)
+                handler.begin = self.piece_contact_begin_handler
+                handler.separate = self.piece_contact_separate_handler
+
+    def piece_contact_begin_handler(self, arbiter, space, data):
+        """两个棋子开始接触：在接触图中加一条边"""
+        shape_a, shape_b = arbiter.shapes
+        self.contact_graph.add_contact(shape_a, shape_b)
+        self.integrity.on_contact_begin(shape_a, shape_b)
+        # 返回True表示允许碰撞继续处理
+        return True
+
+    def piece_contact_separate_handler(self, arbiter, space, data):
+        """两个棋子分开（或其中一个被移出物理空间）：删除接触图中的边"""
+        shape_a, shape_b = arbiter.shapes
+        self.contact_graph.remove_contact(shape_a, shape_b)
+        self.integrity.on_contact_separate(shape_a, shape_b)
+
+    def escape_sensor_begin_handler(self, arbiter, space, data):
+        """物体进入场地外的感应区：只做标记，由keep_pieces_in_bounds放回场地
+
+        拖动中的临时棋子不属于任何模型，不做处理
+        """
+        shape = arbiter.shapes[1]
+        piece, _ = self.piece_registry.lookup(shape)
+        if piece is not None or (self.projectile is not None and shape is self.projectile.shape):
+            self.escaped_bodies.add(shape.body)
+        return True
+
+    def projectile_ground_collision_handler(self, arbiter, space, data):
+        """弹射物与地面的碰撞处理函数"""
+        # 获取碰撞的弹射物
+        projectile_shape = arbiter.shapes[0]
+
+        # 减小弹射物的速度，使其更快停下来
+        if hasattr(projectile_shape, 'body'):
+            # 获取弹射物的速度
+            vel = projectile_shape.body.velocity
+            # 减小速度
+            projectile_shape.body.velocity = pymunk.Vec2d(vel.x * 0.8, vel.y * 0.8)
+
+            # 如果速度很小，直接停止
+            if vel.length < 10:
+                projectile_shape.body.velocity = pymunk.Vec2d(0, 0)
+                projectile_shape.body.angular_velocity = 0
+
+        # 返回True表示允许碰撞继续处理
+        return True
+
+    def projectile_player1_collision_handler(self, arbiter, space, data):
+        """弹射物与玩家1棋子的碰撞处理函数"""
+        self.log("检测到弹射物与玩家1棋子碰撞")
+        # 获取碰撞的弹射物和棋子
+        projectile_shape = arbiter.shapes[0]
+        chess_shape = arbiter.shapes[1]
+
+        try:
+            # 通过形状索引找到被碰撞的棋子
+            piece, player_id = self.piece_registry.lookup(chess_shape)
+            if piece is not None and player_id == 1:
+                # 施加额外冲量，增强碰撞效果
+                if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
+                    # 获取弹射物的速度
+                    vel = projectile_shape.body.velocity
+                    # 如果速度足够大，对棋子施加冲量
+                    if vel.length > 10:
+                        # 计算碰撞力度，与弹射物速度成正比
+                        impact = vel.normalized() * min(vel.length * 1.5, 500)
+                        # 对棋子施加冲量
+                        self.apply_impact(piece, impact)
+                        self.log(f"弹射物撞击玩家1棋子，施加冲量: {impact}")
+        except Exception as e:
+            print(f"处理弹射物与玩家1棋子碰撞时出错: {e}")
+
+        # 返回True表示允许碰撞继续处理
+        return True
+
+    def projectile_player2_collision_handler(self, arbiter, space, data):
+        """弹射物与玩家2棋子的碰撞处理函数"""
+        self.log("检测到弹射物与玩家2棋子碰撞")
+        # 获取碰撞的弹射物和棋子
+        projectile_shape = arbiter.shapes[0]
+        chess_shape = arbiter.shapes[1]
+
+        try:
+            self.log(f"正在处理弹射物与玩家2棋子碰撞，弹射物类型: {projectile_shape.collision_type}, "
+                     f"棋子类型: {chess_shape.collision_type}")
+            # 通过形状索引找到被碰撞的棋子
+            piece, player_id = self.piece_registry.lookup(chess_shape)
+            if piece is not None and player_id == 2:
+                # 施加额外冲量，增强碰撞效果
+                if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
+                    # 获取弹射物的速度
+                    vel = projectile_shape.body.velocity
+                    # 如果速度足够大，对棋子施加冲量
+                    self.log(f"弹射物与玩家2棋子碰撞，速度: {vel.length}")
+
+                    if vel.length > 5:  # 降低阈值，确保小速度也有效果
+                        # 计算碰撞力度，与弹射物速度成正比
+                        impact = vel.normalized() * min(vel.length * 1.5, 500)
+                        self.apply_impact(piece, impact)
+                        self.log(f"弹射物撞击玩家2棋子，施加冲量: {impact}")
+        except Exception as e:
+            print(f"处理弹射物与玩家2棋子碰撞时出错: {e}")
+
+        # 返回True表示允许碰撞继续处理
+        return True
+
+    def projectile_go_chess_collision_handler(self, arbiter, space, data):
+        """弹射物与围棋的碰撞处理函数"""
+        self.log("检测到弹射物与围棋碰撞")
+        # 获取碰撞的弹射物和棋子
+        projectile_shape = arbiter.shapes[0]
+        go_chess_shape = arbiter.shapes[1]
+
+        try:
+            # 通过形状索引找到被碰撞的围棋棋子（可能属于任一玩家）
+            piece, player_id = self.piece_registry.lookup(go_chess_shape)
+            if piece is not None:
+                # 施加额外冲量，增强碰撞效果
+                if hasattr(projectile_shape, 'body') and hasattr(projectile_shape.body, 'velocity'):
+                    # 获取弹射物的速度
+                    vel = projectile_shape.body.velocity
+                    # 如果速度足够大，对棋子施加冲量
+                    if vel.length > 10:
+                        # 计算碰撞力度，与弹射物速度成正比
+                        impact = vel.normalized() * min(vel.length * 1.5, 500)
+                        # 对围棋施加冲量（可能需要更大的力度）
+                        self.apply_impact(piece, impact * 1.2)
+                        self.log(f"弹射物撞击玩家{player_id}的围棋，施加冲量: {impact}")
+        except Exception as e:
+            print(f"处理弹射物与围棋碰撞时出错: {e}")
+        return True
+
+    def apply_impact(self, piece, impact):
+        """在当前物理步结束后对棋子施加冲量
+
+        碰撞回调执行时物理空间处于锁定状态，此时唤醒休眠的棋子会使pymunk卡死，
+        因此冲量通过post-step回调在步进结束后施加（同一步内每个棋子只施加一次）
+
+        Args:
+            piece: 被撞击的棋子
+            impact: 冲量向量
+        """
+        def apply(space, key):
+            piece.body.apply_impulse_at_world_point(impact, piece.body.position)
+        self.space.add_post_step_callback(apply, piece.shape)
+
+    def step(self, n=1):
+        """推进n个物理步，每步之后执行一次规则检查
+
+        Args:
+            n: 要执行的物理步数
+
+        Returns:
+            None
+        """
+        for _ in range(n):
+            self.physics_step()
+            self.update_rules()
+            if self.trajectory is not None:
+                self.trajectory.record(self)
+
+    def run_until_settled(self, max_steps=6000):
+        """持续推进模拟，直到已发射的弹射物停止且所有棋子静止
+
+        Args:
+            max_steps: 最多执行的物理步数，防止物体一直无法静止时死循环
+
+        Returns:
+            int: 实际执行的物理步数
+        """
+        steps = 0
+        while steps < max_steps and not self.game_over:
+            projectile_done = not self.projectile_fired or self.ready_to_switch_player
+            if projectile_done and self.settle_detector.settled:
+                break
+            self.step(1)
+            steps += 1
+        return steps
+
+    def run_until_victory_check(self, max_steps=6000):
+        """持续推进模拟，直到棋子静止后完成一次胜负判断或对战结束
+
+        切换玩家之后棋子静止才会判断胜负，无界面评估和瞬间结算用这个方法跳过等待
+
+        Args:
+            max_steps: 最多执行的物理步数，棋子一直无法稳定时停止
+
+        Returns:
+            int: 实际执行的物理步数
+        """
+        checks = self.victory_checks
+        steps = 0
+        while steps < max_steps and not self.game_over and self.victory_checks == checks:
+            self.step(1)
+            steps += 1
+        return steps
+
+    def physics_step(self):
+        """执行一个固定步长的物理步，并累计模拟时间
+
+        已发射的弹射物速度很快时，这一步会被细分为几个子步（见get_substep_count），
+        总时长不变，规则检查仍然每步执行一次
+        """
+        substeps = self.get_substep_count()
+        with self.profiler.section("physics"):
+            if substeps == 1:
+                self.space.step(self.STEP_DT)
+            else:
+                dt = self.STEP_DT / substeps
+                for _ in range(substeps):
+                    self.space.step(dt)
+        self.extra_substeps += substeps - 1
+        self.step_count += 1
+        self.sim_time_ms += self.STEP_DT * 1000
+
+    def get_substep_count(self):
+        """根据弹射物的速度计算本步需要细分的子步数
+
+        Returns:
+            int: 子步数，弹射物不快时为1
+        """
+        if not self.projectile_fired or self.projectile is None:
+            return 1
+        travel = self.projectile.body.velocity.length * self.STEP_DT
+        # 速度为NaN时由update_projectile_state修复，这里不细分
+        if math.isnan(travel) or travel <= self.SUBSTEP_MAX_TRAVEL:
+            return 1
+        return min(self.MAX_SUBSTEPS, math.ceil(travel / self.SUBSTEP_MAX_TRAVEL))
+
+    def update_rules(self):
+        """物理步之后的规则处理：边界约束、弹射物状态和胜负判断"""
+        current_time = self.clock()
+
+        # 把逃出场地的物体放回场地内
+        with self.profiler.section("bounds"):
+            self.keep_pieces_in_bounds()
+
+        # 处理弹射物的速度
+        with self.profiler.section("projectile"):
+            self.update_projectile_state()
+
+        # 统计棋子的动能，判断是否静止。只在战斗阶段、弹射物不在飞行时需要；
+        # 所有棋子都已休眠时动能为零，不需要逐个读取速度
+        with self.profiler.section("settle"):
+            projectile_flying = self.projectile_fired and not self.ready_to_switch_player
+            if not self.battle_active or projectile_flying:
+                self.settle_detector.reset()
+            else:
+                bodies = () if self.is_all_pieces_stable() else self.iter_piece_bodies()
+                self.settle_detector.update(bodies)
+
+        with self.profiler.section("victory"):
+            self.update_victory(current_time)
+
+    def update_victory(self, current_time):
+        """战斗阶段的胜负判断：堡垒断开的检查，以及棋子稳定一段时间后的胜负判断
+
+        Args:
+            current_time: 当前时间（毫秒）
+        """
+        # 堡垒断开的判定很便宜，每个物理步都检查，断开时立即结束对战
+        if self.battle_active and not self.game_over and self.integrity_baseline is not None:
+            self.check_integrity()
+
+        # 在战斗状态下检查胜负
+        if self.battle_active and not self.game_over and not self.projectile_fired:
+            # 棋子的动能已经连续一段时间低于阈值（见SettleDetector），不再等待固定的时长
+            settled = self.settle_detector.settled
+
+            if settled and not self.pieces_stable:
+                self.pieces_stable = True
+                self.stability_timer = current_time
+                self.log(f"棋子动能已连续 {self.settle_detector.settle_steps} 步低于阈值，判定为静止")
+
+            # 如果棋子又开始运动，重置稳定状态
+            elif not settled and self.pieces_stable:
+                self.pieces_stable = False
+                self.log("检测到棋子开始运动，重置稳定状态")
+
+            # 棋子静止后执行胜负判断，确保不会连续多次调用（至少间隔1秒）
+            if self.pieces_stable and current_time - self.last_victory_check_time >= 1000:
+                self.last_victory_check_time = current_time
+                self.log("棋子已静止，执行胜负判断")
+                self.check_victory()
+
+        # 如果弹射物已发射，则不进行胜负判断
+        elif self.battle_active and self.projectile_fired:
+            # 重置稳定性状态，等待弹射物完成后再重新检查
+            if self.pieces_stable:
+                self.pieces_stable = False
+                self.log("弹射物正在移动，暂停胜负判断")
+
+    def update_projectile_state(self):
+        """检查弹射物的位置和速度，弹射物停止后标记可以切换玩家"""
+        if (self.projectile and hasattr(self.projectile, 'body')
+                and hasattr(self.projectile.body, 'velocity')):
+            try:
+                # 检查位置是否有效
+                if (hasattr(self.projectile.body, 'position') and
+                    (math.isnan(self.projectile.body.position.x) or
+                     math.isnan(self.projectile.body.position.y))):
+                    print("检测到弹射物位置为NaN，尝试修复")
+                    # 尝试修复位置而不是直接重置
+                    self.projectile.body.position = (self.screen_width / 2, self.screen_height / 2)
+                # 检查速度是否有效
+                elif (math.isnan(self.projectile.body.velocity.x) or
+                      math.isnan(self.projectile.body.velocity.y)):
+                    print("检测到弹射物速度为NaN，尝试修复")
+                    # 尝试修复速度而不是直接重置
+                    self.projectile.body.velocity = pymunk.Vec2d(0, 0)
+                # 如果已发射的弹射物速度很小或已经休眠，停止它并标记可以切换玩家
+                # （只停止一次：每步设置速度会唤醒物体，使其和接触的棋子都无法休眠）
+                elif self.projectile_fired and not self.ready_to_switch_player:
+                    body = self.projectile.body
+                    if body.is_sleeping:
+                        self.ready_to_switch_player = True
+                        self.log("弹射物停止运动，可以切换玩家")
+                    elif body.velocity.length < 5 and body.body_type == pymunk.Body.DYNAMIC:
+                        body.velocity = pymunk.Vec2d(0, 0)
+                        body.angular_velocity = 0
+                        self.ready_to_switch_player = True
+                        self.log("弹射物停止运动，可以切换玩家")
+
+            except Exception as e:
+                # 如果处理弹射物速度时出错，打印错误但不重置弹射物
+                print(f"处理弹射物速度时出错: {e}")
+
+    def check_victory(self):
+        """执行一次胜负判断，有结果时设置winner并结束对战
+
+        Returns:
+            int: 获胜玩家编号，尚未分出胜负时返回None
+        """
+        self.victory_checks += 1
+        # 检查双方象棋是否孤立（不与本方其他棋子接触）
+        player1_chinese_chess_isolated = self.player1_model.is_chinese_chess_isolated(
+            self.contact_graph)
+        player2_chinese_chess_isolated = self.player2_model.is_chinese_chess_isolated(
+            self.contact_graph)
+
+        # 根据新规则：当象棋与本方其他棋子都不接触时，对方获胜
+        if player1_chinese_chess_isolated:
+            self.log("玩家1的象棋与其他棋子不接触，玩家2获胜")
+            self.game_over = True
+            self.winner = 2
+        elif player2_chinese_chess_isolated:
+            self.log("玩家2的象棋与其他棋子不接触，玩家1获胜")
+            self.game_over = True
+            self.winner = 1
+        if self.player1_model.is_destroyed(self.destruction_ground_y):
+            self.log("玩家1模型被摧毁，玩家2获胜")
+            self.game_over = True
+            self.winner = 2
+        elif (self.player2_model.is_destroyed(self.destruction_ground_y)
+              and not player2_chinese_chess_isolated):
+            self.log("玩家2模型被摧毁，玩家1获胜")
+            self.game_over = True
+            self.winner = 1
+
+        # 如果有判定结果，重置稳定性检查
+        if self.game_over:
+            self.pieces_stable = False
+        return self.winner
+
+    def check_integrity(self):
+        """检查双方堡垒是否已经断开
+
+        堡垒的完整度低于第一发之前完整度的integrity_threshold倍时判负。
+        以第一发之前为基准，建造时本来就分成几堆的堡垒不会一开始就判负
+
+        Returns:
+            int: 获胜玩家编号，双方堡垒都还完整时返回None
+        """
+        for model, opponent in ((self.player1_model, 2), (self.player2_model, 1)):
+            baseline = self.integrity_baseline.get(model.player_id, 0.0)
+            integrity = self.integrity.get_integrity(model)
+            if baseline > 0 and integrity < baseline * self.integrity_threshold:
+                self.log(f"玩家{model.player_id}的堡垒已断开，完整度: {integrity:.2f}"
+                         f"（开战时: {baseline:.2f}），玩家{opponent}获胜")
+                self.game_over = True
+                self.winner = opponent
+                self.pieces_stable = False
+                return self.winner
+        return None
+
+    def iter_piece_bodies(self):
+        """产生当前在物理空间中的双方棋子的物体"""
+        space = self.space
+        for model in (self.player1_model, self.player2_model):
+            for piece in model.pieces:
+                if piece.body.space is space:
+                    yield piece.body
+
+    def is_all_pieces_stable(self):
+        """检查所有棋子是否处于静止状态
+
+        棋子静止由pymunk的休眠机制判定。上次发现仍然醒着的物体会被记录下来，
+        只要它还醒着就直接返回False，不需要遍历其他棋子；它进入休眠后才重新查找
+        下一个醒着的物体。因此棋子运动期间每步只需检查一个物体
+
+        Returns:
+            bool: 如果所有棋子都已休眠，返回True；否则返回False
+        """
+        # 先检查上次记录的醒着的物体
+        witness = self.awake_witness
+        if witness is not None and witness.space is self.space and not witness.is_sleeping:
+            return False
+
+        # 记录的物体已经休眠，查找下一个醒着的物体
+        self.awake_witness = None
+        for model in (self.player1_model, self.player2_model):
+            for piece in model.pieces:
+                body = piece.body
+                if body.space is self.space and not body.is_sleeping:
+                    self.awake_witness = body
+                    return False
+
+        # 所有棋子都已休眠
+        return True
+
+    def keep_pieces_in_bounds(self):
+        """把逃出场地的棋子和弹射物放回场地内
+
+        场地由地面、墙壁和天花板这些静态形状约束，正常情况下物体不会离开场地，
+        也不需要每步检查。只有穿透边界、进入场地外感应区的物体会被标记
+        （见escape_sensor_begin_handler），这里只处理这些物体
+        """
+        if not self.escaped_bodies:
+            return
+
+        # 放回场地时距边界内表面的距离，大于棋子的最大半宽，放回后不会再碰到感应区
+        inset = ChessPiece.RADIUS * 1.5
+        left_bound = 5 + inset
+        right_bound = self.screen_width - 5 - inset
+        top_bound = 5 + inset
+        bottom_bound = self.ground_y - 5 - inset
+
+        for body in self.escaped_bodies:
+            if body.space is not self.space:
+                continue
+            try:
+                x, y = body.position
+                vx, vy = body.velocity
+                # 放回边界内，并去掉朝向场地外的速度
+                if x < left_bound:
+                    x, vx = left_bound, max(vx, 0)
+                elif x > right_bound:
+                    x, vx = right_bound, min(vx, 0)
+                if y < top_bound:
+                    y, vy = top_bound, max(vy, 0)
+                elif y > bottom_bound:
+                    y, vy = bottom_bound, min(vy, 0)
+                body.position = (x, y)
+                body.velocity = (vx, vy)
+                self.space.reindex_shapes_for_body(body)
+                self.log(f"物体逃出场地，已放回: ({x:.1f}, {y:.1f})")
+            except Exception as e:
+                print(f"放回逃逸物体时出错: {e}")
+        self.escaped_bodies.clear()
+
+    def place_projectile(self, x, y):
+        """在指定位置放置弹射物（铅笔）
+
+        Args:
+            x, y: 放置位置，会被限制在场地范围内
+
+        Returns:
+            Projectile: 新创建的弹射物
+        """
+        # 如果已有弹射物，先从物理空间中移除
+        self.remove_projectile()
+
+        # 确保位置在屏幕范围内
+        x = max(30, min(x, self.screen_width - 30))
+        y = max(30, min(y, self.screen_height - 100))
+
+        # 创建铅笔弹射物
+        self.projectile = Projectile(x, y, self.space)
+        # 设置为已放置但未发射
+        self.projectile_placed = True
+        self.log(f"玩家{self.active_player}添加了铅笔弹射物")
+        return self.projectile
+
+    def fire(self, direction, strength):
+        """发射已放置的弹射物
+
+        Args:
+            direction: 发射方向向量（pymunk.Vec2d或(x, y)元组），不需要归一化
+            strength: 发射力度，会被限制在(0, max_strength]范围内
+
+        Returns:
+            bool: 成功发射返回True，没有可发射的弹射物时返回False
+        """
+        if not self.projectile or self.projectile_fired:
+            print("警告：没有可以发射的弹射物")
+            return False
+
+        direction = pymunk.Vec2d(*direction)
+        # 确保方向向量不为零
+        if abs(direction.x) < 0.001 and abs(direction.y) < 0.001:
+            direction = pymunk.Vec2d(1.0, 0.0)  # 默认向右发射
+
+        # 应用冲量发射弹射物
+        strength = min(strength, self.max_strength)
+        if strength <= 0:
+            strength = 500  # 确保有最小强度
+
+        # 记录发射前的状态，用于重试这一发
+        self.shot_snapshot = self.take_snapshot()
+
+        # 第一发之前记录双方的完整度，作为判断堡垒断开的基准
+        if self.integrity_baseline is None:
+            self.integrity_baseline = {
+                model.player_id: self.integrity.get_integrity(model)
+                for model in (self.player1_model, self.player2_model)
+            }
+            self.log(f"开战时的堡垒完整度: {self.integrity_baseline}")
+
+        # 设置铅笔的角度与运动方向一致
+        self.projectile.body.angle = math.atan2(direction.y, direction.x)
+        self.projectile.apply_impulse(direction, strength)
+        self.log(f"发射弹射物，方向: (dx={direction.x:.2f}, dy={direction.y:.2f})，强度: {strength}")
+
+        # 标记弹射物已发射
+        self.projectile_fired = True
+        self.log(f"玩家{self.active_player}已发射弹射物，等待结束")
+        return True
+
+    def remove_projectile(self):
+        """从物理空间中移除当前弹射物并重置弹射物状态"""
+        if (self.projectile and hasattr(self.projectile, 'shape')
+                and self.projectile.shape in self.space.shapes):
+            self.space.remove(self.projectile.shape)
+        if (self.projectile and hasattr(self.projectile, 'body')
+                and self.projectile.body in self.space.bodies):
+            self.space.remove(self.projectile.body)
+        self.projectile = None
+        self.projectile_placed = False
+
+    def switch_player(self):
+        """本回合结束，切换攻击方并重置弹射物和稳定性状态"""
+        self.active_player = 2 if self.active_player == 1 else 1
+
+        # 移除当前弹射物
+        self.remove_projectile()
+
+        # 重置弹射物相关状态
+        self.projectile_fired = False
+        self.ready_to_switch_player = False
+        # 切换玩家后重置稳定性检查
+        self.pieces_stable = False
+        self.stability_timer = 0
+
+    def take_snapshot(self):
+        """记录当前的物理空间、双方模型的棋子列表、接触图和规则状态
+
+        pymunk缓存的接触（以及其中的接触冲量）无法写回，记录后立即按快照重建一次物理空间，
+        使记录之后的模拟与之后每次restore_snapshot都从完全相同的状态开始
+
+        Returns:
+            dict: 快照，传给restore_snapshot恢复
+        """
+        snapshot = {
+            "space": SpaceSnapshot(self.space),
+            "contacts": self.contact_graph.copy(),
+            "models": [(model, list(model.pieces))
+                       for model in (self.player1_model, self.player2_model)],
+            "state": {name: getattr(self, name) for name in self.SNAPSHOT_STATE},
+            # 距上次胜负判断的时间，恢复后胜负判断的间隔与记录之后相同
+            "victory_check_age": self.clock() - self.last_victory_check_time,
+        }
+        self.restore_space(snapshot)
+        return snapshot
+
+    def restore_space(self, snapshot):
+        """恢复快照中的物理空间和接触图
+
+        所有物体移出原来的空间，按记录的顺序加入用create_space新建的空间。
+        移出物体时pymunk会对正在接触的形状调用separate回调，接触图随之改变，
+        所以在空间恢复之后再写回记录时的接触图
+
+        Args:
+            snapshot: take_snapshot返回的快照
+
+        Returns:
+            None
+        """
+        old_space = self.space
+        for body in old_space.bodies:
+            old_space.remove(body, *body.shapes)
+        self.create_space()
+        snapshot["space"].restore(self.space)
+        self.contact_graph.restore(snapshot["contacts"])
+        self.escaped_bodies.clear()
+        self.integrity.mark_dirty()
+
+    def restore_snapshot(self, snapshot):
+        """恢复take_snapshot记录的状态
+
+        物体和形状不会重新创建，棋子和弹射物仍是记录时的对象。快照之后新加入空间的
+        非静态物体会被移除，之后被移出空间的物体会被放回；休眠状态、接触图和结构完整度
+        与记录时相同，从快照开始的模拟与记录之后的模拟完全一致
+
+        Args:
+            snapshot: take_snapshot返回的快照
+
+        Returns:
+            None
+        """
+        self.restore_space(snapshot)
+
+        # 恢复双方模型的棋子列表，并重建形状索引
+        ((self.player1_model, player1_pieces),
+         (self.player2_model, player2_pieces)) = snapshot["models"]
+        self.player1_model.pieces = list(player1_pieces)
+        self.player2_model.pieces = list(player2_pieces)
+        self.piece_registry.clear()
+        for model in (self.player1_model, self.player2_model):
+            for piece in model.pieces:
+                self.piece_registry.register(piece, model.player_id)
+        self.integrity.mark_dirty()
+
+        for name, value in snapshot["state"].items():
+            setattr(self, name, value)
+
+        # 重新开始稳定性计时
+        self.pieces_stable = False
+        self.stability_timer = 0
+        self.settle_detector.reset()
+        self.awake_witness = None
+        self.last_victory_check_time = self.clock() - snapshot["victory_check_age"]
+
+    def retry_shot(self):
+        """撤销最近一次发射，恢复到发射前的状态，弹射物回到发射位置等待重新发射
+
+        Returns:
+            bool: 成功恢复返回True，还没有发射过时返回False
+        """
+        if self.shot_snapshot is None:
+            print("警告：没有可以重试的射击")
+            return False
+        self.restore_snapshot(self.shot_snapshot)
+        self.log(f"已恢复到玩家{self.active_player}发射前的状态")
+        return True
+
+    def stash_player1_pieces(self):
+        """玩家1建造完成后记录棋子状态，并临时将其移出物理空间，使其不影响玩家2的建造"""
+        # 保存玩家1的模型状态
+        self.player1_model_saved = True
+
+        # 记录玩家1棋子的位置、角度、速度和碰撞属性，战斗开始时原样放回
+        self.player1_snapshot = SpaceSnapshot(
+            self.space, [piece.body for piece in self.player1_model.pieces])
+        self.log(f"已保存玩家1的所有棋子状态，数量: {len(self.player1_snapshot)}")
+
+        # 临时移除玩家1的所有棋子
+        for piece in self.player1_model.pieces:
+            if hasattr(piece, 'shape') and piece.shape in self.space.shapes:
+                self.space.remove(piece.shape)
+            if hasattr(piece, 'body') and piece.body in self.space.bodies:
+                self.space.remove(piece.body)
+
+        self.log(f"已临时移除玩家1的所有棋子，数量: {len(self.player1_model.pieces)}")
+
+    def prepare_battle(self):
+        """准备战斗阶段：恢复玩家1的棋子，设置双方棋子的碰撞属性并重置弹射物状态"""
+        # 把玩家1的棋子放回物理空间（如果之前被移除），棋子仍使用原来的物体和形状
+        if self.player1_model_saved and self.player1_snapshot is not None:
+            self.player1_snapshot.restore(self.space)
+            self.log(f"已恢复玩家1的棋子，数量: {len(self.player1_snapshot)}")
+            self.player1_snapshot = None
+            self.player1_model_saved = False
+        else:
+            self.log("没有暂存的玩家1棋子，直接使用物理空间中的棋子")
+
+        # 重新启用玩家1棋子的碰撞和动态特性
+        for i, piece in enumerate(self.player1_model.pieces):
+            if hasattr(piece, 'shape'):
+                piece.player_id = 1
+
+                # 设置物理属性
+                piece.shape.friction = 0.7
+                piece.shape.elasticity = 0.3
+
+                # 设置碰撞过滤器，使所有棋子都能相互碰撞
+                piece.shape.filter = pymunk.ShapeFilter(
+                    categories=0x1,  # 玩家1类别
+                    mask=0x4 | 0x1 | 0x2 | 0x3 | 0x8  # 地面、玩家1、玩家2、围棋类别和弹射物
+                )
+                # 将玩家1的棋子恢复为动态
+                piece.body.body_type = pymunk.Body.DYNAMIC
+                self.piece_registry.register(piece, 1)
+                self.log(f"玩家1棋子 {i} ({piece.chess_type.name}) 碰撞类型: "
+                         f"{piece.shape.collision_type}, 类别掩码: {piece.shape.filter.mask}")
+
+        # 确保玩家2的棋子正确设置碰撞类型和物理属性
+        self.log(f"玩家2棋子处理开始，总数: {len(self.player2_model.pieces)}")
+        for i, piece in enumerate(self.player2_model.pieces):
+            if hasattr(piece, 'shape'):
+                try:
+                    # 首先确保玩家ID正确设置
+                    piece.player_id = 2
+
+                    # 确保为围棋类型的棋子设置特殊碰撞类型
+                    if piece.chess_type == ChessPieceType.GO_CHESS:
+                        piece.shape.collision_type = 3  # 围棋特殊碰撞类型
+                    else:
+                        # 对于非围棋棋子，明确设置为玩家2的碰撞类型
+                        piece.shape.collision_type = 2  # 玩家2的碰撞类型
+
+                    # 重新设置碰撞过滤器，确保能够与弹射物和其他棋子正确碰撞
+                    piece.shape.filter = pymunk.ShapeFilter(
+                        categories=0x2,  # 玩家2类别
+                        mask=0x4 | 0x1 | 0x2 | 0x3 | 0x8  # 地面、玩家1、玩家2、围棋类别和弹射物
+                    )
+
+                    # 统一设置与玩家1相同的物理属性
+                    piece.shape.friction = 0.7  # 与玩家1相同的摩擦力
+                    piece.shape.elasticity = 0.2  # 与玩家1相同的弹性
+
+                    # 确保玩家2的棋子是动态的
+                    piece.body.body_type = pymunk.Body.DYNAMIC
+                    self.piece_registry.register(piece, 2)
+
+                    self.log(f"[调试] 玩家2棋子 {i}, 类型: {piece.chess_type.name}, "
+                             f"碰撞类型: {piece.shape.collision_type}, 玩家ID: {piece.player_id}")
+                except Exception as e:
+                    print(f"处理玩家2棋子 {i} 时出错: {e}")
+                    import traceback
+                    traceback.print_exc()
+
+        # 清除任何现有的弹射物
+        self.remove_projectile()
+        # 重置弹射物状态
+        self.projectile_fired = False
+        self.ready_to_switch_player = False
+        self.active_player = 1  # 确保玩家1先攻击
+
+        # 重置稳定性检查，进入战斗阶段
+        self.pieces_stable = False
+        self.stability_timer = 0
+        self.settle_detector.reset()
+        self.integrity_baseline = None
+        self.integrity.mark_dirty()
+        self.battle_active = True
+        self.log("战斗阶段准备完毕，等待棋子稳定后开始胜负判定")
+
+    def load_models(self, player1_filename="player1_model", player2_filename="player2_model"):
+        """从.model文件加载双方模型"""
+        self.piece_registry.clear()
+        self.integrity.mark_dirty()
+        self.player1_model = (ChessModel.load(player1_filename, self.space, self.piece_registry)
+                              or ChessModel(1, self.piece_registry))
+        self.player2_model = (ChessModel.load(player2_filename, self.space, self.piece_registry)
+                              or ChessModel(2, self.piece_registry))
@@ -0,0 +1,117 @@
+import pymunk
+
+# 物理空间快照
+class SpaceSnapshot:
+    """物理空间状态快照
+
+    记录物体的位置、角度、速度、角速度、物体类型，以及形状的碰撞过滤器、碰撞类型和
+    是否在空间中。恢复时直接把这些值写回原来的物体和形状，不需要重新创建物理对象，
+    棋子仍然引用原来的body和shape
+
+    不指定物体时为完整快照：恢复时会移除快照之后新加入空间的非静态物体（例如弹射物、
+    新放置的棋子），并让记录时休眠的物体重新休眠。指定物体时为部分快照，只恢复这些物体。
+    pymunk缓存的接触（其中保存着上一步的接触冲量）不会恢复，需要从快照精确重现模拟时，
+    应把物体按记录的顺序加入一个新建的空间（见BattleSimulation.restore_space）
+    """
+    def __init__(self, space, bodies=None):
+        """记录物理空间的当前状态
+
+        Args:
+            space: pymunk物理空间
+            bodies: 要记录的物体，可以包含当前不在空间中的物体；
+                为None时记录空间中所有非静态物体
+
+        Returns:
+            None
+        """
+        self.full = bodies is None
+        if bodies is None:
+            bodies = [body for body in space.bodies if body.body_type != pymunk.Body.STATIC]
+
+        self.records = []
+        for body in bodies:
+            shapes = [(shape, shape.filter, shape.collision_type) for shape in body.shapes]
+            self.records.append((
+                body,
+                body.space is space,  # 记录时是否在空间中
+                body.body_type,
+                body.position,
+                body.angle,
+                body.velocity,
+                body.angular_velocity,
+                shapes,
+            ))
+        # 记录时休眠的物体，每个物体单独休眠（接触没有缓存，无法恢复原来的休眠分组）
+        self.sleeping = [body for body in bodies if body.is_sleeping] if self.full else []
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def clear_bias(bodies):
+        """清零物体的偏置速度
+
+        pymunk求解时为修正穿透给物体累计的偏置速度要到下一步更新位置时才使用并清零，不能直接读写，
+        留在物体上会影响恢复之后的第一步。把不在空间中的物体（不带形状）放入一个空的物理空间，
+        推进一个极短的步长即可清零；之后写回的位置和速度覆盖这一步带来的变化
+
+        Args:
+            bodies: 不在任何空间中的物体
+
+        Returns:
+            None
+        """
+        if not bodies:
+            return
+        space = pymunk.Space()
+        space.add(*bodies)
+        space.step(1e-300)
+        space.remove(*bodies)
+
+    def restore(self, space):
+        """把记录的状态写回物理空间
+
+        Args:
+            space: 记录快照时的pymunk物理空间
+
+        Returns:
+            None
+        """
+        # 完整快照：移除快照之后加入的非静态物体
+        if self.full:
+            recorded = set(record[0] for record in self.records)
+            for body in space.bodies:
+                if body.body_type != pymunk.Body.STATIC and body not in recorded:
+                    space.remove(body, *body.shapes)
+
+        self.clear_bias([record[0] for record in self.records
+                         if record[1] and record[0].space is None])
+
+        for record in self.records:
+            body, in_space, body_type, position, angle, velocity, angular_velocity, shapes = record
+            # 恢复物体是否在空间中
+            if not in_space:
+                if body.space is space:
+                    space.remove(body, *body.shapes)
+                continue
+            # 先写回状态再加入空间：空间索引按加入时的位置和速度放置形状，
+            # 加入后再修改会使索引的结构取决于恢复前的状态
+            if body.body_type != body_type:
+                body.body_type = body_type
+            body.position = position
+            body.angle = angle
+            body.velocity = velocity
+            body.angular_velocity = angular_velocity
+            for shape, shape_filter, collision_type in shapes:
+                shape.filter = shape_filter
+                shape.collision_type = collision_type
+            if body.space is not space:
+                space.add(body, *[shape for shape, _, _ in shapes])
+            else:
+                # 位置直接改变后更新形状在空间索引中的包围盒
+                space.reindex_shapes_for_body(body)
+
+        # 写回速度会唤醒物体，最后再让记录时休眠的物体重新休眠
+        for body in self.sleeping:
+            if body.space is space:
+                body.sleep()
@@ -0,0 +1,329 @@
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+
+# 文件格式（小端）：
+#   文件头   HEADER：魔数、版本、保留、物理步长、位置量化单位、角度量化单位、关键帧间隔
+#   帧       FRAME：物理步序号、记录数、标志，后面跟若干条记录
+#            记录以16位物体编号开头，最高位ABSOLUTE_FLAG表示绝对值记录，次高位REMOVED_FLAG表示物体已移除，
+#            否则为增量记录（x、y、角度相对该物体上一条记录的量化增量）
+#   物体表   BODY：物体编号、类型（棋子类型的值，弹射物为0）、玩家
+#   关键帧索引 KEYFRAME：物理步序号、帧在文件中的偏移
+#   文件尾   TRAILER：物体表偏移和数量、关键帧索引偏移和数量、最后一步的序号、魔数
+HEADER = struct.Struct("<4sHHdffI")
+FRAME = struct.Struct("<IHH")
+BODY_ID = struct.Struct("<H")
+DELTA = struct.Struct("<Hhhh")
+ABSOLUTE = struct.Struct("<Hiii")
+BODY = struct.Struct("<HBB")
+KEYFRAME = struct.Struct("<IQ")
+TRAILER = struct.Struct("<QIQII4s")
+
+MAGIC = b"CFTJ"
+END_MAGIC = b"CFTE"
+VERSION = 1
+ABSOLUTE_FLAG = 0x8000
+REMOVED_FLAG = 0x4000
+ID_MASK = 0x3FFF
+KEYFRAME_FLAG = 0x1
+DELTA_LIMIT = 32767
+PROJECTILE_KIND = 0
+
+# 轨迹写入
+class TrajectoryWriter:
+    """把每个物理步之后双方棋子和弹射物的位置、角度写成紧凑的二进制文件
+
+    位置和角度按固定单位量化为整数，每步只写相对上一条记录的增量（每个物体8字节），
+    休眠和没有移动的物体不写，没有任何变化的步不写。每隔keyframe_interval步写一个关键帧，
+    包含所有物体的绝对值，读取时从最近的关键帧开始解码即可定位到任意一步。
+
+    使用方法：把写入器赋给BattleSimulation.trajectory，模拟器每步之后调用record，结束后调用close
+    """
+    POSITION_QUANTUM = 0.01   # 位置量化单位（像素）
+    ANGLE_QUANTUM = 0.0001    # 角度量化单位（弧度）
+    KEYFRAME_INTERVAL = 120   # 关键帧间隔（物理步），默认每模拟秒一个
+
+    def __init__(self, filename, step_dt=1 / 120, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        Args:
+            filename: 输出文件名
+            step_dt: 物理步长（秒），写入文件头供读取时换算时间
+            keyframe_interval: 关键帧间隔（物理步）
+        """
+        self.filename = filename
+        self.keyframe_interval = keyframe_interval
+        self.file = open(filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, step_dt, self.POSITION_QUANTUM,
+                                    self.ANGLE_QUANTUM, keyframe_interval))
+        self.offset = HEADER.size
+
+        self.ids = {}         # body -> 物体编号
+        self.bodies = []      # (物体编号, 类型, 玩家)
+        self.last = {}        # 物体编号 -> 上一条记录的量化值(x, y, 角度)
+        self.keyframes = []   # (物理步序号, 文件偏移)
+        self.last_keyframe_step = None
+        self.last_step = 0
+
+    def get_id(self, body, kind, player_id):
+        """返回物体编号，第一次出现的物体登记到物体表"""
+        body_id = self.ids.get(body)
+        if body_id is None:
+            body_id = len(self.bodies)
+            if body_id > ID_MASK:
+                raise ValueError(f"轨迹文件最多记录{ID_MASK + 1}个物体")
+            self.ids[body] = body_id
+            self.bodies.append((body_id, kind, player_id))
+        return body_id
+
+    def tracked_bodies(self, simulation):
+        """返回当前在物理空间中的双方棋子和弹射物：[(body, 类型, 玩家)]"""
+        bodies = []
+        for model in (simulation.player1_model, simulation.player2_model):
+            for piece in model.pieces:
+                if piece.body.space is not None:
+                    bodies.append((piece.body, piece.chess_type.value, model.player_id))
+        projectile = simulation.projectile
+        if projectile is not None and projectile.body.space is not None:
+            bodies.append((projectile.body, PROJECTILE_KIND, simulation.active_player))
+        return bodies
+
+    def record(self, simulation):
+        """记录模拟器当前这一步所有物体的位置和角度"""
+        step = simulation.step_count
+        keyframe = (self.last_keyframe_step is None
+                    or step - self.last_keyframe_step >= self.keyframe_interval)
+        position_quantum = self.POSITION_QUANTUM
+        angle_quantum = self.ANGLE_QUANTUM
+        last = self.last
+        records = []
+        present = set()
+
+        for body, kind, player_id in self.tracked_bodies(simulation):
+            body_id = self.get_id(body, kind, player_id)
+            present.add(body_id)
+            previous = last.get(body_id)
+            # 休眠的物体不移动，不需要记录
+            if not keyframe and previous is not None and body.is_sleeping:
+                continue
+            x, y = body.position
+            value = (round(x / position_quantum), round(y / position_quantum),
+                     round(body.angle / angle_quantum))
+            if keyframe or previous is None:
+                records.append(ABSOLUTE.pack(body_id | ABSOLUTE_FLAG, *value))
+            else:
+                dx = value[0] - previous[0]
+                dy = value[1] - previous[1]
+                da = value[2] - previous[2]
+                if not (dx or dy or da):
+                    continue
+                if max(abs(dx), abs(dy), abs(da)) > DELTA_LIMIT:
+                    records.append(ABSOLUTE.pack(body_id | ABSOLUTE_FLAG, *value))
+                else:
+                    records.append(DELTA.pack(body_id, dx, dy, da))
+            last[body_id] = value
+
+        # 移出物理空间的物体（被撤销的棋子、切换玩家时移除的弹射物）
+        for body_id in [body_id for body_id in last if body_id not in present]:
+            del last[body_id]
+            if not keyframe:
+                records.append(BODY_ID.pack(body_id | REMOVED_FLAG))
+
+        self.last_step = step
+        if not records and not keyframe:
+            return
+        if keyframe:
+            self.keyframes.append((step, self.offset))
+            self.last_keyframe_step = step
+        data = FRAME.pack(step, len(records), KEYFRAME_FLAG if keyframe else 0) + b"".join(records)
+        self.file.write(data)
+        self.offset += len(data)
+
+    def close(self):
+        """写入物体表、关键帧索引和文件尾，关闭文件"""
+        if self.file is None:
+            return
+        body_offset = self.offset
+        self.file.write(b"".join(BODY.pack(*body) for body in self.bodies))
+        keyframe_offset = body_offset + len(self.bodies) * BODY.size
+        self.file.write(b"".join(KEYFRAME.pack(*keyframe) for keyframe in self.keyframes))
+        self.file.write(TRAILER.pack(body_offset, len(self.bodies), keyframe_offset,
+                                     len(self.keyframes), self.last_step, END_MAGIC))
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+# 轨迹读取
+class TrajectoryReader:
+    """通过内存映射读取TrajectoryWriter写出的文件，可以定位到任意一步"""
+    def __init__(self, filename):
+        """
+        Raises:
+            ValueError: 文件不是轨迹文件或没有正常关闭（缺少文件尾）
+        """
+        self.file = open(filename, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{filename} 是空文件")
+        try:
+            self.read_index(filename)
+        except Exception:
+            self.close()
+            raise
+
+    def read_index(self, filename):
+        """读取文件头、物体表和关键帧索引"""
+        data = self.data
+        if len(data) < HEADER.size + TRAILER.size:
+            raise ValueError(f"{filename} 不是完整的轨迹文件")
+        (magic, version, _, self.step_dt, self.position_quantum,
+         self.angle_quantum, self.keyframe_interval) = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} 不是版本{VERSION}的轨迹文件")
+        (body_offset, body_count, keyframe_offset, keyframe_count,
+         self.last_step, end_magic) = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        if end_magic != END_MAGIC:
+            raise ValueError(f"{filename} 缺少文件尾，可能没有正常关闭")
+
+        self.frames_end = body_offset
+        # 物体编号 -> (类型, 玩家)
+        self.bodies = {body_id: (kind, player_id)
+                       for body_id, kind, player_id in BODY.iter_unpack(
+                           data[body_offset:body_offset + body_count * BODY.size])}
+        keyframes = list(KEYFRAME.iter_unpack(
+            data[keyframe_offset:keyframe_offset + keyframe_count * KEYFRAME.size]))
+        self.keyframe_steps = [step for step, _ in keyframes]
+        self.keyframe_offsets = [offset for _, offset in keyframes]
+        self.first_step = self.keyframe_steps[0] if keyframes else 0
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def decode_frames(self, offset, state):
+        """从offset开始逐帧解码，更新state并产生(物理步序号, 文件偏移)
+
+        Args:
+            offset: 帧在文件中的偏移，必须是关键帧
+            state: 物体编号 -> 量化值[x, y, 角度]，会被原地更新
+        """
+        data = self.data
+        end = self.frames_end
+        while offset < end:
+            step, count, flags = FRAME.unpack_from(data, offset)
+            offset += FRAME.size
+            if flags & KEYFRAME_FLAG:
+                state.clear()
+            for _ in range(count):
+                (raw_id,) = BODY_ID.unpack_from(data, offset)
+                if raw_id & ABSOLUTE_FLAG:
+                    _, x, y, angle = ABSOLUTE.unpack_from(data, offset)
+                    state[raw_id & ID_MASK] = [x, y, angle]
+                    offset += ABSOLUTE.size
+                elif raw_id & REMOVED_FLAG:
+                    state.pop(raw_id & ID_MASK, None)
+                    offset += BODY_ID.size
+                else:
+                    _, dx, dy, da = DELTA.unpack_from(data, offset)
+                    value = state[raw_id]
+                    value[0] += dx
+                    value[1] += dy
+                    value[2] += da
+                    offset += DELTA.size
+            yield step, offset
+
+    def to_transforms(self, state):
+        """把量化值换算为 物体编号 -> (x, y, 角度)"""
+        position_quantum = self.position_quantum
+        angle_quantum = self.angle_quantum
+        return {body_id: (x * position_quantum, y * position_quantum, angle * angle_quantum)
+                for body_id, (x, y, angle) in state.items()}
+
+    def seek(self, step):
+        """返回第step步之后所有物体的位置和角度
+
+        从不晚于step的最近关键帧开始解码，最多解码一个关键帧间隔的帧
+
+        Returns:
+            dict: 物体编号 -> (x, y, 角度)，step早于第一帧时返回空字典
+        """
+        index = bisect.bisect_right(self.keyframe_steps, step) - 1
+        if index < 0:
+            return {}
+        state = {}
+        for frame_step, next_offset in self.decode_frames(self.keyframe_offsets[index], state):
+            # 没有变化的步不写帧，解码到下一帧之前停止
+            if (next_offset >= self.frames_end
+                    or FRAME.unpack_from(self.data, next_offset)[0] > step):
+                break
+        return self.to_transforms(state)
+
+    def iter_steps(self, start=None):
+        """从start步（默认为第一步）开始逐帧产生(物理步序号, 所有物体的位置和角度)
+
+        没有变化的步不会产生
+        """
+        start = self.first_step if start is None else start
+        index = max(0, bisect.bisect_right(self.keyframe_steps, start) - 1)
+        if not self.keyframe_offsets:
+            return
+        state = {}
+        for step, _ in self.decode_frames(self.keyframe_offsets[index], state):
+            if step >= start:
+                yield step, self.to_transforms(state)
+
+def main():
+    parser = argparse.ArgumentParser(description="查看轨迹文件")
+    parser.add_argument("trajectory", help="TrajectoryWriter写出的轨迹文件")
+    parser.add_argument("--step", type=int, default=None, help="输出这一步之后所有物体的位置和角度")
+    args = parser.parse_args()
+
+    try:
+        reader = TrajectoryReader(args.trajectory)
+    except Exception as e:
+        print(f"读取轨迹文件失败: {e}")
+        return 1
+
+    with reader:
+        if args.step is None:
+            steps = reader.last_step - reader.first_step + 1
+            size = os.path.getsize(args.trajectory)
+            result = {
+                "first_step": reader.first_step,
+                "last_step": reader.last_step,
+                "sim_seconds": round(steps * reader.step_dt, 3),
+                "bodies": len(reader.bodies),
+                "keyframes": len(reader.keyframe_steps),
+                "bytes": size,
+                "bytes_per_step": round(size / steps, 1),
+            }
+        else:
+            result = {
+                str(body_id): {"kind": reader.bodies[body_id][0],
+                               "player": reader.bodies[body_id][1],
+                               "x": round(x, 2), "y": round(y, 2), "angle": round(angle, 4)}
+                for body_id, (x, y, angle) in sorted(reader.seek(args.step).items())
+            }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())